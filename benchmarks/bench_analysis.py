@@ -0,0 +1,41 @@
+"""Tokens/second of the Analyzer pipeline against VectorSearch.concordance.
+
+    python -m benchmarks.bench_analysis --docs 5000
+"""
+import argparse
+import time
+
+from src.algorithms.porter_stemming import CachedStemmer
+from src.search.analysis import Analyzer
+from src.search.vector_search import VectorSearch
+from .corpus import synthetic_documents
+
+
+def run(num_docs):
+    documents = list(synthetic_documents(num_docs).values())
+    tokens = sum(content.count(' ') + 1 for content in documents)
+    vector_search = VectorSearch()
+
+    for label, make_stemmer in (('no stemming', lambda: None), ('stemming', CachedStemmer)):
+        # Each side gets its own cold stem cache
+        stemmer = make_stemmer()
+        start = time.perf_counter()
+        for content in documents:
+            vector_search.concordance(content.lower(), stemmer is not None, stemmer)
+        split_time = time.perf_counter() - start
+
+        analyzer = Analyzer(make_stemmer())
+        start = time.perf_counter()
+        for content in documents:
+            analyzer.concordance(content)
+        analyzer_time = time.perf_counter() - start
+
+        print(f"{label:>12}: concordance {tokens / split_time:,.0f} tokens/s, "
+              f"Analyzer {tokens / analyzer_time:,.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.docs)
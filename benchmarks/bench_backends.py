@@ -0,0 +1,38 @@
+"""Compare the dict and sparse scoring backends on one synthetic corpus.
+
+    python -m benchmarks.bench_backends --docs 20000 --queries 500
+"""
+import argparse
+import time
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def run(num_docs, num_queries, max_results):
+    documents = synthetic_documents(num_docs)
+    queries = synthetic_queries(num_queries)
+
+    for backend in SearchEngine.BACKENDS:
+        engine = SearchEngine(use_stemming=False, backend=backend)
+        start = time.perf_counter()
+        engine.add_documents(documents)
+        index_time = time.perf_counter() - start
+
+        engine.search(queries[0], max_results)  # builds the matrix for the sparse backend
+        start = time.perf_counter()
+        for query in queries:
+            engine.search(query, max_results)
+        query_time = time.perf_counter() - start
+
+        print(f"{backend:>6}: indexed {num_docs} docs in {index_time:.2f}s, "
+              f"{num_queries / query_time:.1f} queries/s ({1000 * query_time / num_queries:.2f} ms/query)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--max-results', type=int, default=10)
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.max_results)
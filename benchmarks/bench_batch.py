@@ -0,0 +1,41 @@
+"""Report queries/second for search() in a loop against search_batch().
+
+    python -m benchmarks.bench_batch --docs 20000 --queries 1000
+"""
+import argparse
+import time
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def run(num_docs, num_queries, max_results, backends):
+    documents = synthetic_documents(num_docs)
+    queries = synthetic_queries(num_queries)
+
+    for backend in backends:
+        engine = SearchEngine(use_stemming=True, backend=backend)
+        engine.add_documents(documents)
+        engine.search(queries[0], max_results)
+
+        start = time.perf_counter()
+        for query in queries:
+            engine.search(query, max_results)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine.search_batch(queries, max_results)
+        batched = time.perf_counter() - start
+
+        print(f"{backend:>6}: search() {num_queries / serial:.1f} q/s, "
+              f"search_batch() {num_queries / batched:.1f} q/s on a {num_queries}-query batch")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--max-results', type=int, default=10)
+    parser.add_argument('--backend', action='append', choices=SearchEngine.BACKENDS)
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.max_results, args.backend or SearchEngine.BACKENDS)
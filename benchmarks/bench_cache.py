@@ -0,0 +1,48 @@
+"""Hit rate and queries/second of the result cache on a skewed query stream.
+
+Queries are drawn from a pool of distinct query strings with Zipf-like
+popularity, so a few hundred strings make up most of the traffic.
+
+    python -m benchmarks.bench_cache --docs 20000 --queries 20000
+"""
+import argparse
+import random
+import time
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def run(num_docs, num_queries, distinct, max_results, cache_sizes):
+    documents = synthetic_documents(num_docs)
+    pool = synthetic_queries(distinct)
+    rnd = random.Random(2)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    stream = rnd.choices(pool, weights, k=num_queries)
+
+    for cache_size in cache_sizes:
+        engine = SearchEngine(result_cache_size=cache_size)
+        engine.add_documents(documents)
+
+        start = time.perf_counter()
+        for query in stream:
+            engine.search(query, max_results)
+        elapsed = time.perf_counter() - start
+
+        line = f"cache {cache_size:>6}: {num_queries / elapsed:,.0f} q/s"
+        if engine.result_cache is not None:
+            stats = engine.result_cache.stats
+            line += (f", hit rate {stats['hits'] / num_queries:.1%}, "
+                     f"{stats['evictions']} evictions, {stats['bytes'] / 1024:.0f} KiB")
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=5000)
+    parser.add_argument('--max-results', type=int, default=10)
+    parser.add_argument('--cache-size', type=int, action='append')
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.distinct, args.max_results, args.cache_size or [0, 100, 1000])
@@ -0,0 +1,76 @@
+"""Documents/second of the sequential and concurrent crawl paths, fully offline.
+
+The sequential baseline is the fetch loop CommonCrawlClient used before it
+fetched concurrently: one CDX search per domain, then one document at a
+time, each request a plain requests.get on a fresh connection. The
+concurrent client is also timed with a single worker, which shows how much
+of the speedup is the pooled session rather than the concurrency.
+
+    python -m benchmarks.bench_crawl --domains 4 --docs-per-domain 25 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import requests
+
+from src.crawl import CommonCrawlClient
+from src.crawl.warc import iter_decompressed, iter_responses
+from .crawl_server import CrawlServer
+
+
+def sequential_documents(client, domains, max_docs_per_domain):
+    """The documents of domains, fetched one request at a time without a session"""
+    documents = []
+    for domain in domains:
+        params = {'url': f"{domain}/*", 'output': 'json', 'limit': max_docs_per_domain * 2}
+        response = requests.get(client.cdx_api_url, params=params, timeout=10)
+        response.raise_for_status()
+        results = [json.loads(line) for line in response.text.strip().split('\n') if line]
+        processed = 0
+        for result in results:
+            if processed >= max_docs_per_domain:
+                break
+            offset, length = int(result['offset']), int(result['length'])
+            headers = {'Range': f'bytes={offset}-{offset + length - 1}'}
+            with requests.get(f"{client.data_url}/{result['filename']}", headers=headers, timeout=15,
+                              stream=True) as response:
+                response.raise_for_status()
+                chunks = iter_decompressed(response.iter_content(chunk_size=client.chunk_size))
+                html_content = next((body for _, _, body in iter_responses(chunks)), None)
+            text_content = client.extract_text_from_html(html_content)
+            if text_content and len(text_content) > client.min_content_length:
+                documents.append((result['url'], text_content))
+                processed += 1
+    return documents
+
+
+def run(num_domains, docs_per_domain, latency, concurrency):
+    domains = [f"site{i}.example" for i in range(num_domains)]
+    with CrawlServer(domains, docs_per_domain * 2, latency) as server:
+        paths = [('sequential', None), ('1 worker', 1), (f'{concurrency} workers', concurrency)]
+        for label, workers in paths:
+            client = CommonCrawlClient(
+                cdx_api_url=f"{server.url}/cdx", data_url=f"{server.url}/data", concurrency=workers or 1
+            )
+            start = time.perf_counter()
+            if workers is None:
+                documents = sequential_documents(client, domains, docs_per_domain)
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    documents = list(client.iter_documents(domains, max_docs_per_domain=docs_per_domain))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>12}: {len(documents)} documents in {elapsed:.2f}s, "
+                  f"{len(documents) / elapsed:.1f} docs/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--domains', type=int, default=4)
+    parser.add_argument('--docs-per-domain', type=int, default=25)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    run(args.domains, args.docs_per_domain, args.latency, args.concurrency)
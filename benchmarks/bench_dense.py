@@ -0,0 +1,73 @@
+"""Dense retrieval: recall@k of IVF-PQ against exact nearest neighbours, and queries per second.
+
+Exact neighbours are found by scoring the query embedding against every
+document embedding. Each probes/rerank setting is compared with them, and
+term, dense and hybrid searches are timed through the engine.
+
+    python -m benchmarks.bench_dense --docs 20000 --queries 200 --probes 1 --probes 8 --probes 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def queries_per_second(search, queries):
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def run(num_docs, num_queries, k, dimensions, subvectors, probe_settings, rerank_settings):
+    documents = synthetic_documents(num_docs)
+    queries = synthetic_queries(num_queries)
+    engine = SearchEngine()
+    engine.add_documents(documents)
+
+    start = time.perf_counter()
+    dense = engine.build_dense_index(dimensions, subvectors=subvectors, rerank=max(rerank_settings))
+    print(f"dense index built in {time.perf_counter() - start:.1f}s, {dense.ann.lists} lists")
+
+    doc_ids = list(engine.index)
+    vectors = dense.encoder.transform([engine.index[doc_id] for doc_id in doc_ids])
+    concordances = [engine.analyze(query) for query in queries]
+
+    def exact(concordance):
+        query = dense.encoder.transform([concordance])[0]
+        return np.argpartition(-(vectors @ query), k - 1)[:k]
+
+    print(f"{'exact':>18}: {queries_per_second(exact, concordances):8.1f} q/s")
+    truth = [{doc_ids[number] for number in exact(concordance)} for concordance in concordances]
+    for probes in probe_settings:
+        for rerank in rerank_settings:
+            found = [{doc_id for _, doc_id in dense.search(concordance, k, probes, rerank)}
+                     for concordance in concordances]
+            recall = sum(len(hits & expected) for hits, expected in zip(found, truth)) / (k * len(queries))
+            qps = queries_per_second(lambda concordance: dense.search(concordance, k, probes, rerank), concordances)
+            print(f"probes {probes:>3} rerank {rerank:>4}: {qps:8.1f} q/s, recall@{k} {recall:.3f}")
+
+    workloads = [
+        ('term search', lambda query: engine.search(query, k)),
+        ('dense search', lambda query: engine.dense_search(query, k)),
+        ('hybrid search', lambda query: engine.hybrid_search(query, k)),
+    ]
+    for label, search in workloads:
+        print(f"{label:>18}: {queries_per_second(search, queries):8.1f} q/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--dimensions', type=int, default=128)
+    parser.add_argument('--subvectors', type=int, default=16)
+    parser.add_argument('--probes', type=int, action='append', help='by default 1, 4, 8, 16 and 32')
+    parser.add_argument('--rerank', type=int, action='append', help='by default 0 and 64')
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.k, args.dimensions, args.subvectors,
+        args.probes or [1, 4, 8, 16, 32], args.rerank or [0, 64])
@@ -0,0 +1,51 @@
+"""Resident memory and top-k search speed with documents in RAM or on disk.
+
+    python -m benchmarks.bench_docstore --docs 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from src.search import SearchEngine
+from src.search.docstore import DocumentStore
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def run(num_docs, num_queries, max_results):
+    documents = synthetic_documents(num_docs)
+    queries = synthetic_queries(num_queries)
+    directory = tempfile.mkdtemp()
+
+    for label, compress in (('dict', None), ('store', False), ('store+zlib', True)):
+        store = None
+        tracemalloc.start()
+        if compress is not None:
+            store = DocumentStore(os.path.join(directory, label), compress=compress)
+        engine = SearchEngine(compress_postings=True, document_store=store)
+        for doc_id, content in documents.items():
+            # Copied so the text counts against this engine when it keeps it
+            engine.add_document(doc_id, content.encode().decode())
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for query in queries:
+            engine.search(query, max_results)
+        elapsed = time.perf_counter() - start
+
+        line = f"{label:>10}: {used / 2 ** 20:.1f} MiB resident, {num_queries / elapsed:.0f} q/s"
+        if store is not None:
+            store.close()
+            line += f", {os.path.getsize(store.path) / 2 ** 20:.1f} MiB on disk"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--max-results', type=int, default=10)
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.max_results)
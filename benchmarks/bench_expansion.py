@@ -0,0 +1,77 @@
+"""Latency of prefix, wildcard and fuzzy expansion over a large term dictionary.
+
+Queries are drawn from the dictionary itself: prefixes, patterns with a ?
+and a trailing *, and words with one or two characters dropped.
+
+    python -m benchmarks.bench_expansion --terms 2000000 --queries 200
+"""
+import argparse
+import random
+import statistics
+import time
+from itertools import islice
+
+from src.search.terms import TermDictionary
+from .corpus import make_vocabulary
+
+
+def typo(rnd, word, edits):
+    for _ in range(edits):
+        if len(word) > 1:
+            position = rnd.randrange(len(word))
+            word = word[:position] + word[position + 1:]
+    return word
+
+
+def timed(run, queries):
+    """(p50 ms, p99 ms, mean expansions) of run over queries"""
+    latencies = []
+    expansions = 0
+    for query in queries:
+        start = time.perf_counter()
+        expansions += sum(1 for _ in run(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return statistics.median(latencies), p99, expansions / len(queries)
+
+
+def run(num_terms, num_queries, max_expansions, prefix_lengths):
+    start = time.perf_counter()
+    terms = sorted(set(make_vocabulary(num_terms)))
+    print(f"{len(terms):,} terms generated in {time.perf_counter() - start:.1f}s")
+    dictionary = TermDictionary(terms)
+    rnd = random.Random(4)
+    words = [rnd.choice(terms) for _ in range(num_queries)]
+
+    def capped(matches):
+        return islice(matches, max_expansions)
+
+    workloads = [
+        ('prefix, 4 chars', [word[:4] for word in words], lambda prefix: capped(dictionary.prefix(prefix))),
+        ('prefix, 2 chars', [word[:2] for word in words], lambda prefix: capped(dictionary.prefix(prefix))),
+        ('wildcard', [word[:2] + '?' + word[3:5] + '*' for word in words],
+         lambda pattern: capped(dictionary.wildcard(pattern))),
+    ]
+    for edits in (1, 2):
+        misspelt = [typo(rnd, word, edits) for word in words]
+        for prefix_length in prefix_lengths:
+            workloads.append((
+                f'fuzzy ~{edits}, prefix {prefix_length}', misspelt,
+                lambda word, edits=edits, prefix_length=prefix_length: dictionary.fuzzy(word, edits, prefix_length)
+            ))
+
+    for label, queries, expand in workloads:
+        p50, p99, expansions = timed(expand, queries)
+        print(f"{label:>22}: p50 {p50:7.3f} ms, p99 {p99:8.3f} ms, {expansions:.1f} terms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--terms', type=int, default=2000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--max-expansions', type=int, default=50)
+    parser.add_argument('--prefix-length', type=int, action='append',
+                        help='fuzzy prefix lengths to compare, by default 0, 1 and 2')
+    args = parser.parse_args()
+    run(args.terms, args.queries, args.max_expansions, args.prefix_length or [0, 1, 2])
@@ -0,0 +1,110 @@
+"""MB/s of HTML to text extraction: HTMLTextExtractor against StreamingTextExtractor.
+
+Pages are read from a directory of saved .html files, or generated with the
+inline scripts, styles, SVG icons and navigation that real pages carry:
+
+    python -m benchmarks.bench_html --pages saved_pages/
+    python -m benchmarks.bench_html --generate 200 --max-length 2000
+"""
+import argparse
+import pathlib
+import random
+import re
+import time
+
+from src.crawl.common_crawl import HTMLTextExtractor
+from src.crawl.html_text import StreamingTextExtractor, extract_text
+from .corpus import make_vocabulary
+
+
+def generate_pages(num_pages, seed=0):
+    """Synthetic pages of roughly 30-150 KB, a third of it visible text"""
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(5000, seed)
+
+    def words(low, high):
+        return ' '.join(rnd.choices(vocabulary, k=rnd.randint(low, high)))
+
+    icon = ('<svg viewBox="0 0 24 24" width="16"><g><path d="M12 2L2 7l10 5 10-5-10-5z"/>'
+            '<text x="1">{}</text></g></svg>')
+    pages = []
+    for i in range(num_pages):
+        parts = [
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+            f'<title>{words(3, 8)}</title>',
+            '<link rel="stylesheet" href="/main.css">',
+            '<style>' + ' '.join(f'.c{j} {{ margin: {j}px; color: #{j:06x}; }}' for j in range(rnd.randint(50, 300)))
+            + '</style>',
+            '<script>' + ''.join(
+                f'var v{j} = "<div class=\\"x\\">" + {j} * 2; if (v{j} < {j}) {{ track("{words(1, 3)}"); }}\n'
+                for j in range(rnd.randint(50, 300))
+            ) + '</script></head><body>',
+            '<nav><ul>' + ''.join(
+                f'<li><a href="/{j}" title="{words(1, 2)}">{icon.format(j)}{words(1, 2)}</a></li>' for j in range(30)
+            ) + '</ul></nav><main><article>',
+        ]
+        for _ in range(rnd.randint(10, 60)):
+            parts.append(
+                f'<p class="para">{words(20, 80)} <a href="/x?a=1&amp;b=2">{words(1, 3)}</a> '
+                f'<b>{words(1, 4)}</b>&nbsp;&mdash; {words(10, 40)}</p>\n'
+            )
+        parts.append(f'<noscript><img src="/pixel.gif">{words(5, 10)}</noscript>')
+        parts.append(f'<template id="row"><tr><td>{words(2, 5)}</td></tr></template>')
+        parts.append(f'</article></main><footer>{words(10, 30)}</footer></body></html>')
+        pages.append(''.join(parts).encode('utf-8'))
+    return pages
+
+
+def load_pages(directory):
+    paths = sorted(path for path in pathlib.Path(directory).rglob('*') if path.suffix.lower() in ('.html', '.htm'))
+    return [path.read_bytes() for path in paths]
+
+
+def html_parser_text(page):
+    """The previous extract_text_from_html pipeline"""
+    parser = HTMLTextExtractor()
+    parser.feed(page.decode('utf-8', errors='ignore'))
+    return re.sub(r'\s+', ' ', parser.get_text()).strip()
+
+
+def streamed_text(page, chunk_size, max_length=None):
+    extractor = StreamingTextExtractor(max_length)
+    for start in range(0, len(page), chunk_size):
+        extractor.feed(page[start:start + chunk_size])
+        if extractor.done:
+            break
+    extractor.close()
+    return extractor.get_text()
+
+
+def run(pages, chunk_size, max_length, repeat):
+    total = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {total / 2 ** 20:.1f} MB")
+    extractors = [
+        ('HTMLTextExtractor', html_parser_text),
+        ('extract_text', lambda page: extract_text(page)),
+        (f'streamed {chunk_size // 1024} KB chunks', lambda page: streamed_text(page, chunk_size)),
+    ]
+    if max_length:
+        extractors.append((f'streamed, max {max_length} chars', lambda page: streamed_text(page, chunk_size, max_length)))
+
+    for label, extract in extractors:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            characters = sum(len(extract(page)) for page in pages)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:>28}: {total / 2 ** 20 / best:6.1f} MB/s, {characters:,} characters of text")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', help='directory of saved .html pages')
+    parser.add_argument('--generate', type=int, default=100, help='synthetic pages to use without --pages')
+    parser.add_argument('--chunk-size', type=int, default=1 << 14)
+    parser.add_argument('--max-length', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    pages = load_pages(args.pages) if args.pages else generate_pages(args.generate)
+    run(pages, args.chunk_size, args.max_length, args.repeat)
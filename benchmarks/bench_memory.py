@@ -0,0 +1,38 @@
+"""Bytes per posting of the dict and compressed index representations.
+
+    python -m benchmarks.bench_memory --docs 20000
+"""
+import argparse
+import tracemalloc
+
+from src.search.postings import CompressedIndex, InvertedIndex
+from src.search.vector_search import VectorSearch
+from .corpus import synthetic_documents
+
+
+def run(num_docs):
+    vector_search = VectorSearch()
+    concordances = {
+        doc_id: vector_search.concordance(content)
+        for doc_id, content in synthetic_documents(num_docs).items()
+    }
+    postings = sum(len(concordance) for concordance in concordances.values())
+
+    for representation in (InvertedIndex, CompressedIndex):
+        tracemalloc.start()
+        index = representation()
+        for doc_id, concordance in concordances.items():
+            # Copied inside the measurement since the dict index keeps the
+            # concordances as its forward index.
+            index.add(doc_id, dict(concordance), vector_search.magnitude(concordance))
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{representation.__name__:>16}: {used / 2 ** 20:.1f} MiB, "
+              f"{used / postings:.1f} bytes per posting ({postings} postings)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.docs)
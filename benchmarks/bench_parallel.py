@@ -0,0 +1,30 @@
+"""Indexing throughput of add_documents with an increasing number of worker processes.
+
+    python -m benchmarks.bench_parallel --docs 50000 --workers 1 2 4 8
+"""
+import argparse
+import time
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents
+
+
+def run(num_docs, worker_counts, chunk_size):
+    documents = synthetic_documents(num_docs)
+    baseline = None
+    for workers in worker_counts:
+        engine = SearchEngine(use_stemming=True)
+        start = time.perf_counter()
+        engine.add_documents(documents, workers=workers, chunk_size=chunk_size)
+        rate = num_docs / (time.perf_counter() - start)
+        baseline = baseline or rate
+        print(f"{workers:>2} workers: {rate:,.0f} docs/s ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+    run(args.docs, args.workers, args.chunk_size)
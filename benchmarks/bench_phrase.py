@@ -0,0 +1,76 @@
+"""Cost of positional postings: indexing time, position memory, and phrase and NEAR query speed.
+
+Phrases are word pairs taken from the documents, so every query has matches.
+Position memory is what tracemalloc sees the engine with positions allocate
+beyond the one without them.
+
+    python -m benchmarks.bench_phrase --docs 20000 --queries 500
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents
+
+
+def phrase_pairs(documents, num_queries, seed=3):
+    rnd = random.Random(seed)
+    texts = list(documents.values())
+    pairs = []
+    while len(pairs) < num_queries:
+        words = rnd.choice(texts).split()
+        if len(words) > 1:
+            start = rnd.randrange(len(words) - 1)
+            pairs.append((words[start], words[start + 1]))
+    return pairs
+
+
+def queries_per_second(engine, queries, max_results):
+    start = time.perf_counter()
+    for query in queries:
+        engine.search(query, max_results)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def run(num_docs, num_queries, max_results):
+    documents = synthetic_documents(num_docs)
+    pairs = phrase_pairs(documents, num_queries)
+
+    engines, memory = {}, {}
+    for positions in (False, True):
+        engine = SearchEngine(positions=positions)
+        start = time.perf_counter()
+        engine.add_documents(documents)
+        elapsed = time.perf_counter() - start
+        engines[positions] = engine
+        print(f"positions={positions!s:>5}: indexed {num_docs / elapsed:.0f} docs/s")
+        # Timed without tracing, which slows allocation down
+        tracemalloc.start()
+        traced = SearchEngine(positions=positions)
+        traced.add_documents(documents)
+        memory[positions], _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+
+    position_bytes = memory[True] - memory[False]
+    postings = sum(len(postings) for postings in engines[True].postings.values())
+    print(f"{position_bytes / 2 ** 20:.1f} MB of positions, {position_bytes / postings:.2f} bytes per posting")
+
+    workloads = [
+        ('two words', [f'{first} {second}' for first, second in pairs]),
+        ('"phrase"', [f'"{first} {second}"' for first, second in pairs]),
+        ('NEAR/3', [f'{first} NEAR/3 {second}' for first, second in pairs]),
+    ]
+    for label, queries in workloads:
+        print(f"{label:>10}: {queries_per_second(engines[True], queries, max_results):.1f} q/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--max-results', type=int, default=10)
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.max_results)
@@ -0,0 +1,39 @@
+"""Top-k speed and MaxScore pruning of each scoring model.
+
+    python -m benchmarks.bench_scoring --docs 20000 --queries 500
+"""
+import argparse
+import time
+
+from src.search import SearchEngine
+from src.search.scoring import SCORING_MODELS
+from .corpus import synthetic_documents, synthetic_queries
+
+
+def run(num_docs, num_queries, max_results):
+    documents = synthetic_documents(num_docs)
+    queries = synthetic_queries(num_queries)
+
+    for name in SCORING_MODELS:
+        engine = SearchEngine(scoring=name)
+        engine.add_documents(documents)
+
+        start = time.perf_counter()
+        for query in queries:
+            engine.search(query, max_results)
+        elapsed = time.perf_counter() - start
+
+        stats = engine.search_stats
+        print(f"{name:>6}: {num_queries / elapsed:.1f} q/s, "
+              f"{stats['documents_scored'] / num_queries:.0f} documents scored, "
+              f"{stats['documents_pruned'] / num_queries:.0f} pruned and "
+              f"{stats['postings_skipped'] / num_queries:.0f} postings skipped per query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--max-results', type=int, default=10)
+    args = parser.parse_args()
+    run(args.docs, args.queries, args.max_results)
@@ -0,0 +1,38 @@
+"""Stemming throughput and indexing time with and without the stem cache.
+
+    python -m benchmarks.bench_stemming --docs 5000
+"""
+import argparse
+import time
+
+from src.algorithms.porter_stemming import CachedStemmer, PorterStemmer
+from src.search import SearchEngine
+from .corpus import synthetic_documents
+
+
+def run(num_docs, cache_size):
+    documents = synthetic_documents(num_docs)
+    tokens = [token for content in documents.values() for token in content.split(' ')]
+
+    for label, stemmer in (('uncached', PorterStemmer()), ('cached', CachedStemmer(maxsize=cache_size))):
+        start = time.perf_counter()
+        for token in tokens:
+            stemmer.stem(token)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>8}: {len(tokens) / elapsed:,.0f} stems/s")
+        if isinstance(stemmer, CachedStemmer):
+            print(f"          cache stats {stemmer.stats}")
+
+    for label, size in (('uncached', 0), ('cached', cache_size)):
+        engine = SearchEngine(use_stemming=True, stem_cache_size=size)
+        start = time.perf_counter()
+        engine.add_documents(documents)
+        print(f"{label:>8}: indexed {num_docs} docs in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--cache-size', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.docs, args.cache_size)
@@ -0,0 +1,74 @@
+"""Check that a DocumentStore reads back every document whatever compress setting reopens it.
+
+Stores are written with compress on, off, and partly with each, then
+reopened with both settings; every document must read back as written,
+including after a crash cut the last block short.
+
+    python -m benchmarks.check_docstore
+
+Failures are printed and the exit status is 1.
+"""
+import os
+import sys
+import tempfile
+
+from src.search.docstore import DocumentStore
+
+# compress setting of each writing session
+SESSIONS = ((True,), (False,), (True, False), (False, True))
+
+
+def write(path, sessions, num_docs):
+    expected = {}
+    for session, compress in enumerate(sessions):
+        with DocumentStore(path, compress=compress, block_size=256) as store:
+            for doc_id in range(num_docs):
+                # Later sessions replace half the documents and add new ones
+                if session and doc_id % 2:
+                    continue
+                key = doc_id + session * num_docs // 2
+                store[key] = expected[key] = {'content': f'document {key} ' * (doc_id % 7 + 1), 'session': session}
+    return expected
+
+
+def check(store, expected, label):
+    failures = 0
+    if len(store) != len(expected):
+        print(f"{label}: {len(store)} documents, expected {len(expected)}")
+        failures += 1
+    for doc_id, doc_data in expected.items():
+        try:
+            found = store[doc_id]
+        except Exception as e:
+            found = e
+        if found != doc_data:
+            if not failures:
+                print(f"{label}: document {doc_id} read back as {found!r}")
+            failures += 1
+    return failures
+
+
+def run(num_docs):
+    failures = 0
+    directory = tempfile.mkdtemp()
+    for number, sessions in enumerate(SESSIONS):
+        path = os.path.join(directory, f'store{number}')
+        expected = write(path, sessions, num_docs)
+        for compress in (False, True):
+            label = f"written with compress={list(sessions)}, reopened with compress={compress}"
+            with DocumentStore(path, compress=compress) as store:
+                failures += check(store, expected, label)
+                # Appending with the other setting leaves the file mixed
+                store['appended'] = expected['appended'] = {'compress': compress}
+                failures += check(store, expected, label + ' after appending')
+        # A crash in the middle of writing a block
+        with open(path, 'ab') as f:
+            f.write(b'\1\0\1\0\0\xff\0\0\0partial')
+        with DocumentStore(path, compress=not sessions[-1]) as store:
+            failures += check(store, expected, f"written with compress={list(sessions)}, truncated tail")
+    print(f"{len(SESSIONS)} stores checked, {failures} failures")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(200) else 1)
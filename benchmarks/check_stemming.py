@@ -0,0 +1,64 @@
+"""Check that PorterStemmer stems exactly like the implementation it replaced.
+
+Every word goes through stem() and each single step of both stemmers. The
+words are pseudo-words from the benchmark vocabulary, each also with every
+suffix the algorithm handles, plus the lines of --words files:
+
+    python -m benchmarks.check_stemming --vocabulary 20000 --words /usr/share/dict/words
+
+Mismatches are printed and the exit status is 1.
+"""
+import argparse
+import sys
+
+from src.algorithms.porter_stemming import PorterStemmer
+from .corpus import make_vocabulary
+from .porter_reference import ReferencePorterStemmer
+
+SUFFIXES = (
+    's', 'ss', 'sses', 'ies', 'ed', 'eed', 'ing', 'at', 'bl', 'iz', 'y', 'e', 'l', 'll',
+    'ational', 'tional', 'enci', 'anci', 'izer', 'abli', 'alli', 'entli', 'eli', 'ousli', 'ization', 'ation',
+    'ator', 'alism', 'iveness', 'fulness', 'ousness', 'aliti', 'iviti', 'biliti',
+    'icate', 'ative', 'alize', 'iciti', 'ical', 'ful', 'ness',
+    'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ion', 'sion', 'tion', 'ou',
+    'ism', 'ate', 'iti', 'ous', 'ive', 'ize', 'ingly', 'edness', 'ements', 'ations', 'fulnesses'
+)
+
+STEPS = ('step1a', 'step1b', 'step1b_post_process', 'step1c', 'step2', 'step3', 'step4', 'step5a', 'step5b')
+
+
+def words(vocabulary_size, paths):
+    for word in make_vocabulary(vocabulary_size):
+        yield word
+        for suffix in SUFFIXES:
+            yield word + suffix
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                word = line.strip().lower()
+                if word.isalpha():
+                    yield word
+
+
+def run(vocabulary_size, paths, max_reported=20):
+    stemmer, reference = PorterStemmer(), ReferencePorterStemmer()
+    checked = mismatches = 0
+    for word in words(vocabulary_size, paths):
+        checked += 1
+        for name in ('stem',) + STEPS:
+            expected = getattr(reference, name)(word)
+            got = getattr(stemmer, name)(word)
+            if got != expected:
+                mismatches += 1
+                if mismatches <= max_reported:
+                    print(f"{name}({word!r}): {got!r}, expected {expected!r}")
+    print(f"{checked:,} words checked, {mismatches} mismatches")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--words', action='append', default=[], help='file with one word per line')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.vocabulary, args.words) else 1)
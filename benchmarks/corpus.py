@@ -0,0 +1,57 @@
+import random
+
+
+def make_vocabulary(size, seed=0):
+    """Deterministic pseudo-words, most frequent first"""
+    rnd = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary, seen = [], set()
+    while len(vocabulary) < size:
+        word = ''.join(rnd.choice(letters) for _ in range(rnd.randint(3, 10)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+
+def synthetic_documents(num_docs, vocabulary_size=20000, doc_length=(20, 200), seed=0):
+    """Zipf-distributed documents keyed by integer id"""
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    return {
+        doc_id: ' '.join(rnd.choices(vocabulary, weights, k=rnd.randint(*doc_length)))
+        for doc_id in range(num_docs)
+    }
+
+
+def synthetic_queries(num_queries, vocabulary_size=20000, terms=(1, 4), seed=1):
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, 0)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    return [' '.join(rnd.choices(vocabulary, weights, k=rnd.randint(*terms))) for _ in range(num_queries)]
+
+
+def query_workloads(num_queries, vocabulary_size=20000, seed=2):
+    """Named query lists drawn from the synthetic_documents vocabulary.
+
+    short and long queries follow the corpus term distribution; rare queries
+    use words from the least frequent half of the vocabulary, and common
+    queries the hundred most frequent words, which have the longest
+    posting lists.
+    """
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, 0)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    rare = vocabulary[vocabulary_size // 2:]
+    common = vocabulary[:100]
+
+    def queries(draw, terms):
+        return [' '.join(draw(rnd.randint(*terms))) for _ in range(num_queries)]
+
+    return {
+        'short': queries(lambda k: rnd.choices(vocabulary, weights, k=k), (1, 2)),
+        'long': queries(lambda k: rnd.choices(vocabulary, weights, k=k), (8, 16)),
+        'rare': queries(lambda k: rnd.choices(rare, k=k), (1, 3)),
+        'common': queries(lambda k: rnd.choices(common, k=k), (2, 4))
+    }
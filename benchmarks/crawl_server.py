@@ -0,0 +1,89 @@
+"""Local stand-in for the Common Crawl CDX index and WARC range requests.
+
+Serves a generated archive of one gzip member per response record, adding
+an artificial latency to every range request.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .corpus import make_vocabulary
+
+
+def build_archive(domains, docs_per_domain, seed=0):
+    """Return (archive bytes, {domain: [cdx entries]})"""
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(5000, seed)
+    archive = bytearray()
+    entries = {}
+    for domain in domains:
+        for i in range(docs_per_domain):
+            url = f"https://{domain}/page/{i}"
+            text = ' '.join(rnd.choices(vocabulary, k=rnd.randint(50, 400)))
+            body = f"<html><body><h1>{domain} {i}</h1><p>{text}</p></body></html>".encode()
+            http = b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n\r\n" + body
+            record = (
+                f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: {url}\r\n"
+                f"WARC-Date: 2025-07-01T00:00:00Z\r\nContent-Length: {len(http)}\r\n\r\n"
+            ).encode() + http + b"\r\n\r\n"
+            member = gzip.compress(record)
+            entries.setdefault(domain, []).append({
+                'url': url,
+                'timestamp': '20250701000000',
+                'filename': 'crawl.warc.gz',
+                'offset': str(len(archive)),
+                'length': str(len(member))
+            })
+            archive += member
+    return bytes(archive), entries
+
+
+class CrawlServer:
+    def __init__(self, domains, docs_per_domain, latency=0.05):
+        self.archive, self.entries = build_archive(domains, docs_per_domain)
+        self.latency = latency
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send headers and body in one write, without waiting on Nagle's
+            # algorithm, or keep-alive connections stall on delayed ACKs
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == '/cdx':
+                    domain = parse_qs(parsed.query)['url'][0].rstrip('/*')
+                    limit = int(parse_qs(parsed.query).get('limit', ['10'])[0])
+                    lines = [json.dumps(entry) for entry in server.entries.get(domain, [])[:limit]]
+                    self._send(200, '\n'.join(lines).encode())
+                else:
+                    time.sleep(server.latency)
+                    start, _, end = self.headers['Range'].split('=')[1].partition('-')
+                    self._send(206, server.archive[int(start):int(end) + 1])
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,147 @@
+"""Load generator for the search server: QPS and latency at rising concurrency.
+
+Each concurrency level runs that many keep-alive clients for --duration
+seconds, each sending the next query as soon as the previous one answers.
+Queries are drawn with Zipf-like popularity, so identical queries are often
+in flight together and get coalesced.
+
+Without --url a synthetic corpus is indexed, saved to a temporary segment and
+served by a server subprocess:
+
+    python -m benchmarks.loadgen --docs 20000 --concurrency 1 --concurrency 16
+    python -m benchmarks.loadgen --url http://127.0.0.1:8080
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote_plus, urlsplit
+
+from src.search import SearchEngine
+from .corpus import synthetic_documents, synthetic_queries
+
+
+async def request(reader, writer, target):
+    """(status, JSON body) of a GET over an open keep-alive connection"""
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: loadgen\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, stream, deadline, latencies, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            target = f"/search?q={quote_plus(next(stream))}&max_results=10"
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, target)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            elif status == 503:
+                counts['rejected'] += 1
+            else:
+                counts['errors'] += 1
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def measure(host, port, pool, concurrency, duration, seed):
+    rnd = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(pool) + 1)]
+    stream = iter(lambda: rnd.choices(pool, weights)[0], None)
+    latencies = []
+    counts = {'rejected': 0, 'errors': 0}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        client(host, port, stream, deadline, latencies, counts) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if latencies:
+        print(f"concurrency {concurrency:>4}: {len(latencies) / elapsed:8,.0f} q/s, "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.2f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms, "
+              f"{counts['rejected']} rejected, {counts['errors']} errors")
+    else:
+        print(f"concurrency {concurrency:>4}: no successful queries, "
+              f"{counts['rejected']} rejected, {counts['errors']} errors")
+
+
+async def drive(host, port, pool, levels, duration):
+    for seed, concurrency in enumerate(levels):
+        await measure(host, port, pool, concurrency, duration, seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await request(reader, writer, '/stats')
+    writer.close()
+    print('server stats:', stats)
+
+
+def start_server(segment_path, options):
+    """Launch a server subprocess on a free port and return (process, host, port)"""
+    command = [sys.executable, '-m', 'src.search.server', '--segment', segment_path, '--port', '0'] + options
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving on'):
+        process.kill()
+        raise RuntimeError(f'Server failed to start: {line!r}')
+    url = urlsplit(line.split()[-1])
+    return process, url.hostname, url.port
+
+
+def run(url, num_docs, distinct, levels, duration, server_options):
+    pool = synthetic_queries(distinct)
+    if url is not None:
+        url = urlsplit(url)
+        asyncio.run(drive(url.hostname, url.port, pool, levels, duration))
+        return
+
+    engine = SearchEngine()
+    engine.add_documents(synthetic_documents(num_docs))
+    with tempfile.TemporaryDirectory() as tmp:
+        segment_path = os.path.join(tmp, 'index.seg')
+        engine.save(segment_path)
+        del engine
+        process, host, port = start_server(segment_path, server_options)
+        try:
+            asyncio.run(drive(host, port, pool, levels, duration))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='server to load; by default one is started on a synthetic corpus')
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=5000, help='distinct query strings')
+    parser.add_argument('--concurrency', type=int, action='append')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per concurrency level')
+    parser.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--queue-size', type=int, default=1024)
+    args = parser.parse_args()
+    server_options = [
+        '--executor', args.executor, '--workers', str(args.workers),
+        '--max-batch', str(args.max_batch), '--queue-size', str(args.queue_size)
+    ]
+    run(args.url, args.docs, args.distinct, args.concurrency or [1, 4, 16, 64], args.duration, server_options)
@@ -0,0 +1,187 @@
+"""Benchmark suite: indexing, search latency, stemming and memory, as JSON.
+
+Each corpus size is measured in a fresh worker process, so timings and peak
+memory of one size are not affected by the previous ones:
+
+    index       add_documents time and documents/second
+    memory      peak resident memory, and how much indexing added to it
+    search      latency percentiles and queries/second of the short, long,
+                rare and common query workloads
+    stemming    PorterStemmer.stem and CachedStemmer.stem throughput
+
+Corpora and queries are generated from fixed seeds, so runs are comparable.
+Save a baseline, then compare later runs against it; metrics that got worse
+by more than --tolerance are reported and the exit status is 1:
+
+    python -m benchmarks.suite --docs 10000 --docs 100000 --output baseline.json
+    python -m benchmarks.suite --docs 10000 --docs 100000 --compare baseline.json
+    python -m benchmarks.suite --results new.json --compare baseline.json
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.algorithms.porter_stemming import CachedStemmer, PorterStemmer
+from src.search import SearchEngine
+from .corpus import query_workloads, synthetic_documents
+
+# Metric name suffixes and whether a larger value is better
+DIRECTIONS = (
+    ('_per_second', True),
+    ('_seconds', False),
+    ('_ms', False),
+    ('_mib', False)
+)
+
+
+def _peak_mib():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def percentile(values, fraction):
+    """Value below which fraction of the sorted values fall"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure_corpus(num_docs, num_queries, max_results, engine_options):
+    """Index and search metrics of one corpus size"""
+    documents = synthetic_documents(num_docs)
+    workloads = query_workloads(num_queries)
+    before = _peak_mib()
+
+    engine = SearchEngine(**engine_options)
+    start = time.perf_counter()
+    engine.add_documents(documents)
+    index_time = time.perf_counter() - start
+    metrics = {
+        'index_seconds': index_time,
+        'index_docs_per_second': num_docs / index_time,
+        'peak_mib': _peak_mib(),
+        'index_growth_mib': _peak_mib() - before
+    }
+
+    engine.search(workloads['short'][0], max_results)  # builds the matrix for the sparse backend
+    for name, queries in workloads.items():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            engine.search(query, max_results)
+            latencies.append(time.perf_counter() - start)
+        total = sum(latencies)
+        latencies.sort()
+        metrics[f'search_{name}_p50_ms'] = percentile(latencies, 0.5) * 1000
+        metrics[f'search_{name}_p90_ms'] = percentile(latencies, 0.9) * 1000
+        metrics[f'search_{name}_p99_ms'] = percentile(latencies, 0.99) * 1000
+        metrics[f'search_{name}_queries_per_second'] = len(queries) / total
+    return metrics
+
+
+def measure_stemming(num_docs, cache_size):
+    """stem() throughput over the tokens of a synthetic corpus"""
+    tokens = [token for content in synthetic_documents(num_docs).values() for token in content.split(' ')]
+    metrics = {}
+    for label, stemmer in (('uncached', PorterStemmer()), ('cached', CachedStemmer(maxsize=cache_size))):
+        start = time.perf_counter()
+        for token in tokens:
+            stemmer.stem(token)
+        metrics[f'stem_{label}_per_second'] = len(tokens) / (time.perf_counter() - start)
+    return metrics
+
+
+def _in_fresh_process(function, *args):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(function, *args).result()
+
+
+def run(sizes, num_queries, max_results, stem_docs, engine_options):
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'options': {'queries': num_queries, 'max_results': max_results, 'engine': engine_options},
+        'metrics': {}
+    }
+    for num_docs in sizes:
+        metrics = _in_fresh_process(measure_corpus, num_docs, num_queries, max_results, engine_options)
+        for name, value in metrics.items():
+            results['metrics'][f'docs_{num_docs}.{name}'] = value
+        print(f"{num_docs:>8} docs: indexed in {metrics['index_seconds']:.2f}s, "
+              f"peak {metrics['peak_mib']:.0f} MiB, short p50 {metrics['search_short_p50_ms']:.2f} ms, "
+              f"common p99 {metrics['search_common_p99_ms']:.2f} ms", file=sys.stderr)
+    for name, value in _in_fresh_process(measure_stemming, stem_docs, 100000).items():
+        results['metrics'][f'stemming.{name}'] = value
+    return results
+
+
+def higher_is_better(name):
+    for suffix, higher in DIRECTIONS:
+        if name.endswith(suffix):
+            return higher
+    raise ValueError(f'No direction known for metric {name!r}')
+
+
+def compare(baseline, current, tolerance):
+    """(name, baseline, current, relative change) of metrics worse than tolerance"""
+    regressions = []
+    for name, old in baseline['metrics'].items():
+        new = current['metrics'].get(name)
+        if new is None or old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better(name) else change
+        if worse > tolerance:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, action='append', help='corpus size, may be repeated')
+    parser.add_argument('--queries', type=int, default=200, help='queries per workload')
+    parser.add_argument('--max-results', type=int, default=10)
+    parser.add_argument('--stem-docs', type=int, default=10000, help='corpus size for stemming throughput')
+    parser.add_argument('--backend', default='dict')
+    parser.add_argument('--scoring', default='cosine')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--results', help='compare these saved results instead of running the suite')
+    parser.add_argument('--compare', help='baseline JSON results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown allowed before a metric counts as a regression')
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        engine_options = {'backend': args.backend, 'scoring': args.scoring}
+        results = run(args.docs or [10000], args.queries, args.max_results, args.stem_docs, engine_options)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+        missing = sorted(set(baseline['metrics']) - set(results['metrics']))
+        if missing:
+            print(f"{len(missing)} baseline metrics were not measured: {', '.join(missing)}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} in {len(baseline['metrics'])} metrics")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,188 +1,233 @@
-import re
+from functools import lru_cache
+
+
+def _suffix_table(suffixes):
+    """Group (suffix, replacement) pairs by last letter, keeping their order"""
+    table = {}
+    for suffix, replacement in suffixes:
+        table.setdefault(suffix[-1], []).append((suffix, replacement))
+    return table
+
+
+STEP2_SUFFIXES = _suffix_table([
+    ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'),
+    ('izer', 'ize'), ('abli', 'able'), ('alli', 'al'), ('entli', 'ent'),
+    ('eli', 'e'), ('ousli', 'ous'), ('ization', 'ize'), ('ation', 'ate'),
+    ('ator', 'ate'), ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'),
+    ('ousness', 'ous'), ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')
+])
+
+STEP3_SUFFIXES = _suffix_table([
+    ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'),
+    ('ical', 'ic'), ('ful', ''), ('ness', '')
+])
+
+STEP4_SUFFIXES = _suffix_table([
+    (suffix, '') for suffix in (
+        'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement',
+        'ment', 'ent', 'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize'
+    )
+])
 
 
 class PorterStemmer:
+    """Porter stemmer working on a word and its consonant/vowel pattern.
+
+    The pattern holds 'c' or 'v' for every letter of the word. It is computed
+    once per word and, since a letter's class only depends on the letters
+    before it, truncating the word truncates the pattern and appending a
+    suffix only classifies the new letters.
+    """
+
     def __init__(self):
         self.vowels = "aeiou"
-    
+
+    def pattern(self, word, prefix=''):
+        """Consonant/vowel pattern of word, reusing the pattern of a prefix"""
+        pattern = [prefix]
+        previous = prefix[-1] if prefix else 'v'  # a leading 'y' is a consonant
+        for char in word[len(prefix):]:
+            if char in self.vowels:
+                previous = 'v'
+            elif char == 'y':
+                previous = 'c' if previous == 'v' else 'v'
+            else:
+                previous = 'c'
+            pattern.append(previous)
+        return ''.join(pattern)
+
     def is_consonant(self, word, i):
-        if word[i] in self.vowels:
-            return False
-        if word[i] == 'y':
-            return i == 0 or not self.is_consonant(word, i - 1)
-        return True
-    
+        return self.pattern(word[:i + 1])[i] == 'c'
+
     def measure(self, word):
-        n = len(word)
-        if n == 0:
-            return 0
-        
-        m = 0
-        i = 0
-        
-        while i < n and self.is_consonant(word, i):
-            i += 1
-        
-        while i < n:
-            while i < n and not self.is_consonant(word, i):
-                i += 1
-            if i >= n:
-                break
-            m += 1
-            while i < n and self.is_consonant(word, i):
-                i += 1
-        
-        return m
-    
+        return self.pattern(word).count('vc')
+
     def contains_vowel(self, word):
-        for i in range(len(word)):
-            if not self.is_consonant(word, i):
-                return True
-        return False
-    
+        return 'v' in self.pattern(word)
+
     def ends_with_double_consonant(self, word):
-        if len(word) < 2:
-            return False
-        return (word[-1] == word[-2] and 
-                self.is_consonant(word, len(word) - 1))
-    
+        return self._double_consonant(word, self.pattern(word))
+
     def cvc_pattern(self, word):
-        if len(word) < 3:
-            return False
-        return (self.is_consonant(word, len(word) - 3) and
-                not self.is_consonant(word, len(word) - 2) and
-                self.is_consonant(word, len(word) - 1) and
-                word[-1] not in "wxy")
-    
-    def step1a(self, word):
-        if word.endswith('sses'):
-            return word[:-2]
-        elif word.endswith('ies'):
-            return word[:-2]
+        return self._cvc(word, self.pattern(word))
+
+    def _double_consonant(self, word, pattern):
+        return len(word) >= 2 and word[-1] == word[-2] and pattern[-1] == 'c'
+
+    def _cvc(self, word, pattern):
+        return pattern[-3:] == 'cvc' and word[-1] not in "wxy"
+
+    def _step1a(self, word, pattern):
+        if word.endswith('sses') or word.endswith('ies'):
+            return word[:-2], pattern[:-2]
         elif word.endswith('ss'):
-            return word
+            return word, pattern
         elif word.endswith('s') and len(word) > 1:
-            return word[:-1]
-        return word
-    
-    def step1b(self, word):
+            return word[:-1], pattern[:-1]
+        return word, pattern
+
+    def _step1b(self, word, pattern):
         if word.endswith('eed'):
-            stem = word[:-3]
-            if self.measure(stem) > 0:
-                return stem + 'ee'
-            return word
-        
-        if word.endswith('ed'):
-            stem = word[:-2]
-            if self.contains_vowel(stem):
-                word = stem
-                return self.step1b_post_process(word)
-        
-        if word.endswith('ing'):
-            stem = word[:-3]
-            if self.contains_vowel(stem):
-                word = stem
-                return self.step1b_post_process(word)
-        
-        return word
-    
-    def step1b_post_process(self, word):
+            if pattern[:-3].count('vc') > 0:
+                return word[:-1], pattern[:-1]
+            return word, pattern
+
+        if word.endswith('ed') and 'v' in pattern[:-2]:
+            return self._step1b_post_process(word[:-2], pattern[:-2])
+
+        if word.endswith('ing') and 'v' in pattern[:-3]:
+            return self._step1b_post_process(word[:-3], pattern[:-3])
+
+        return word, pattern
+
+    def _step1b_post_process(self, word, pattern):
         if word.endswith('at') or word.endswith('bl') or word.endswith('iz'):
-            return word + 'e'
-        elif self.ends_with_double_consonant(word) and word[-1] not in 'lsz':
-            return word[:-1]
-        elif self.measure(word) == 1 and self.cvc_pattern(word):
-            return word + 'e'
-        return word
-    
-    def step1c(self, word):
-        if word.endswith('y') and self.contains_vowel(word[:-1]):
-            return word[:-1] + 'i'
-        return word
-    
-    def step2(self, word):
-        suffixes = {
-            'ational': 'ate', 'tional': 'tion', 'enci': 'ence', 'anci': 'ance',
-            'izer': 'ize', 'abli': 'able', 'alli': 'al', 'entli': 'ent',
-            'eli': 'e', 'ousli': 'ous', 'ization': 'ize', 'ation': 'ate',
-            'ator': 'ate', 'alism': 'al', 'iveness': 'ive', 'fulness': 'ful',
-            'ousness': 'ous', 'aliti': 'al', 'iviti': 'ive', 'biliti': 'ble'
-        }
-        
-        for suffix, replacement in suffixes.items():
+            return word + 'e', pattern + 'v'
+        elif self._double_consonant(word, pattern) and word[-1] not in 'lsz':
+            return word[:-1], pattern[:-1]
+        elif pattern.count('vc') == 1 and self._cvc(word, pattern):
+            return word + 'e', pattern + 'v'
+        return word, pattern
+
+    def _step1c(self, word, pattern):
+        if word.endswith('y') and 'v' in pattern[:-1]:
+            return word[:-1] + 'i', pattern[:-1] + 'v'
+        return word, pattern
+
+    def _replace_suffix(self, word, pattern, table):
+        for suffix, replacement in table.get(word[-1:], ()):
             if word.endswith(suffix):
-                stem = word[:-len(suffix)]
-                if self.measure(stem) > 0:
-                    return stem + replacement
+                stem_length = len(word) - len(suffix)
+                stem_pattern = pattern[:stem_length]
+                if stem_pattern.count('vc') > 0:
+                    word = word[:stem_length] + replacement
+                    return word, self.pattern(word, stem_pattern)
                 break
-        
-        return word
-    
-    def step3(self, word):
-        suffixes = {
-            'icate': 'ic', 'ative': '', 'alize': 'al', 'iciti': 'ic',
-            'ical': 'ic', 'ful': '', 'ness': ''
-        }
-        
-        for suffix, replacement in suffixes.items():
+        return word, pattern
+
+    def _step2(self, word, pattern):
+        return self._replace_suffix(word, pattern, STEP2_SUFFIXES)
+
+    def _step3(self, word, pattern):
+        return self._replace_suffix(word, pattern, STEP3_SUFFIXES)
+
+    def _step4(self, word, pattern):
+        for suffix, _ in STEP4_SUFFIXES.get(word[-1:], ()):
             if word.endswith(suffix):
-                stem = word[:-len(suffix)]
-                if self.measure(stem) > 0:
-                    return stem + replacement
+                stem_length = len(word) - len(suffix)
+                if pattern[:stem_length].count('vc') > 1:
+                    if suffix != 'ion' or word[stem_length - 1] in 'st':
+                        return word[:stem_length], pattern[:stem_length]
                 break
-        
-        return word
-    
+
+        return word, pattern
+
+    def _step5a(self, word, pattern):
+        if word.endswith('e'):
+            m = pattern[:-1].count('vc')
+            if m > 1 or (m == 1 and not self._cvc(word[:-1], pattern[:-1])):
+                return word[:-1], pattern[:-1]
+        return word, pattern
+
+    def _step5b(self, word, pattern):
+        if (word.endswith('l') and
+            self._double_consonant(word, pattern) and
+            pattern.count('vc') > 1):
+            return word[:-1], pattern[:-1]
+        return word, pattern
+
+    # The single steps on a word alone, computing its pattern for each call
+    def step1a(self, word):
+        return self._step1a(word, self.pattern(word))[0]
+
+    def step1b(self, word):
+        return self._step1b(word, self.pattern(word))[0]
+
+    def step1b_post_process(self, word):
+        return self._step1b_post_process(word, self.pattern(word))[0]
+
+    def step1c(self, word):
+        return self._step1c(word, self.pattern(word))[0]
+
+    def step2(self, word):
+        return self._step2(word, self.pattern(word))[0]
+
+    def step3(self, word):
+        return self._step3(word, self.pattern(word))[0]
+
     def step4(self, word):
-        suffixes = [
-            'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement',
-            'ment', 'ent', 'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize'
-        ]
-        
-        for suffix in suffixes:
-            if word.endswith(suffix):
-                stem = word[:-len(suffix)]
-                if self.measure(stem) > 1:
-                    if suffix == 'ion' and stem and stem[-1] in 'st':
-                        return stem
-                    elif suffix != 'ion':
-                        return stem
-                break
-        
-        return word
-    
+        return self._step4(word, self.pattern(word))[0]
+
     def step5a(self, word):
-        if word.endswith('e'):
-            stem = word[:-1]
-            m = self.measure(stem)
-            if m > 1 or (m == 1 and not self.cvc_pattern(stem)):
-                return stem
-        return word
-    
+        return self._step5a(word, self.pattern(word))[0]
+
     def step5b(self, word):
-        if (self.measure(word) > 1 and 
-            self.ends_with_double_consonant(word) and 
-            word.endswith('l')):
-            return word[:-1]
-        return word
-    
+        return self._step5b(word, self.pattern(word))[0]
+
     def stem(self, word):
         if len(word) <= 2:
             return word
-        
+
         word = word.lower()
-        
-        word = self.step1a(word)
-        word = self.step1b(word)
-        word = self.step1c(word)
-        word = self.step2(word)
-        word = self.step3(word)
-        word = self.step4(word)
-        word = self.step5a(word)
-        word = self.step5b(word)
-        
+        pattern = self.pattern(word)
+
+        word, pattern = self._step1a(word, pattern)
+        word, pattern = self._step1b(word, pattern)
+        word, pattern = self._step1c(word, pattern)
+        word, pattern = self._step2(word, pattern)
+        word, pattern = self._step3(word, pattern)
+        word, pattern = self._step4(word, pattern)
+        word, pattern = self._step5a(word, pattern)
+        word, pattern = self._step5b(word, pattern)
+
         return word
 
 
 class PorterStemmingAlgorithm(PorterStemmer):
-    pass
\ No newline at end of file
+    pass
+
+
+class CachedStemmer:
+    """Bounded LRU cache in front of a stemmer.
+
+    Token streams repeat the same words constantly, so most calls to `stem`
+    are answered from the cache. A maxsize of None makes the cache unbounded.
+    """
+
+    def __init__(self, stemmer=None, maxsize=100000):
+        self.stemmer = stemmer if stemmer is not None else PorterStemmer()
+        self.maxsize = maxsize
+        self.stem = lru_cache(maxsize=maxsize)(self.stemmer.stem)
+
+    def cache_clear(self):
+        self.stem.cache_clear()
+
+    @property
+    def stats(self):
+        info = self.stem.cache_info()
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize
+        }
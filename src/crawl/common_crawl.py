@@ -1,8 +1,16 @@
 import requests
 import json
-import gzip
-import re
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+from .html_text import extract_text
+from .warc import iter_decompressed, iter_file_chunks, iter_responses
 
 
 class HTMLTextExtractor(HTMLParser):
@@ -35,11 +43,66 @@ class HTMLTextExtractor(HTMLParser):
         return ' '.join(self.text_content)
 
 
+class HostRateLimiter:
+    """Spaces out requests to each host to at most `rate` per second"""
+    
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+    
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class CommonCrawlClient:
-    def __init__(self):
+    min_content_length = 100
+    chunk_size = 1 << 16
+    retry_statuses = (429, 500, 502, 503, 504)
+    
+    def __init__(self, cdx_api_url=None, data_url="https://data.commoncrawl.org",
+                 concurrency=8, requests_per_host=None, retries=3, backoff=0.5, timeout=15,
+                 max_text_length=None):
         self.base_url = "https://index.commoncrawl.org"
-        self.cdx_api_url = f"{self.base_url}/CC-MAIN-2025-30-index"
+        self.cdx_api_url = cdx_api_url or f"{self.base_url}/CC-MAIN-2025-30-index"
+        self.data_url = data_url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Characters of text kept per page; the rest of the page isn't parsed
+        self.max_text_length = max_text_length
+        self.rate_limiter = HostRateLimiter(requests_per_host)
         
+        # One pooled session shared by every fetch thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _get(self, url, **kwargs):
+        """GET through the shared session, retrying transient failures with exponential backoff"""
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(host)
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+                if response.status_code not in self.retry_statuses or attempt == self.retries:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+    
     def search_urls(self, domain, limit=10):
         """Search for URLs from a specific domain in Common Crawl"""
         params = {
@@ -49,8 +112,7 @@ class CommonCrawlClient:
         }
         
         try:
-            response = requests.get(self.cdx_api_url, params=params, timeout=10)
-            response.raise_for_status()
+            response = self._get(self.cdx_api_url, params=params)
             
             results = []
             for line in response.text.strip().split('\n'):
@@ -77,101 +139,133 @@ class CommonCrawlClient:
         if not all([filename, offset, length]):
             return None
             
-        archive_url = f"https://data.commoncrawl.org/{filename}"
+        archive_url = f"{self.data_url}/{filename}"
         headers = {
             'Range': f'bytes={offset}-{int(offset) + int(length) - 1}'
         }
         
         try:
-            response = requests.get(archive_url, headers=headers, timeout=15)
-            response.raise_for_status()
-            
-            # Decompress gzip content
-            content = gzip.decompress(response.content).decode('utf-8', errors='ignore')
-            
-            # Extract HTML content from WARC record
-            html_content = self._extract_html_from_warc(content)
-            return html_content
+            with self._get(archive_url, headers=headers, stream=True) as response:
+                # Decompress and parse the WARC record as the bytes arrive
+                chunks = iter_decompressed(response.iter_content(chunk_size=self.chunk_size))
+                for _, _, html_content in iter_responses(chunks):
+                    return html_content
+            return None
             
-        except (requests.RequestException, gzip.BadGzipFile, UnicodeDecodeError) as e:
+        except (requests.RequestException, zlib.error, ValueError) as e:
             print(f"Error fetching document: {e}")
             return None
     
-    def _extract_html_from_warc(self, warc_content):
-        """Extract HTML content from WARC record"""
-        # Find the HTML content after HTTP headers
-        html_start = warc_content.find('\r\n\r\n')
-        if html_start == -1:
-            html_start = warc_content.find('\n\n')
-        
-        if html_start != -1:
-            # Skip the HTTP headers
-            html_content = warc_content[html_start + 4:]
-            # Remove any remaining HTTP headers that might be present
-            html_start = html_content.find('<')
-            if html_start != -1:
-                return html_content[html_start:]
-        
-        return warc_content
-    
     def extract_text_from_html(self, html_content):
-        """Extract clean text from HTML content"""
+        """Extract clean text from HTML content, given as str or UTF-8 bytes"""
         if not html_content:
             return ""
+        return extract_text(html_content, self.max_text_length)
+    
+    def fetch_text(self, result):
+        """Fetch a CDX result and return its text, or None if it isn't substantial"""
+        html_content = self.fetch_document(result['filename'], result['offset'], result['length'])
+        if not html_content:
+            return None
+        text_content = self.extract_text_from_html(html_content)
+        if text_content and len(text_content) > self.min_content_length:  # Only keep substantial content
+            return text_content
+        return None
+    
+    def iter_documents(self, domains, max_docs_per_domain=5, start_id=0):
+        """Fetch documents from multiple domains, yielding (doc_id, metadata, text).
         
-        # Create parser instance
-        parser = HTMLTextExtractor()
+        Up to `concurrency` fetches run at once. A domain never has more
+        fetches in flight than it still needs documents; another candidate is
+        only tried when a fetch fails or returns too little text.
         
-        try:
-            parser.feed(html_content)
-            text = parser.get_text()
-            
-            # Clean up the text
-            text = re.sub(r'\s+', ' ', text)  # Replace multiple whitespace with single space
-            text = text.strip()
+        Documents are yielded in the order of the domains and of their
+        candidate URLs, whichever fetch finishes first, so the same crawl
+        always gets the same doc_ids. A fetched document waits until every
+        earlier candidate has been fetched or given up on.
+        """
+        domains = list(domains)
+        doc_id = start_id
+        candidates, accepted, in_flight, submitted = {}, {}, {}, {}
+        for domain in domains:
+            print(f"Searching {domain}...")
+            candidates[domain] = iter(self.search_urls(domain, limit=max_docs_per_domain * 2))
+            accepted[domain] = in_flight[domain] = submitted[domain] = 0
+        # Finished fetches of each domain by candidate number, until their turn comes
+        fetched = {domain: {} for domain in domains}
+        current, number = 0, 0
+        
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            def top_up(domain):
+                while accepted[domain] + in_flight[domain] < max_docs_per_domain:
+                    result = next(candidates[domain], None)
+                    if result is None:
+                        return
+                    pending[pool.submit(self.fetch_text, result)] = (domain, submitted[domain], result)
+                    submitted[domain] += 1
+                    in_flight[domain] += 1
             
-            return text
-        except Exception as e:
-            print(f"Error extracting text from HTML: {e}")
-            return ""
+            try:
+                for domain in domains:
+                    top_up(domain)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        domain, candidate, result = pending.pop(future)
+                        in_flight[domain] -= 1
+                        text_content = future.result()
+                        if text_content:
+                            accepted[domain] += 1
+                        else:
+                            print(f"✗ Skipped {result['url']}")
+                        fetched[domain][candidate] = result, text_content
+                        top_up(domain)
+                    # Yield what every earlier candidate has been decided for
+                    while current < len(domains):
+                        domain = domains[current]
+                        if number in fetched[domain]:
+                            result, text_content = fetched[domain].pop(number)
+                            number += 1
+                            if text_content:
+                                metadata = {
+                                    'url': result['url'],
+                                    'domain': domain,
+                                    'timestamp': result['timestamp']
+                                }
+                                print(f"✓ Processed document {doc_id}: {len(text_content)} characters")
+                                yield doc_id, metadata, text_content
+                                doc_id += 1
+                        elif number == submitted[domain] and not in_flight[domain]:
+                            current, number = current + 1, 0
+                        else:
+                            break
+            finally:
+                for future in pending:
+                    future.cancel()
+    
+    def iter_warc_file(self, path, start_id=0):
+        """Yield (doc_id, metadata, text) for the HTML responses of a local .warc or .warc.gz file"""
+        doc_id = start_id
+        for headers, http_headers, body in iter_responses(iter_file_chunks(path, self.chunk_size)):
+            if 'html' not in http_headers.get('content-type', 'text/html'):
+                continue
+            text_content = self.extract_text_from_html(body)
+            if text_content and len(text_content) > self.min_content_length:
+                url = headers.get('warc-target-uri', '')
+                metadata = {
+                    'url': url,
+                    'domain': urlparse(url).netloc,
+                    'timestamp': headers.get('warc-date', '')
+                }
+                yield doc_id, metadata, text_content
+                doc_id += 1
     
     def get_documents(self, domains, max_docs_per_domain=5):
         """Fetch and process documents from multiple domains"""
         documents = {}
-        doc_id = 0
-        
-        for domain in domains:
-            print(f"Searching {domain}...")
-            search_results = self.search_urls(domain, limit=max_docs_per_domain * 2)
-            processed = 0
-            for result in search_results:
-                if processed >= max_docs_per_domain:
-                    break
-                print(f"Fetching {result['url']}...")
-                html_content = self.fetch_document(
-                    result['filename'], 
-                    result['offset'], 
-                    result['length']
-                )
-                
-                if html_content:
-                    text_content = self.extract_text_from_html(html_content)
-                    
-                    if text_content and len(text_content) > 100:  # Only keep substantial content
-                        documents[doc_id] = {
-                            'url': result['url'],
-                            'content': text_content,
-                            'domain': domain,
-                            'timestamp': result['timestamp']
-                        }
-                        doc_id += 1
-                        processed += 1
-                        print(f"✓ Processed document {doc_id-1}: {len(text_content)} characters")
-                    else:
-                        print("✗ Document too short or empty")
-                else:
-                    print("✗ Failed to fetch document")
-        
+        for doc_id, metadata, text_content in self.iter_documents(domains, max_docs_per_domain):
+            documents[doc_id] = dict(metadata, content=text_content)
         return documents
     
     def get_sample_documents(self):
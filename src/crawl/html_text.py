@@ -0,0 +1,246 @@
+"""Streaming HTML to text extraction.
+
+StreamingTextExtractor takes a page as it arrives, in bytes or str chunks,
+and keeps only the visible text:
+
+    skipped subtrees    script and style are skipped to their closing tag
+                        without looking inside; noscript, template and svg
+                        are skipped with nesting taken into account
+    whitespace          collapsed to single spaces as text is emitted, with
+                        block-level tags separating words and inline tags
+                        (a, b, span...) not
+    max_length          once this much text is collected, the rest of the
+                        page is ignored and done becomes True
+
+A chunk may end anywhere, including inside a tag, an entity or a multi-byte
+character; the unfinished part is kept until the next chunk. A tag still
+unfinished after MAX_TAG characters, such as one with an unbalanced quote,
+is taken to end at the next '>', however far that is, so it isn't scanned
+again on every chunk for the rest of the page.
+"""
+import codecs
+import re
+from html import unescape
+
+RAW_TEXT_TAGS = frozenset(('script', 'style'))
+SKIPPED_TAGS = frozenset(('noscript', 'template', 'svg'))
+INLINE_TAGS = frozenset((
+    'a', 'abbr', 'b', 'bdi', 'bdo', 'cite', 'code', 'data', 'del', 'dfn', 'em', 'font', 'i', 'ins',
+    'kbd', 'mark', 'q', 's', 'samp', 'small', 'span', 'strike', 'strong', 'sub', 'sup', 'time',
+    'tt', 'u', 'var', 'wbr'
+))
+
+# A start or end tag, with quoted attribute values that may contain '>'
+TAG = re.compile(r'''<(/?)([a-zA-Z][^\t\n\f\r />]*)(?:[^>"']|"[^"]*"|'[^']*')*>''')
+TAG_START = re.compile(r'<(/?)([a-zA-Z][^\t\n\f\r />]*)')
+# Longest entity worth holding back at the end of a chunk, such as &CounterClockwiseContourIntegral;
+MAX_ENTITY = 33
+# Longest tag held back waiting for its end
+MAX_TAG = 1 << 16
+
+
+class StreamingTextExtractor:
+    """Incremental HTML to text converter; feed() chunks, then close() and get_text()"""
+
+    def __init__(self, max_length=None, encoding='utf-8'):
+        self.max_length = max_length
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+        self.buffer = ''
+        self.parts = []
+        self.length = 0
+        self.space = False
+        # Name of the subtree being skipped, and how deeply it is nested
+        self.skipping = None
+        self.depth = 0
+        # (name, closing) of a tag too long to hold back, ending at the next '>'
+        self.long_tag = None
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        self.buffer += chunk
+        self._parse(False)
+
+    def close(self):
+        if not self.done:
+            self.buffer += self.decoder.decode(b'', True)
+            self._parse(True)
+        self.done = True
+
+    def get_text(self):
+        text = ''.join(self.parts)
+        if self.max_length is not None:
+            text = text[:self.max_length].rstrip()
+        return text
+
+    def _parse(self, final):
+        buffer = self.buffer
+        position = 0
+        while not self.done:
+            if self.skipping is not None:
+                position = self._skip(buffer, position, final)
+                if self.skipping is not None:
+                    break
+                continue
+            if self.long_tag is not None:
+                end = buffer.find('>', position)
+                if end == -1:
+                    position = len(buffer)
+                    break
+                name, closing = self.long_tag
+                self.long_tag = None
+                position = end + 1
+                self._tag(name, closing, buffer[end - 1] == '/')
+                continue
+
+            start = buffer.find('<', position)
+            if start == -1:
+                end = len(buffer)
+                if not final:
+                    # Keep an entity that the next chunk may complete
+                    amp = buffer.rfind('&', max(position, end - MAX_ENTITY))
+                    if amp != -1 and ';' not in buffer[amp:]:
+                        end = amp
+                self._emit_text(buffer[position:end])
+                position = end
+                break
+            if start > position:
+                self._emit_text(buffer[position:start])
+                position = start
+                if self.done:
+                    break
+
+            if buffer.startswith('<!--', start):
+                end = buffer.find('-->', start + 4)
+                if end == -1:
+                    if final:
+                        position = len(buffer)
+                    break
+                position = end + 3
+                continue
+            if buffer.startswith('<!', start) or buffer.startswith('<?', start):
+                end = buffer.find('>', start)
+                if end == -1:
+                    if final:
+                        position = len(buffer)
+                    break
+                position = end + 1
+                continue
+
+            match = TAG.match(buffer, start)
+            if match is None:
+                tag_start = TAG_START.match(buffer, start)
+                if tag_start or buffer[start:] in ('<', '</'):
+                    if not final:
+                        if len(buffer) - start <= MAX_TAG:
+                            # A tag cut off by the end of the chunk
+                            break
+                        if tag_start:
+                            self.long_tag = (tag_start.group(2).lower(), tag_start.group(1) == '/')
+                            position = start + 1
+                            continue
+                    if tag_start:
+                        # An unbalanced quote; the tag ends at the next '>'
+                        end = buffer.find('>', start)
+                        position = len(buffer) if end == -1 else end + 1
+                        continue
+                # A '<' that doesn't start a tag is text
+                self._emit_text('<')
+                position = start + 1
+                continue
+            position = match.end()
+            self._tag(match.group(2).lower(), match.group(1) == '/', buffer[position - 2] == '/')
+        self.buffer = buffer[position:] if not self.done else ''
+
+    def _emit_text(self, text):
+        if not text:
+            return
+        if '&' in text:
+            text = unescape(text)
+        words = text.split()
+        if not words:
+            self.space = True
+            return
+        if self.length and (self.space or text[0].isspace()):
+            self.parts.append(' ')
+            self.length += 1
+        joined = ' '.join(words)
+        self.parts.append(joined)
+        self.length += len(joined)
+        self.space = text[-1].isspace()
+        if self.max_length is not None and self.length >= self.max_length:
+            self.done = True
+
+    def _tag(self, name, closing, self_closing):
+        if name not in INLINE_TAGS:
+            self.space = True
+        if closing or self_closing:
+            return
+        if name in RAW_TEXT_TAGS or name in SKIPPED_TAGS:
+            self.skipping = name
+            self.depth = 1
+
+    def _skip(self, buffer, position, final):
+        """Move past the skipped subtree, returning the position to continue from"""
+        name = self.skipping
+        if name in RAW_TEXT_TAGS:
+            # Raw text ends at the first closing tag, whatever it contains
+            pattern = _closing_pattern(name)
+            match = pattern.search(buffer, position)
+            if match is None:
+                if final:
+                    return len(buffer)
+                # Keep enough to recognise a closing tag cut off by the chunk
+                return max(position, len(buffer) - len(name) - 3)
+            self.skipping = None
+            return match.end()
+
+        pattern = _nesting_pattern(name)
+        while True:
+            match = pattern.search(buffer, position)
+            if match is None:
+                if final:
+                    return len(buffer)
+                return max(position, len(buffer) - len(name) - 3)
+            if not match.group(0).endswith('>'):
+                if not final:
+                    # The tag goes on in the next chunk
+                    return match.start()
+                return len(buffer)
+            position = match.end()
+            if match.group(1):
+                self.depth -= 1
+                if not self.depth:
+                    self.skipping = None
+                    return position
+            elif not match.group(0).endswith('/>'):
+                self.depth += 1
+
+
+_closing_patterns = {}
+_nesting_patterns = {}
+
+
+def _closing_pattern(name):
+    pattern = _closing_patterns.get(name)
+    if pattern is None:
+        pattern = _closing_patterns[name] = re.compile(rf'</{name}(?=[\t\n\f\r />])[^>]*>', re.IGNORECASE)
+    return pattern
+
+
+def _nesting_pattern(name):
+    pattern = _nesting_patterns.get(name)
+    if pattern is None:
+        pattern = _nesting_patterns[name] = re.compile(rf'<(/?){name}(?=[\t\n\f\r />])[^>]*>?', re.IGNORECASE)
+    return pattern
+
+
+def extract_text(html, max_length=None, encoding='utf-8'):
+    """Visible text of a whole page given as str or bytes"""
+    extractor = StreamingTextExtractor(max_length, encoding)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.get_text()
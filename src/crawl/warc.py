@@ -0,0 +1,108 @@
+"""Incremental WARC parsing.
+
+Everything here works on iterables of byte chunks, so a crawl can be
+streamed from an HTTP response or a local .warc.gz file with only the
+current record held in memory.
+"""
+import os
+import zlib
+
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+def iter_decompressed(chunks):
+    """Decompress a stream of gzip chunks, including multi-member files.
+
+    WARC files gzip every record as a separate member, so a new decompressor
+    is started whenever one member ends.
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+            else:
+                chunk = b''
+
+
+def iter_file_chunks(path, chunk_size=1 << 16):
+    """Yield uncompressed chunks of a .warc or .warc.gz file"""
+    with open(path, 'rb') as f:
+        chunks = iter(lambda: f.read(chunk_size), b'')
+        if os.fspath(path).endswith('.gz'):
+            chunks = iter_decompressed(chunks)
+        yield from chunks
+
+
+def parse_headers(block):
+    """Parse 'Name: value' lines after the first line into a lowercase-keyed dict"""
+    headers = {}
+    for line in block.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name:
+            headers[name.strip().lower().decode('latin-1')] = value.strip().decode('latin-1')
+    return headers
+
+
+def iter_warc_records(chunks):
+    """Yield (headers, payload) for every record in a stream of WARC bytes"""
+    buffer = bytearray()
+    chunks = iter(chunks)
+
+    def fill():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer.extend(chunk)
+        return True
+
+    while True:
+        end = buffer.find(b'\r\n\r\n')
+        while end == -1:
+            if not fill():
+                if buffer.strip():
+                    raise ValueError('Truncated WARC record header')
+                return
+            end = buffer.find(b'\r\n\r\n')
+        block = bytes(buffer[:end]).strip()
+        del buffer[:end + 4]
+        if not block:
+            # The blank lines separating two records
+            continue
+
+        headers = parse_headers(block)
+        length = int(headers.get('content-length', 0))
+        while len(buffer) < length:
+            if not fill():
+                raise ValueError('Truncated WARC record')
+        payload = bytes(buffer[:length])
+        del buffer[:length]
+        yield headers, payload
+
+
+def split_http_response(payload):
+    """Split an HTTP response record into (headers, body text)"""
+    head, _, body = payload.partition(b'\r\n\r\n')
+    headers = parse_headers(head)
+    charset = 'utf-8'
+    for param in headers.get('content-type', '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset' and value.strip():
+            charset = value.strip().strip('"\'')
+    try:
+        text = body.decode(charset, errors='ignore')
+    except LookupError:
+        text = body.decode('utf-8', errors='ignore')
+    return headers, text
+
+
+def iter_responses(chunks):
+    """Yield (warc_headers, http_headers, body text) for each response record"""
+    for headers, payload in iter_warc_records(chunks):
+        if headers.get('warc-type') == 'response':
+            http_headers, body = split_http_response(payload)
+            yield headers, http_headers, body
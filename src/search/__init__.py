@@ -1,4 +1,5 @@
 from .vector_search import VectorSearch, SearchEngine
+from .sharding import ShardedSearchEngine
 
 def demo():
     engine = SearchEngine()
@@ -19,7 +20,7 @@ def demo():
     matches = engine.search(searchterm)
     
     print(f"Search results for '{searchterm}':")
-    for relevance, doc_id, content in matches:
+    for relevance, doc_id, content, _ in matches:
         print(f"Score: {relevance:.4f}, Doc {doc_id}: {content[:100]}...")
 
 if __name__ == "__main__":
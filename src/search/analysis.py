@@ -0,0 +1,127 @@
+import string
+from collections import Counter
+from itertools import filterfalse
+
+from ..algorithms.porter_stemming import CachedStemmer
+
+# Characters that separate tokens besides whitespace, which str.split handles
+PUNCTUATION = string.punctuation + '\u00a1\u00ab\u00bb\u00bf\u2013\u2014\u2018\u2019\u201c\u201d\u2026'
+SEPARATORS = str.maketrans(dict.fromkeys(PUNCTUATION, ' '))
+# Every character str.split() splits on
+WHITESPACE = '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007' \
+             '\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+SPACES = str.maketrans(dict.fromkeys(WHITESPACE, ' '))
+
+ENGLISH_STOP_WORDS = frozenset('''
+a about above after again against all am an and any are as at be because been
+before being below between both but by can did do does doing down during each
+few for from further had has have having he her here hers herself him himself
+his how i if in into is it its itself just me more most my myself no nor not
+now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what
+when where which while who whom why will with you your yours yourself
+yourselves
+'''.split())
+
+
+class Analyzer:
+    """Turns text into the terms that are indexed and searched.
+
+    A translate table turns punctuation and whitespace into spaces, so
+    punctuation, tabs and newlines separate tokens like spaces do, and the
+    text is split on single spaces, which is faster than str.split().
+    Lowercasing, translating, splitting, filtering and counting each run as
+    one pass in C. A CachedStemmer is mapped over every token, which costs
+    less than a Python loop over the distinct ones; any other stemmer stems
+    each distinct token of a document once. Indexing and querying share one
+    Analyzer so both sides produce the same terms.
+
+    With a CachedStemmer this is faster than VectorSearch.concordance, but
+    without stemming it is about 10% slower: that one neither translates
+    punctuation nor drops empty tokens. See benchmarks/bench_analysis.py.
+    """
+
+    def __init__(self, stemmer=None, stop_words=None, separators=SEPARATORS):
+        self.stemmer = stemmer
+        self.stop_words = frozenset(stop_words or ())
+        self.separators = separators
+        self.table = {**separators, **SPACES}
+
+    def term(self, token):
+        """Normalised term of a raw token, or None for a stop word"""
+        token = token.lower()
+        if token in self.stop_words:
+            return None
+        if self.stemmer is not None:
+            return self.stemmer.stem(token)
+        return token
+
+    def concordance(self, text, event=None):
+        """Term frequencies of text; event, if given, times tokenizing and stemming"""
+        if not isinstance(text, str):
+            raise ValueError('Supplied Argument should be of type string')
+        tokens = text.lower().translate(self.table).split(' ')
+        if self.stop_words:
+            tokens = filterfalse(self.stop_words.__contains__, tokens)
+        stemmer = self.stemmer
+        if stemmer is None:
+            concordance = dict(Counter(tokens))
+            # Runs of separators leave empty strings between the spaces
+            concordance.pop('', None)
+            if event is not None:
+                event.lap('tokenize')
+            return concordance
+        tokens = filter(None, tokens)
+        if event is not None:
+            event.lap('tokenize')
+        if isinstance(stemmer, CachedStemmer):
+            concordance = dict(Counter(map(stemmer.stem, tokens)))
+        else:
+            stem = stemmer.stem
+            concordance = {}
+            for token, count in Counter(tokens).items():
+                # Different tokens can share a stem, so add their counts up
+                term = stem(token)
+                concordance[term] = concordance.get(term, 0) + count
+        if event is not None:
+            event.lap('stem')
+        return concordance
+
+    def positions(self, text, event=None):
+        """(concordance, {term: ascending positions}) of text.
+
+        Positions count every token, stop words included, so the terms of a
+        phrase keep their distances however many stop words it contains.
+        """
+        if not isinstance(text, str):
+            raise ValueError('Supplied Argument should be of type string')
+        tokens = text.lower().translate(self.table).split()
+        if event is not None:
+            event.lap('tokenize')
+        stop_words = self.stop_words
+        stemmer = self.stemmer
+        # Term of each distinct token, None for stop words
+        terms = {}
+        positions = {}
+        for position, token in enumerate(tokens):
+            if token in terms:
+                term = terms[token]
+            else:
+                if token in stop_words:
+                    term = None
+                elif stemmer is not None:
+                    term = stemmer.stem(token)
+                else:
+                    term = token
+                terms[token] = term
+            if term is None:
+                continue
+            term_positions = positions.get(term)
+            if term_positions is None:
+                positions[term] = [position]
+            else:
+                term_positions.append(position)
+        if event is not None:
+            event.lap('stem')
+        return {term: len(term_positions) for term, term_positions in positions.items()}, positions
@@ -0,0 +1,79 @@
+"""LRU cache of ranked query results, invalidated by a corpus version."""
+import sys
+from collections import OrderedDict
+
+# Approximate size of one cached (relation, doc_id) pair: the tuple itself
+# plus its float score; doc ids are shared with the index.
+PAIR_SIZE = sys.getsizeof((0.0, 0)) + sys.getsizeof(0.0)
+
+
+class ResultCache:
+    """Bounded LRU cache of ranked (relation, doc_id) lists.
+
+    Entries are keyed on the analysed query and max_results, so queries that
+    differ only in case, punctuation or word forms share an entry. The cache
+    is bounded by entry count and, optionally, by an estimate of the bytes it
+    holds; the least recently used entries are evicted first. Every lookup
+    passes the engine's corpus version, and all entries are dropped as soon
+    as it changes.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError('max_entries should be at least 1')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """Cached ranking for key at this corpus version, or None"""
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+                self.clear()
+            self.version = version
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, version, ranked):
+        if version != self.version:
+            return
+        size = sys.getsizeof(key) + sys.getsizeof(ranked) + len(ranked) * PAIR_SIZE
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self.entries[key] = (ranked, size)
+        self.bytes += size
+        while (self.max_entries is not None and len(self.entries) > self.max_entries) or \
+                (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': len(self.entries),
+            'bytes': self.bytes
+        }
@@ -0,0 +1,74 @@
+"""Variable-length integer coding shared by the index storage formats.
+
+Integers are written seven bits at a time, least significant group first,
+with the high bit of each byte set while more bytes follow. Posting lists
+are stored as (doc number gap, term frequency) pairs so that long lists of
+close document numbers compress to about two bytes per posting.
+"""
+
+
+def encode_varint(value, out):
+    """Append the varint encoding of a non-negative int to a bytearray"""
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, position):
+    """Return (value, next_position) for the varint starting at position"""
+    value = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_postings(postings, out=None):
+    """Delta-encode (doc_number, frequency) pairs sorted by doc_number"""
+    if out is None:
+        out = bytearray()
+    previous = 0
+    for doc_number, frequency in postings:
+        encode_varint(doc_number - previous, out)
+        encode_varint(frequency, out)
+        previous = doc_number
+    return out
+
+
+def decode_postings(buffer, position, count):
+    """Yield count (doc_number, frequency) pairs starting at position"""
+    doc_number = 0
+    for _ in range(count):
+        gap, position = decode_varint(buffer, position)
+        frequency, position = decode_varint(buffer, position)
+        doc_number += gap
+        yield doc_number, frequency
+
+
+def encode_positions(positions, out=None):
+    """Delta-encode an ascending list of token positions"""
+    if out is None:
+        out = bytearray()
+    previous = 0
+    for position in positions:
+        encode_varint(position - previous, out)
+        previous = position
+    return out
+
+
+def decode_positions(buffer, start=0, end=None):
+    """Positions encoded by encode_positions, in buffer[start:end]"""
+    positions = []
+    value = 0
+    position = start
+    if end is None:
+        end = len(buffer)
+    while position < end:
+        gap, position = decode_varint(buffer, position)
+        value += gap
+        positions.append(value)
+    return positions
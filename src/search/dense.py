@@ -0,0 +1,367 @@
+"""Dense retrieval: LSA document embeddings in an approximate nearest neighbour index.
+
+HashedLSA embeds a concordance without keeping a vocabulary. Every term is
+hashed to one of `features` signed columns and weighted by 1 + ln(tf) times
+idf, and the row is projected onto the top `dimensions` right singular
+vectors of the document matrix, found with a randomised truncated SVD.
+Terms used in the same contexts get similar projections, so a query for
+"car" lands near documents about automobiles that never say "car".
+
+IVFPQIndex keeps the unit-length embeddings in an inverted file of product
+quantised codes:
+
+    lists       embeddings are assigned to the nearest of `lists` k-means
+                centroids, and a query only scans the `probes` lists whose
+                centroids are nearest to it
+    subvectors  the residual of an embedding from its centroid is cut into
+                `subvectors` parts, each stored as the byte number of the
+                nearest of 256 centroids learnt for that part; a query
+                scores a list with one table lookup per part
+    rerank      the best `rerank` candidates are scored again against the
+                full embeddings, which are then kept in memory too
+
+More probes and a deeper rerank raise recall at the cost of latency; both
+can be changed per query. DenseIndex ties the two to doc_ids and follows
+documents added and removed after it was built.
+"""
+import json
+import math
+import zlib
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Dense retrieval requires numpy and scipy: pip install numpy scipy")
+
+
+def _normalize(vectors):
+    """Rows scaled to unit length, all-zero rows left as they are"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _nearest(vectors, centroids, chunk_size=4096):
+    """Index of the nearest centroid of every vector"""
+    squared = (centroids ** 2).sum(axis=1)
+    nearest = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        block = vectors[start:start + chunk_size]
+        nearest[start:start + len(block)] = np.argmin(squared - 2 * block @ centroids.T, axis=1)
+    return nearest
+
+
+def _kmeans(vectors, k, rng, iterations=20):
+    """k centroids of vectors found with Lloyd's algorithm"""
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        members = sparse.csr_matrix(
+            (np.ones(len(vectors)), (assignment, np.arange(len(vectors)))), shape=(k, len(vectors))
+        )
+        counts = np.bincount(assignment, minlength=k)
+        filled = counts > 0
+        centroids[filled] = (members @ vectors)[filled] / counts[filled, None]
+        # Restart empty clusters from random vectors
+        centroids[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()))]
+    return centroids
+
+
+class HashedLSA:
+    """Embeds concordances with hashed term features reduced by truncated SVD"""
+
+    def __init__(self, dimensions=128, features=1 << 15, seed=0):
+        _require_numpy()
+        self.dimensions = dimensions
+        self.features = features
+        self.seed = seed
+        self.idf = None
+        # features x dimensions projection learnt by fit_transform
+        self.components = None
+
+    def _matrix(self, concordances):
+        """Sparse (documents x features) matrix of signed 1 + ln(tf) weights"""
+        indptr, hashes, counts = [0], [], []
+        for concordance in concordances:
+            for word, count in concordance.items():
+                hashes.append(zlib.crc32(word.encode('utf-8')))
+                counts.append(count)
+            indptr.append(len(hashes))
+        hashes = np.asarray(hashes, dtype=np.int64)
+        # The top bit picks the sign, so colliding terms tend to cancel out
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        weights = signs * (1 + np.log(np.asarray(counts, dtype=np.float64)))
+        matrix = sparse.csr_matrix(
+            (weights, hashes % self.features, np.asarray(indptr)), shape=(len(indptr) - 1, self.features)
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+    def fit_transform(self, concordances, power_iterations=2, oversampling=10):
+        """Learn idf and the projection from the documents, returning their embeddings"""
+        matrix = self._matrix(concordances)
+        doc_freqs = np.bincount(matrix.indices, minlength=self.features)
+        self.idf = np.log(1 + matrix.shape[0] / np.maximum(doc_freqs, 1))
+        matrix = (matrix @ sparse.diags(self.idf)).tocsr()
+
+        # Randomised range finder (Halko, Martinsson and Tropp), with power
+        # iterations so the spectrum decays fast enough for the top vectors
+        rank = min(self.dimensions, *matrix.shape)
+        rng = np.random.default_rng(self.seed)
+        basis, _ = np.linalg.qr(matrix @ rng.standard_normal((self.features, rank + oversampling)))
+        for _ in range(power_iterations):
+            basis, _ = np.linalg.qr(matrix.T @ basis)
+            basis, _ = np.linalg.qr(matrix @ basis)
+        _, _, right = np.linalg.svd((matrix.T @ basis).T, full_matrices=False)
+        # Fewer documents than dimensions leave the last columns zero
+        self.components = np.zeros((self.features, self.dimensions))
+        self.components[:, :rank] = right[:rank].T
+        return _normalize(matrix @ self.components).astype(np.float32)
+
+    def transform(self, concordances):
+        """Unit-length embeddings of concordances; all zeros when no term is known"""
+        if self.components is None:
+            raise ValueError('HashedLSA has to be fit before it can transform')
+        matrix = self._matrix(concordances) @ sparse.diags(self.idf)
+        return _normalize(matrix @ self.components).astype(np.float32)
+
+
+class IVFPQIndex:
+    """Inverted file of product quantised unit vectors, keyed by integer ids"""
+
+    def __init__(self, lists=None, subvectors=16, probes=8, rerank=64, seed=0):
+        _require_numpy()
+        self.lists = lists
+        self.subvectors = subvectors
+        self.probes = probes
+        self.rerank = rerank
+        self.seed = seed
+        self.centroids = None
+        self.codebooks = None
+        self.list_ids = []
+        self.list_codes = []
+        # Full vectors by id, for reranking
+        self.vectors = np.zeros((0, 0), dtype=np.float32) if rerank else None
+        self._pending = []
+
+    def train(self, vectors, sample_size=50000):
+        """Learn the list centroids and the codebooks of every subvector"""
+        count, dimensions = vectors.shape
+        if dimensions % self.subvectors:
+            raise ValueError(f'{dimensions} dimensions can\'t be cut into {self.subvectors} subvectors')
+        rng = np.random.default_rng(self.seed)
+        if count > sample_size:
+            vectors = vectors[rng.choice(count, sample_size, replace=False)]
+        lists = self.lists or max(1, int(math.sqrt(count)))
+        self.centroids = _kmeans(vectors, lists, rng)
+        self.lists = len(self.centroids)
+        residuals = vectors - self.centroids[_nearest(vectors, self.centroids)]
+        parts = np.split(residuals, self.subvectors, axis=1)
+        self.codebooks = np.stack([_kmeans(part, 256, rng) for part in parts])
+        self.list_ids = [np.zeros(0, dtype=np.int64) for _ in range(self.lists)]
+        self.list_codes = [np.zeros((0, self.subvectors), dtype=np.uint8) for _ in range(self.lists)]
+        if self.vectors is not None:
+            self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+
+    def add(self, ids, vectors):
+        """Queue vectors under integer ids, numbered from 0 in the order they're added"""
+        assignment = _nearest(vectors, self.centroids)
+        parts = np.split(vectors - self.centroids[assignment], self.subvectors, axis=1)
+        codes = np.stack([_nearest(part, codebook) for part, codebook in zip(parts, self.codebooks)], axis=1)
+        self._pending.append((np.asarray(ids, dtype=np.int64), assignment, codes.astype(np.uint8), vectors))
+
+    def _refresh(self):
+        """Append queued vectors to their lists"""
+        if not self._pending:
+            return
+        ids, assignment, codes, vectors = (np.concatenate(arrays) for arrays in zip(*self._pending))
+        self._pending = []
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(self.lists + 1))
+        for number in np.unique(assignment).tolist():
+            members = order[bounds[number]:bounds[number + 1]]
+            self.list_ids[number] = np.concatenate([self.list_ids[number], ids[members]])
+            self.list_codes[number] = np.concatenate([self.list_codes[number], codes[members]])
+        if self.vectors is not None:
+            self.vectors = np.concatenate([self.vectors, vectors])
+
+    def compact(self, keep):
+        """Drop the ids a boolean array marks False and renumber the rest from 0, keeping their order"""
+        self._refresh()
+        numbers = np.cumsum(keep) - 1
+        for number, ids in enumerate(self.list_ids):
+            live = keep[ids]
+            self.list_ids[number] = numbers[ids[live]]
+            self.list_codes[number] = self.list_codes[number][live]
+        if self.vectors is not None:
+            self.vectors = self.vectors[keep[:len(self.vectors)]]
+
+    def search(self, query, k, probes=None, rerank=None, alive=None):
+        """(similarity, id) of about the k nearest vectors, best first.
+
+        alive, a boolean array indexed by id, leaves out the ids it marks False.
+        """
+        self._refresh()
+        probes = min(probes or self.probes, self.lists)
+        rerank = self.rerank if rerank is None else rerank
+        if rerank and self.vectors is None:
+            raise ValueError('This index was built with rerank=0 and keeps no vectors to rerank with')
+        nearest_lists = np.argpartition(((self.centroids - query) ** 2).sum(axis=1), probes - 1)[:probes].tolist()
+        ids = np.concatenate([self.list_ids[number] for number in nearest_lists])
+        if not len(ids):
+            return []
+        codes = np.concatenate([self.list_codes[number] for number in nearest_lists])
+        # q . (centroid + residual) is q . centroid plus one table lookup per
+        # part, and the table of q . code is the same for every list
+        table = np.einsum('pcd,pd->pc', self.codebooks, query.reshape(self.subvectors, -1))
+        sizes = [len(self.list_ids[number]) for number in nearest_lists]
+        similarities = np.repeat(self.centroids[nearest_lists] @ query, sizes)
+        similarities += table[np.arange(self.subvectors), codes].sum(axis=1)
+        if alive is not None:
+            live = alive[ids]
+            ids, similarities = ids[live], similarities[live]
+
+        keep = max(k, rerank)
+        if len(ids) > keep:
+            best = np.argpartition(-similarities, keep - 1)[:keep]
+            ids, similarities = ids[best], similarities[best]
+        if rerank:
+            similarities = self.vectors[ids] @ query
+        best = np.argsort(-similarities, kind='stable')[:k]
+        return list(zip(similarities[best].tolist(), ids[best].tolist()))
+
+
+class DenseIndex:
+    """Embeddings of an engine's documents, searched approximately by doc_id"""
+
+    def __init__(self, encoder, ann):
+        self.encoder = encoder
+        self.ann = ann
+        self.doc_ids = []
+        self.ids = {}
+        # alive[id] is False once the document is removed; grown by doubling
+        self.alive = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def build(cls, documents, dimensions=128, lists=None, subvectors=16, probes=8, rerank=64,
+              features=1 << 15, seed=0):
+        """Fit the embeddings and train the index on (doc_id, concordance) pairs"""
+        _require_numpy()
+        doc_ids, concordances = [], []
+        for doc_id, concordance in documents:
+            doc_ids.append(doc_id)
+            concordances.append(concordance)
+        if not doc_ids:
+            raise ValueError('A dense index needs documents to learn from')
+        encoder = HashedLSA(dimensions, features, seed)
+        vectors = encoder.fit_transform(concordances)
+        ann = IVFPQIndex(lists, subvectors, probes, rerank, seed)
+        ann.train(vectors)
+        dense = cls(encoder, ann)
+        dense._add(doc_ids, vectors)
+        return dense
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _add(self, doc_ids, vectors):
+        start = len(self.doc_ids)
+        for doc_id in doc_ids:
+            self.ids[doc_id] = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+        if len(self.doc_ids) > len(self.alive):
+            alive = np.zeros(max(len(self.doc_ids), 2 * len(self.alive)), dtype=bool)
+            alive[:start] = self.alive[:start]
+            self.alive = alive
+        self.alive[start:len(self.doc_ids)] = True
+        self.ann.add(np.arange(start, len(self.doc_ids)), vectors)
+
+    def add(self, doc_id, concordance):
+        """Embed a document with the learnt projection, replacing any previous version"""
+        self.remove(doc_id)
+        self._add([doc_id], self.encoder.transform([concordance]))
+
+    def remove(self, doc_id):
+        number = self.ids.pop(doc_id, None)
+        if number is not None:
+            self.alive[number] = False
+            self.doc_ids[number] = None
+
+    def compact(self):
+        """Purge removed documents from the lists, codes and kept vectors"""
+        alive = self.alive[:len(self.doc_ids)]
+        if alive.all():
+            return
+        self.ann.compact(alive)
+        self.doc_ids = [doc_id for doc_id, live in zip(self.doc_ids, alive.tolist()) if live]
+        self.ids = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self.alive = np.ones(len(self.doc_ids), dtype=bool)
+
+    def search(self, concordance, k, probes=None, rerank=None):
+        """(similarity, doc_id) of about the k documents nearest a query concordance"""
+        query = self.encoder.transform([concordance])[0]
+        if not query.any():
+            return []
+        hits = self.ann.search(query, k, probes, rerank, self.alive)
+        return [(similarity, self.doc_ids[number]) for similarity, number in hits]
+
+    def save(self, path):
+        """Write the index to a .npz file; doc ids must be JSON-serialisable"""
+        ann = self.ann
+        ann._refresh()
+        config = {
+            'dimensions': self.encoder.dimensions, 'features': self.encoder.features, 'seed': self.encoder.seed,
+            'lists': ann.lists, 'subvectors': ann.subvectors, 'probes': ann.probes, 'rerank': ann.rerank
+        }
+        np.savez(
+            path,
+            config=np.frombuffer(json.dumps(config).encode('utf-8'), dtype=np.uint8),
+            doc_ids=np.frombuffer(json.dumps(self.doc_ids).encode('utf-8'), dtype=np.uint8),
+            alive=self.alive[:len(self.doc_ids)],
+            idf=self.encoder.idf,
+            components=self.encoder.components,
+            centroids=ann.centroids,
+            codebooks=ann.codebooks,
+            list_sizes=np.array([len(ids) for ids in ann.list_ids], dtype=np.int64),
+            list_ids=np.concatenate(ann.list_ids),
+            list_codes=np.concatenate(ann.list_codes),
+            vectors=ann.vectors if ann.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path):
+        _require_numpy()
+        with np.load(path) as data:
+            config = json.loads(data['config'].tobytes())
+            encoder = HashedLSA(config['dimensions'], config['features'], config['seed'])
+            encoder.idf = data['idf']
+            encoder.components = data['components']
+            ann = IVFPQIndex(config['lists'], config['subvectors'], config['probes'], config['rerank'], config['seed'])
+            ann.centroids = data['centroids']
+            ann.codebooks = data['codebooks']
+            bounds = np.cumsum(data['list_sizes'])[:-1]
+            ann.list_ids = np.split(data['list_ids'], bounds)
+            ann.list_codes = np.split(data['list_codes'], bounds)
+            if ann.rerank:
+                ann.vectors = data['vectors']
+            dense = cls(encoder, ann)
+            dense.doc_ids = json.loads(data['doc_ids'].tobytes())
+            dense.alive = data['alive'].copy()
+        dense.ids = {doc_id: number for number, doc_id in enumerate(dense.doc_ids) if dense.alive[number]}
+        return dense
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """(score, doc_id) pairs fusing best-first rankings, each document scoring sum 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, (_, doc_id) in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0) + 1 / (k + rank)
+    return sorted(((score, doc_id) for doc_id, score in scores.items()), reverse=True)
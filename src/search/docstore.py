@@ -0,0 +1,212 @@
+"""Append-only document store that keeps document data on disk.
+
+The file is a sequence of blocks, each a header followed by records:
+
+    block header     flags, raw length and stored length (zlib-compressed
+                     when FLAG_COMPRESSED is set)
+    record           JSON doc id and JSON document data, each prefixed with
+                     its length; a deletion has DELETED as its data length
+
+Only the position of each document's latest record is kept in memory. Data is
+read back when a search result needs it, so document text never has to be
+resident. Reopening a store replays the file to rebuild the positions, and
+cuts off a last block left incomplete by a crash, so that blocks written
+after it are found by the next replay.
+"""
+import json
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+FLAG_COMPRESSED = 1
+BLOCK_HEADER = struct.Struct('<BII')
+LENGTH = struct.Struct('<I')
+DELETED = 0xffffffff
+
+
+def _encode_json(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class DocumentStore(MutableMapping):
+    """doc_id -> document data, stored in an append-only file.
+
+    Writes are buffered into blocks of about block_size bytes. With compress
+    set, each block is zlib-compressed and reading a document decompresses
+    its block; the last cached_blocks decompressed blocks are kept. Without
+    it, a read is a single seek and read of the document's bytes. Replacing
+    or deleting a document appends a new record and leaves the old one in
+    the file.
+    """
+
+    def __init__(self, path, compress=False, block_size=1 << 16, cached_blocks=8):
+        self.path = path
+        self.compress = compress
+        self.block_size = block_size
+        self.cached_blocks = cached_blocks
+        self.file = open(path, 'a+b')
+        self.slots = {}
+        self.free_slots = []
+        # Per slot: file offset of the block, offset and length of the data in it
+        self.blocks = array('Q')
+        self.positions = array('I')
+        self.lengths = array('I')
+        self.pending = bytearray()
+        self.cache = OrderedDict()
+        # File offsets of the zlib-compressed blocks; a store reopened with
+        # another compress setting keeps its earlier blocks as they were
+        self.compressed_blocks = set()
+        self._replay()
+
+    def _replay(self):
+        self.file.seek(0)
+        offset = 0
+        while True:
+            header = self.file.read(BLOCK_HEADER.size)
+            if not header:
+                break
+            data = b''
+            if len(header) == BLOCK_HEADER.size:
+                flags, raw_length, stored_length = BLOCK_HEADER.unpack(header)
+                data = self.file.read(stored_length)
+            if len(header) < BLOCK_HEADER.size or len(data) < stored_length:
+                # Blocks are appended at the end of the file, so the partial
+                # one has to go before any other is written
+                self.file.truncate(offset)
+                break
+            if flags & FLAG_COMPRESSED:
+                data = zlib.decompress(data)
+                self.compressed_blocks.add(offset)
+            position = 0
+            while position < raw_length:
+                doc_id, position, length = self._read_record(data, position)
+                if length == DELETED:
+                    self._release(doc_id)
+                else:
+                    self._locate(doc_id, offset, position, length)
+                    position += length
+            offset += BLOCK_HEADER.size + stored_length
+        self.end = offset
+
+    @staticmethod
+    def _read_record(data, position):
+        """Return (doc_id, data position, data length) of the record at position"""
+        key_length, = LENGTH.unpack_from(data, position)
+        position += LENGTH.size
+        doc_id = json.loads(data[position:position + key_length])
+        position += key_length
+        length, = LENGTH.unpack_from(data, position)
+        return doc_id, position + LENGTH.size, length
+
+    def _locate(self, doc_id, block, position, length):
+        slot = self.slots.get(doc_id)
+        if slot is None:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+            else:
+                slot = len(self.blocks)
+                self.blocks.append(0)
+                self.positions.append(0)
+                self.lengths.append(0)
+            self.slots[doc_id] = slot
+        self.blocks[slot] = block
+        self.positions[slot] = position
+        self.lengths[slot] = length
+
+    def _release(self, doc_id):
+        slot = self.slots.pop(doc_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+        return slot is not None
+
+    def _append(self, doc_id, value):
+        if not isinstance(doc_id, (int, str)) or isinstance(doc_id, bool):
+            raise ValueError(f'Only int and str document ids can be stored, got {doc_id!r}')
+        key = _encode_json(doc_id)
+        self.pending += LENGTH.pack(len(key))
+        self.pending += key
+        if value is None:
+            self.pending += LENGTH.pack(DELETED)
+            position = None
+        else:
+            self.pending += LENGTH.pack(len(value))
+            position = len(self.pending)
+            self.pending += value
+        if len(self.pending) >= self.block_size:
+            self.flush()
+        return position
+
+    def __setitem__(self, doc_id, doc_data):
+        value = _encode_json(doc_data)
+        # The pending block will be written at the current end of the file
+        block = self.end
+        position = self._append(doc_id, value)
+        self._locate(doc_id, block, position, len(value))
+
+    def __delitem__(self, doc_id):
+        if doc_id not in self.slots:
+            raise KeyError(doc_id)
+        self._append(doc_id, None)
+        self._release(doc_id)
+
+    def __getitem__(self, doc_id):
+        slot = self.slots.get(doc_id)
+        if slot is None:
+            raise KeyError(doc_id)
+        return json.loads(self._read(self.blocks[slot], self.positions[slot], self.lengths[slot]))
+
+    def _read(self, block, position, length):
+        if block == self.end:
+            return bytes(self.pending[position:position + length])
+        if block not in self.compressed_blocks:
+            self.file.seek(block + BLOCK_HEADER.size + position)
+            return self.file.read(length)
+        data = self.cache.get(block)
+        if data is None:
+            self.file.seek(block)
+            _, _, stored_length = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+            data = zlib.decompress(self.file.read(stored_length))
+            self.cache[block] = data
+            if len(self.cache) > self.cached_blocks:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(block)
+        return data[position:position + length]
+
+    def __contains__(self, doc_id):
+        return doc_id in self.slots
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def flush(self):
+        """Write the pending block to the file"""
+        if not self.pending:
+            return
+        data = bytes(self.pending)
+        flags = 0
+        if self.compress:
+            data = zlib.compress(data)
+            flags = FLAG_COMPRESSED
+            self.compressed_blocks.add(self.end)
+        self.file.seek(self.end)
+        self.file.write(BLOCK_HEADER.pack(flags, len(self.pending), len(data)))
+        self.file.write(data)
+        self.file.flush()
+        self.end += BLOCK_HEADER.size + len(data)
+        self.pending = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
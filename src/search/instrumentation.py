@@ -0,0 +1,222 @@
+"""Per-phase timers, counters and slow query profiles for SearchEngine.
+
+An engine created with instrumentation=Instrumentation() records one Event
+per search, batch of searches or indexed document:
+
+    phases      seconds spent in each step, such as tokenize, stem,
+                candidates, score, sort and fetch
+    counters    documents scored and pruned, postings read and skipped,
+                stem cache hits and misses, documents indexed
+
+and hands it to its sinks. MemorySink aggregates events into a stats dict,
+which prometheus_text() renders in the Prometheus text exposition format;
+LoggingSink logs them. Any object with an emit(event) method can be a sink.
+
+With profile_slowest set, a sampled fraction of searches run under cProfile
+and the profiles of the slowest ones are kept.
+
+Without instrumentation an engine only checks for a missing Event at each
+phase boundary.
+"""
+import cProfile
+import heapq
+import logging
+import os
+import pstats
+import random
+from itertools import count
+from time import perf_counter
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Event:
+    """Timings and counters of one instrumented operation"""
+
+    __slots__ = ('operation', 'detail', 'phases', 'counters', 'start', 'last', 'seconds', 'profile')
+
+    def __init__(self, operation, detail=None):
+        self.operation = operation
+        self.detail = detail
+        self.phases = {}
+        self.counters = {}
+        self.seconds = None
+        self.profile = None
+        self.start = self.last = perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase"""
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.last = now
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+
+class Instrumentation:
+    """Creates Events for an engine and passes finished ones to the sinks.
+
+    sinks defaults to a single MemorySink, available as .memory. With
+    profile_slowest > 0, a profile_rate fraction of searches are profiled
+    and the profile_slowest slowest of those are kept.
+    """
+
+    PROFILED = ('search',)
+
+    def __init__(self, sinks=None, profile_slowest=0, profile_rate=1.0, seed=None):
+        if not 0 <= profile_rate <= 1:
+            raise ValueError('profile_rate should be between 0 and 1')
+        if sinks is None:
+            sinks = [MemorySink()]
+        self.sinks = list(sinks)
+        self.memory = next((sink for sink in self.sinks if isinstance(sink, MemorySink)), None)
+        self.profile_slowest = profile_slowest
+        self.profile_rate = profile_rate
+        self.random = random.Random(seed)
+        self.profiles = []
+        self._order = count()
+
+    @property
+    def stats(self):
+        """Aggregated stats of the first MemorySink"""
+        if self.memory is None:
+            raise ValueError('This instrumentation has no MemorySink')
+        return self.memory.stats
+
+    def begin(self, operation, detail=None):
+        """Start timing an operation; detail is kept with it, such as the query"""
+        if self.profile_slowest and operation in self.PROFILED and self.random.random() < self.profile_rate:
+            profile = cProfile.Profile()
+            event = Event(operation, detail)
+            event.profile = profile
+            profile.enable()
+            return event
+        return Event(operation, detail)
+
+    def end(self, event):
+        event.seconds = perf_counter() - event.start
+        if event.profile is not None:
+            event.profile.disable()
+            self._keep_profile(event)
+            event.profile = None
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def _keep_profile(self, event):
+        if len(self.profiles) >= self.profile_slowest and event.seconds <= self.profiles[0][0]:
+            return
+        entry = (event.seconds, next(self._order), event.detail, pstats.Stats(event.profile))
+        if len(self.profiles) < self.profile_slowest:
+            heapq.heappush(self.profiles, entry)
+        else:
+            heapq.heapreplace(self.profiles, entry)
+
+    def slowest_profiles(self):
+        """(seconds, query, pstats.Stats) of the slowest profiled searches, slowest first"""
+        return [(seconds, detail, stats) for seconds, _, detail, stats in sorted(self.profiles, reverse=True)]
+
+    def dump_profiles(self, directory):
+        """Write the kept profiles as .prof files, returning their paths"""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for rank, (seconds, _, stats) in enumerate(self.slowest_profiles(), 1):
+            path = os.path.join(directory, f'slowest-{rank:02d}-{seconds * 1000:.0f}ms.prof')
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+class MemorySink:
+    """Aggregates events into a stats dict keyed by operation"""
+
+    def __init__(self):
+        self.stats = {}
+
+    def emit(self, event):
+        stats = self.stats.get(event.operation)
+        if stats is None:
+            stats = self.stats[event.operation] = {
+                'count': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0,
+                'buckets': [0] * len(LATENCY_BUCKETS),
+                'phases': {},
+                'counters': {}
+            }
+        stats['count'] += 1
+        stats['seconds'] += event.seconds
+        if event.seconds > stats['max_seconds']:
+            stats['max_seconds'] = event.seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if event.seconds <= bound:
+                stats['buckets'][i] += 1
+                break
+        phases = stats['phases']
+        for phase, seconds in event.phases.items():
+            phases[phase] = phases.get(phase, 0) + seconds
+        counters = stats['counters']
+        for name, amount in event.counters.items():
+            counters[name] = counters.get(name, 0) + amount
+
+    def reset(self):
+        self.stats = {}
+
+
+class LoggingSink:
+    """Logs every event that took at least min_seconds"""
+
+    def __init__(self, logger=None, level=logging.DEBUG, min_seconds=0):
+        self.logger = logger if logger is not None else logging.getLogger('search')
+        self.level = level
+        self.min_seconds = min_seconds
+
+    def emit(self, event):
+        if event.seconds < self.min_seconds or not self.logger.isEnabledFor(self.level):
+            return
+        phases = ' '.join(f'{phase}={seconds * 1000:.3f}ms' for phase, seconds in event.phases.items())
+        counters = ' '.join(f'{name}={amount}' for name, amount in event.counters.items())
+        self.logger.log(
+            self.level, '%s %.3fms %r %s %s', event.operation, event.seconds * 1000, event.detail, phases, counters
+        )
+
+
+def prometheus_text(stats, prefix='search'):
+    """Prometheus text exposition of MemorySink stats"""
+    lines = []
+
+    def header(name, kind, description):
+        lines.append(f'# HELP {prefix}_{name} {description}')
+        lines.append(f'# TYPE {prefix}_{name} {kind}')
+
+    def sample(name, labels, value):
+        label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+        lines.append(f'{prefix}_{name}{{{label_text}}} {value}')
+
+    operations = sorted(stats.items())
+    header('operation_seconds', 'histogram', 'Latency of instrumented operations')
+    for operation, entry in operations:
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, entry['buckets']):
+            cumulative += bucket
+            sample('operation_seconds_bucket', (('operation', operation), ('le', bound)), cumulative)
+        sample('operation_seconds_bucket', (('operation', operation), ('le', '+Inf')), entry['count'])
+        sample('operation_seconds_sum', (('operation', operation),), entry['seconds'])
+        sample('operation_seconds_count', (('operation', operation),), entry['count'])
+
+    header('phase_seconds_total', 'counter', 'Time spent in each phase of an operation')
+    for operation, entry in operations:
+        for phase, seconds in sorted(entry['phases'].items()):
+            sample('phase_seconds_total', (('operation', operation), ('phase', phase)), seconds)
+
+    for name in sorted({name for _, entry in operations for name in entry['counters']}):
+        header(f'{name}_total', 'counter', name.replace('_', ' ').capitalize())
+        for operation, entry in operations:
+            if name in entry['counters']:
+                sample(f'{name}_total', (('operation', operation),), entry['counters'][name])
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,164 @@
+"""Positional postings and the position list merges behind phrase and NEAR queries.
+
+A position is a token's index in its document, counting stop words, so the
+phrase "state of the art" still matches with "of" and "the" left out of the
+index. Positions are only needed for documents that already contain every
+term of a constraint, so they are kept apart from the frequency postings and
+read for those candidates alone.
+"""
+from array import array
+from bisect import bisect_left
+
+from .codec import decode_positions, encode_positions
+
+
+class PositionIndex:
+    """Delta-encoded positions per (term, document), packed per term.
+
+    Documents get sequential doc numbers. Each term keeps the doc numbers of
+    its postings in ascending order, the end offset of each document's
+    positions, and one bytearray holding the encoded positions back to
+    back, so a posting costs its varints plus eight bytes rather than a
+    dict entry and a bytes object. A document's positions are found by
+    binary search over the term's doc numbers.
+
+    Removing a document only forgets its doc number; its positions stay in
+    the buffers, never returned, until compact() rewrites them.
+    """
+
+    def __init__(self):
+        self.doc_numbers = {}
+        self.num_docs = 0
+        # term -> (doc numbers, end offsets, encoded positions)
+        self.terms = {}
+        self.removed = 0
+
+    def add(self, doc_id, term_positions):
+        """Store the positions of a document given as {term: ascending positions}.
+
+        Adding to a document that is already stored adds its terms to it.
+        """
+        number = self.doc_numbers.get(doc_id)
+        if number is None:
+            number = self.doc_numbers[doc_id] = self.num_docs
+            self.num_docs += 1
+        for word, positions in term_positions.items():
+            self._append(word, number, encode_positions(positions))
+
+    def _append(self, word, number, data):
+        entry = self.terms.get(word)
+        if entry is None:
+            entry = self.terms[word] = (array('I'), array('I'), bytearray())
+        docs, ends, buffer = entry
+        if not docs or docs[-1] < number:
+            docs.append(number)
+            buffer += data
+            ends.append(len(buffer))
+            return
+        # Terms added to an earlier document go in doc number order
+        i = bisect_left(docs, number)
+        start = ends[i - 1] if i else 0
+        buffer[start:start] = data
+        docs.insert(i, number)
+        ends.insert(i, start)
+        for j in range(i, len(ends)):
+            ends[j] += len(data)
+
+    def remove(self, doc_id):
+        if self.doc_numbers.pop(doc_id, None) is not None:
+            self.removed += 1
+
+    def merge(self, other):
+        """Add the positions of another PositionIndex whose documents aren't stored here"""
+        base = self.num_docs
+        for doc_id, number in other.doc_numbers.items():
+            self.doc_numbers[doc_id] = base + number
+        self.num_docs = base + other.num_docs
+        self.removed += other.removed
+        for word, (other_docs, other_ends, other_buffer) in other.terms.items():
+            entry = self.terms.get(word)
+            if entry is None:
+                entry = self.terms[word] = (array('I'), array('I'), bytearray())
+            docs, ends, buffer = entry
+            offset = len(buffer)
+            docs.extend(base + number for number in other_docs)
+            ends.extend(offset + end for end in other_ends)
+            buffer += other_buffer
+
+    def compact(self):
+        """Drop the positions of removed documents and renumber the rest"""
+        live = sorted(self.doc_numbers.values())
+        new_numbers = dict(zip(live, range(len(live))))
+        self.doc_numbers = {doc_id: new_numbers[number] for doc_id, number in self.doc_numbers.items()}
+        self.num_docs = len(live)
+        self.removed = 0
+        terms = {}
+        for word, (docs, ends, buffer) in self.terms.items():
+            new_docs, new_ends, new_buffer = array('I'), array('I'), bytearray()
+            start = 0
+            for number, end in zip(docs, ends):
+                new_number = new_numbers.get(number)
+                if new_number is not None:
+                    new_docs.append(new_number)
+                    new_buffer += buffer[start:end]
+                    new_ends.append(len(new_buffer))
+                start = end
+            if new_docs:
+                terms[word] = (new_docs, new_ends, new_buffer)
+        self.terms = terms
+
+    def doc_positions(self, word, doc_ids):
+        """{doc_id: positions of word} for those of doc_ids that contain it"""
+        entry = self.terms.get(word)
+        if entry is None:
+            return {}
+        docs, ends, buffer = entry
+        doc_numbers = self.doc_numbers
+        found = {}
+        for doc_id in doc_ids:
+            number = doc_numbers.get(doc_id)
+            if number is None:
+                continue
+            i = bisect_left(docs, number)
+            if i < len(docs) and docs[i] == number:
+                found[doc_id] = decode_positions(buffer, ends[i - 1] if i else 0, ends[i])
+        return found
+
+
+def phrase_match(lists, offsets):
+    """True when some p has p + offsets[i] in lists[i] for every i.
+
+    All lists are ascending, so one pointer per list only ever moves forward.
+    """
+    pointers = [0] * len(lists)
+    base_offset = offsets[0]
+    for first in lists[0]:
+        start = first - base_offset
+        for i in range(1, len(lists)):
+            target = start + offsets[i]
+            positions = lists[i]
+            pointer = pointers[i]
+            while pointer < len(positions) and positions[pointer] < target:
+                pointer += 1
+            pointers[i] = pointer
+            if pointer == len(positions):
+                return False
+            if positions[pointer] != target:
+                break
+        else:
+            return True
+    return False
+
+
+def near_match(first, second, distance):
+    """True when two distinct positions, one from each list, are at most distance apart"""
+    i = j = 0
+    while i < len(first) and j < len(second):
+        a, b = first[i], second[j]
+        if a != b and abs(a - b) <= distance:
+            return True
+        if a <= b:
+            i += 1
+        else:
+            j += 1
+    return False
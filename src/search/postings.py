@@ -0,0 +1,324 @@
+"""Inverted index representations used by SearchEngine.
+
+Every representation exposes the same four read views, keyed like plain
+dicts so scoring code doesn't care which one it's reading:
+
+    postings      term -> {doc_id: frequency}
+    index         doc_id -> {term: frequency}
+    norms         doc_id -> document norm under the scoring model
+    max_weights   term -> upper bound of weight(frequency, norm) over its documents
+
+where weight is the scoring model's document term weight, frequency / norm
+by default. doc_freq(term) counts the live documents containing a term. An
+index is updated with add(doc_id, concordance, norm) and remove(doc_id).
+`removed` counts the documents removed since the last compact(), which
+purges whatever removals left behind.
+"""
+from array import array
+from collections.abc import Mapping
+
+from .codec import decode_postings, encode_postings, encode_varint
+
+_REMOVED = object()
+
+
+def frequency_weight(count, norm):
+    return count / norm
+
+
+class InvertedIndex:
+    """Postings and forward index kept in plain dicts"""
+
+    def __init__(self, weight=frequency_weight):
+        self.weight = weight
+        self.postings = {}
+        self.index = {}
+        self.norms = {}
+        self.max_weights = {}
+        self.removed = 0
+        self.stale_terms = set()
+
+    def add(self, doc_id, concordance, norm):
+        self.index[doc_id] = concordance
+        self.norms[doc_id] = norm
+        for word, count in concordance.items():
+            self.postings.setdefault(word, {})[doc_id] = count
+            # Upper bound of this term's weight in any document; it is never
+            # lowered on removal, which keeps it a safe bound.
+            weight = self.weight(count, norm)
+            if weight > self.max_weights.get(word, 0):
+                self.max_weights[word] = weight
+
+    def remove(self, doc_id):
+        """Drop doc_id, returning its concordance or None if it isn't indexed"""
+        concordance = self.index.pop(doc_id, None)
+        if concordance is None:
+            return None
+        del self.norms[doc_id]
+        self.removed += 1
+        for word in concordance:
+            postings = self.postings[word]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[word]
+                del self.max_weights[word]
+                self.stale_terms.discard(word)
+            else:
+                self.stale_terms.add(word)
+        return concordance
+
+    def doc_freq(self, word):
+        postings = self.postings.get(word)
+        return len(postings) if postings else 0
+
+    def compact(self):
+        """Tighten the max weights left too high by removed documents"""
+        norms = self.norms
+        for word in self.stale_terms:
+            self.max_weights[word] = max(
+                self.weight(count, norms[doc_id]) for doc_id, count in self.postings[word].items()
+            )
+        self.stale_terms = set()
+        self.removed = 0
+
+    def merge(self, other):
+        """Add the documents of another InvertedIndex whose ids aren't indexed here.
+
+        Whole posting lists are merged with dict.update, so the cost depends
+        on the size of `other` only.
+        """
+        self.index.update(other.index)
+        self.norms.update(other.norms)
+        for word, postings in other.postings.items():
+            existing = self.postings.get(word)
+            if existing is None:
+                self.postings[word] = postings
+            else:
+                existing.update(postings)
+            weight = other.max_weights[word]
+            if weight > self.max_weights.get(word, 0):
+                self.max_weights[word] = weight
+
+
+class CompressedIndex:
+    """Postings packed into per-term varint buffers.
+
+    Documents get sequential doc numbers, so each term's postings are
+    appended to a bytearray as (doc number gap, frequency) varint pairs and
+    cost two or three bytes instead of a dict entry. The forward index is
+    packed the same way over term numbers. Posting lists are only decoded
+    when a query reads them.
+
+    Removing a document leaves a tombstone: its doc number is freed and its
+    postings stay in the buffers, skipped while decoding, until compact()
+    re-encodes the buffers without them. Document frequencies are updated
+    straight away, so collection statistics never count removed documents.
+    """
+
+    def __init__(self, weight=frequency_weight):
+        self.weight = weight
+        self.terms = []
+        self.term_numbers = {}
+        self.doc_ids = []
+        self.doc_numbers = {}
+        self.buffers = []
+        self.counts = array('I')
+        self.last_docs = array('I')
+        self.doc_freqs = array('I')
+        self.weights = array('d')
+        self.forward = []
+        self.norm_values = array('d')
+        self.live_terms = 0
+        self.removed = 0
+
+        self.postings = CompressedPostings(self)
+        self.index = CompressedDocValues(self, self.concordance)
+        self.norms = CompressedDocValues(self, self.norm_values.__getitem__)
+        self.max_weights = CompressedTermValues(self, self.weights)
+
+    def term_number(self, word):
+        """Number of a term with live postings, or None"""
+        number = self.term_numbers.get(word)
+        if number is not None and self.doc_freqs[number]:
+            return number
+        return None
+
+    def doc_freq(self, word):
+        number = self.term_numbers.get(word)
+        return self.doc_freqs[number] if number is not None else 0
+
+    def add(self, doc_id, concordance, norm):
+        doc_number = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.doc_numbers[doc_id] = doc_number
+        self.norm_values.append(norm)
+
+        entries = []
+        for word, count in concordance.items():
+            number = self.term_numbers.get(word)
+            if number is None:
+                number = len(self.terms)
+                self.term_numbers[word] = number
+                self.terms.append(word)
+                self.buffers.append(bytearray())
+                self.counts.append(0)
+                self.last_docs.append(0)
+                self.doc_freqs.append(0)
+                self.weights.append(0.0)
+            buffer = self.buffers[number]
+            encode_varint(doc_number - self.last_docs[number], buffer)
+            encode_varint(count, buffer)
+            self.last_docs[number] = doc_number
+            self.counts[number] += 1
+            if not self.doc_freqs[number]:
+                self.live_terms += 1
+            self.doc_freqs[number] += 1
+            weight = self.weight(count, norm)
+            if weight > self.weights[number]:
+                self.weights[number] = weight
+            entries.append((number, count))
+
+        entries.sort()
+        self.forward.append(bytes(encode_postings(entries)))
+
+    def remove(self, doc_id):
+        """Drop doc_id, returning its concordance or None if it isn't indexed"""
+        doc_number = self.doc_numbers.pop(doc_id, None)
+        if doc_number is None:
+            return None
+        concordance = self.concordance(doc_number)
+        self.doc_ids[doc_number] = _REMOVED
+        self.forward[doc_number] = b''
+        self.removed += 1
+        for word in concordance:
+            number = self.term_numbers[word]
+            self.doc_freqs[number] -= 1
+            if not self.doc_freqs[number]:
+                self.live_terms -= 1
+                self.buffers[number] = bytearray()
+                self.counts[number] = 0
+                self.last_docs[number] = 0
+                self.weights[number] = 0.0
+        return concordance
+
+    def compact(self):
+        """Drop tombstoned postings and renumber the live documents contiguously"""
+        new_numbers = array('i', [-1]) * len(self.doc_ids)
+        live = [number for number, doc_id in enumerate(self.doc_ids) if doc_id is not _REMOVED]
+        for new_number, number in enumerate(live):
+            new_numbers[number] = new_number
+        self.doc_ids = [self.doc_ids[number] for number in live]
+        self.doc_numbers = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self.forward = [self.forward[number] for number in live]
+        self.norm_values = array('d', (self.norm_values[number] for number in live))
+        self.norms.decode = self.norm_values.__getitem__
+
+        for number, buffer in enumerate(self.buffers):
+            if not self.doc_freqs[number]:
+                continue
+            pairs = []
+            weight = 0.0
+            for doc_number, frequency in decode_postings(buffer, 0, self.counts[number]):
+                doc_number = new_numbers[doc_number]
+                if doc_number >= 0:
+                    pairs.append((doc_number, frequency))
+                    weight = max(weight, self.weight(frequency, self.norm_values[doc_number]))
+            self.buffers[number] = encode_postings(pairs)
+            self.counts[number] = len(pairs)
+            self.last_docs[number] = pairs[-1][0]
+            self.weights[number] = weight
+        self.removed = 0
+
+    def merge(self, other):
+        """Add the documents of an InvertedIndex whose ids aren't indexed here"""
+        for doc_id, concordance in other.index.items():
+            self.add(doc_id, concordance, other.norms[doc_id])
+
+    def term_postings(self, number):
+        doc_ids = self.doc_ids
+        postings = {}
+        for doc_number, frequency in decode_postings(self.buffers[number], 0, self.counts[number]):
+            doc_id = doc_ids[doc_number]
+            if doc_id is not _REMOVED:
+                postings[doc_id] = frequency
+        return postings
+
+    def concordance(self, doc_number):
+        forward = self.forward[doc_number]
+        terms = self.terms
+        # Term numbers were sorted before encoding, so the gaps add up
+        return {
+            terms[number]: count
+            for number, count in decode_postings(forward, 0, _pair_count(forward))
+        }
+
+
+def _pair_count(buffer):
+    """Number of varint pairs in a buffer: every varint ends on a byte below 0x80"""
+    return sum(1 for byte in buffer if byte < 0x80) // 2
+
+
+class CompressedPostings(Mapping):
+    """term -> {doc_id: frequency}, decoded when a query reads the term"""
+
+    def __init__(self, index):
+        self.compressed = index
+
+    def __getitem__(self, word):
+        number = self.compressed.term_number(word)
+        if number is None:
+            raise KeyError(word)
+        return self.compressed.term_postings(number)
+
+    def __contains__(self, word):
+        return self.compressed.term_number(word) is not None
+
+    def __iter__(self):
+        for number, word in enumerate(self.compressed.terms):
+            if self.compressed.doc_freqs[number]:
+                yield word
+
+    def __len__(self):
+        return self.compressed.live_terms
+
+
+class CompressedTermValues(Mapping):
+    """term -> value of a per-term array"""
+
+    def __init__(self, index, values):
+        self.compressed = index
+        self.values = values
+
+    def __getitem__(self, word):
+        number = self.compressed.term_number(word)
+        if number is None:
+            raise KeyError(word)
+        return self.values[number]
+
+    def __iter__(self):
+        return iter(self.compressed.postings)
+
+    def __len__(self):
+        return self.compressed.live_terms
+
+
+class CompressedDocValues(Mapping):
+    """doc_id -> per-document value read through a decode function"""
+
+    def __init__(self, index, decode):
+        self.compressed = index
+        self.decode = decode
+
+    def __getitem__(self, doc_id):
+        return self.decode(self.compressed.doc_numbers[doc_id])
+
+    def __contains__(self, doc_id):
+        return doc_id in self.compressed.doc_numbers
+
+    def __iter__(self):
+        for doc_id in self.compressed.doc_ids:
+            if doc_id is not _REMOVED:
+                yield doc_id
+
+    def __len__(self):
+        return len(self.compressed.doc_numbers)
@@ -0,0 +1,124 @@
+"""Query syntax for phrase, proximity and term expansion operators.
+
+On engines that keep positions:
+
+    "machine learning"        the terms must appear next to each other, in
+                              order; stop words inside the phrase still take
+                              up their positions
+    machine NEAR/3 learning   the two words must appear within 3 positions of
+                              each other, in either order
+
+parse_query turns a query into the text to score, with the operators taken
+out, and a tuple of constraints on the documents allowed to match:
+
+    ('phrase', ((term, offset), ...))
+    ('near', distance, term, term)
+
+Every term of the query, inside a constraint or not, takes part in scoring.
+
+On engines with max_expansions set:
+
+    learn*      indexed terms starting with learn
+    l?arn*      indexed terms matching the pattern, ? being any one character
+    lerning~    indexed terms within 1 or 2 edits of the stemmed word,
+                depending on its length; lerning~1 sets the edits
+
+split_expansions takes these tokens out of a query as expansion() tuples.
+Patterns match the indexed terms, which are stemmed when the engine stems.
+"""
+import re
+
+NEAR = re.compile(r'NEAR/(\d+)$')
+TOKENS = re.compile(r'"[^"]*"|\S+')
+PATTERN = re.compile(r'[\w*?]*\w[\w*?]*$')
+FUZZY = re.compile(r'(\w+)~(\d*)$')
+# Larger edit distances match too much of any dictionary to be useful
+MAX_EDITS = 2
+
+
+def _is_phrase(token):
+    return len(token) > 1 and token.startswith('"') and token.endswith('"')
+
+
+def _ordered_terms(analyzer, text):
+    """Analysed terms of text as (position, term) pairs in text order"""
+    _, term_positions = analyzer.positions(text)
+    return sorted((position, word) for word, positions in term_positions.items() for position in positions)
+
+
+def _tokens(query):
+    """Tokens of a query, checking that every NEAR operator joins two plain words"""
+    tokens = TOKENS.findall(query)
+    for i, token in enumerate(tokens):
+        if NEAR.match(token) is None:
+            continue
+        left = tokens[i - 1] if i > 0 else None
+        right = tokens[i + 1] if i + 1 < len(tokens) else None
+        if left is None or right is None or NEAR.match(left) or NEAR.match(right) \
+                or _is_phrase(left) or _is_phrase(right):
+            raise ValueError(f'{token} should join two words, as in: machine {token} learning')
+    return tokens
+
+
+def check_query(query):
+    """Raise ValueError if query isn't valid phrase and NEAR syntax"""
+    _tokens(query)
+
+
+def parse_query(query, analyzer):
+    """(text to score, constraints) of a query, analysed with analyzer"""
+    tokens = _tokens(query)
+    constraints = []
+    text = []
+    for i, token in enumerate(tokens):
+        near = NEAR.match(token)
+        if near is None:
+            text.append(token)
+            if _is_phrase(token):
+                terms = _ordered_terms(analyzer, token[1:-1])
+                if len(terms) > 1:
+                    start = terms[0][0]
+                    constraints.append(('phrase', tuple((word, position - start) for position, word in terms)))
+            continue
+        left_terms = _ordered_terms(analyzer, tokens[i - 1])
+        right_terms = _ordered_terms(analyzer, tokens[i + 1])
+        if left_terms and right_terms:
+            constraints.append(('near', int(near.group(1)), left_terms[-1][1], right_terms[0][1]))
+    return ' '.join(text), tuple(constraints)
+
+
+def constraint_terms(constraint):
+    """Terms a document must contain to satisfy a constraint"""
+    if constraint[0] == 'phrase':
+        return {word for word, _ in constraint[1]}
+    return {constraint[2], constraint[3]}
+
+
+def expansion(token):
+    """('pattern', pattern, None) or ('fuzzy', word, edits) of a token, None for a plain one"""
+    fuzzy = FUZZY.match(token)
+    if fuzzy is not None:
+        word, edits = fuzzy.groups()
+        if edits:
+            edits = int(edits)
+            if edits > MAX_EDITS:
+                raise ValueError(f'{token} allows {edits} edits, at most {MAX_EDITS} are supported')
+        else:
+            edits = 0 if len(word) < 3 else 1 if len(word) < 6 else 2
+        return 'fuzzy', word.lower(), edits
+    if ('*' in token or '?' in token) and PATTERN.match(token):
+        return 'pattern', token.lower(), None
+    return None
+
+
+def split_expansions(query):
+    """(query without its pattern and fuzzy tokens, their expansion() tuples)"""
+    text = []
+    expansions = []
+    for token in TOKENS.findall(query):
+        expanded = expansion(token)
+        if expanded is None:
+            text.append(token)
+        else:
+            expansions.append(expanded)
+    return ' '.join(text), expansions
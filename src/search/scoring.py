@@ -0,0 +1,219 @@
+"""Scoring models that rank documents for SearchEngine.
+
+A model decides two things at index time:
+
+    norm(concordance)        per-document value stored in the index norms
+    weight(count, norm)      document-side term weight that doesn't depend on
+                             collection statistics; the index keeps its
+                             maximum per term as the term's max_weights entry
+
+and, at query time, given the collection statistics returned by
+SearchEngine.term_statistics:
+
+    query_weights(concordance, stats)   ({term: weight}, scale) of a query
+    context(stats)                      values shared by every query
+    values(postings, norms, context)    {doc_id: value} of one posting list
+    value(count, norm, context)         the value of a single posting
+    finish(partial, norm, scale)        score from the summed weight * value
+    bound(weight, max_weight, scale, context)
+                                        upper bound of one term's share of
+                                        the score, used by MaxScore pruning
+
+The sparse matrix backend stores weight() values and multiplies them by
+weight / scale of each query term; models with matrix_values set turn them
+into values first.
+"""
+import math
+
+
+class _LogTable(dict):
+    """1 + ln(count), computed once per distinct count"""
+
+    def __missing__(self, count):
+        value = self[count] = 1 + math.log(count)
+        return value
+
+
+LOG_TF = _LogTable()
+
+
+class ScoringModel:
+    """Base class holding what every model shares"""
+
+    name = None
+    uses_statistics = False
+    matrix_values = None
+
+    def spec(self):
+        """JSON-serialisable description that make_model() turns back into the model"""
+        return {'name': self.name}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.spec() == self.spec()
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.spec().items())))
+
+    def __repr__(self):
+        options = ', '.join(f'{name}={value!r}' for name, value in self.spec().items() if name != 'name')
+        return f"{type(self).__name__}({options})"
+
+    def context(self, stats):
+        return None
+
+
+class CosineModel(ScoringModel):
+    """Cosine similarity of raw term frequency vectors"""
+
+    name = 'cosine'
+
+    def norm(self, concordance):
+        total = 0
+        for count in concordance.values():
+            total += count ** 2
+        return math.sqrt(total)
+
+    def weight(self, count, norm):
+        return count / norm
+
+    def query_weights(self, concordance, stats):
+        return dict(concordance), self.norm(concordance)
+
+    def values(self, postings, norms, context):
+        return postings
+
+    def value(self, count, norm, context):
+        return count
+
+    def finish(self, partial, norm, scale):
+        product = scale * norm
+        if product != 0:
+            return partial / product
+        return 0
+
+    def bound(self, weight, max_weight, scale, context):
+        return weight * max_weight / scale
+
+
+class TfIdfModel(CosineModel):
+    """lnc.ltc TF-IDF cosine.
+
+    Documents are weighted by 1 + ln(tf) and length-normalised; queries are
+    weighted by 1 + ln(tf) times idf = ln(1 + N / df). Keeping idf on the
+    query side means document norms never change as the collection grows,
+    and terms found in most documents contribute little to any score.
+    """
+
+    name = 'tfidf'
+    uses_statistics = True
+
+    def norm(self, concordance):
+        return math.sqrt(sum(LOG_TF[count] ** 2 for count in concordance.values()))
+
+    def weight(self, count, norm):
+        return LOG_TF[count] / norm
+
+    def query_weights(self, concordance, stats):
+        num_docs = stats['num_docs']
+        doc_freqs = stats['doc_freqs']
+        weights = {}
+        for word, count in concordance.items():
+            doc_freq = doc_freqs.get(word, 0)
+            if doc_freq:
+                weights[word] = LOG_TF[count] * math.log(1 + num_docs / doc_freq)
+        return weights, math.sqrt(sum(weight ** 2 for weight in weights.values()))
+
+    def values(self, postings, norms, context):
+        return {doc_id: LOG_TF[count] for doc_id, count in postings.items()}
+
+    def value(self, count, norm, context):
+        return LOG_TF[count]
+
+
+class BM25Model(ScoringModel):
+    """Okapi BM25 with term frequency saturation k1 and length normalisation b.
+
+    The stored norm of a document is its length in terms. Average length is
+    taken from the collection statistics when a query runs, so nothing
+    stored at index time goes stale as the collection grows.
+    """
+
+    name = 'bm25'
+    uses_statistics = True
+
+    def __init__(self, k1=1.2, b=0.75):
+        if k1 < 0:
+            raise ValueError('k1 should not be negative')
+        if not 0 <= b <= 1:
+            raise ValueError('b should be between 0 and 1')
+        self.k1 = k1
+        self.b = b
+
+    def spec(self):
+        return {'name': self.name, 'k1': self.k1, 'b': self.b}
+
+    def norm(self, concordance):
+        return sum(concordance.values())
+
+    def weight(self, count, norm):
+        # Saturation depends on the average length, so only the frequency is
+        # kept; bound() turns the largest one into a score bound
+        return count
+
+    def query_weights(self, concordance, stats):
+        num_docs = stats['num_docs']
+        doc_freqs = stats['doc_freqs']
+        weights = {}
+        for word, count in concordance.items():
+            doc_freq = doc_freqs.get(word, 0)
+            if doc_freq:
+                weights[word] = count * math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        return weights, 1.0
+
+    def context(self, stats):
+        """(constant, per-length slope) of the saturation denominator"""
+        average_length = stats['total_length'] / stats['num_docs'] if stats['num_docs'] else 0
+        slope = self.k1 * self.b / average_length if average_length else 0
+        return self.k1 * (1 - self.b), slope
+
+    def values(self, postings, norms, context):
+        constant, slope = context
+        k1 = self.k1 + 1
+        return {
+            doc_id: count * k1 / (count + constant + slope * norms[doc_id])
+            for doc_id, count in postings.items()
+        }
+
+    def value(self, count, norm, context):
+        constant, slope = context
+        return count * (self.k1 + 1) / (count + constant + slope * norm)
+
+    def finish(self, partial, norm, scale):
+        return partial
+
+    def bound(self, weight, max_weight, scale, context):
+        # A document is at least as long as any of its term frequencies and
+        # the value grows with frequency, so the largest one bounds it
+        constant, slope = context
+        return weight * max_weight * (self.k1 + 1) / (max_weight + constant + slope * max_weight)
+
+    def matrix_values(self, counts, norms, context):
+        """Vectorised value() over arrays of frequencies and document norms"""
+        constant, slope = context
+        return counts * (self.k1 + 1) / (counts + constant + slope * norms)
+
+
+SCORING_MODELS = {model.name: model for model in (CosineModel, TfIdfModel, BM25Model)}
+
+
+def make_model(scoring):
+    """Scoring model from a model, a model name or a spec() dict"""
+    if isinstance(scoring, str):
+        scoring = {'name': scoring}
+    if isinstance(scoring, dict):
+        options = dict(scoring)
+        name = options.pop('name')
+        if name not in SCORING_MODELS:
+            raise ValueError(f"Unknown scoring model {name!r}, expected one of {tuple(SCORING_MODELS)}")
+        return SCORING_MODELS[name](**options)
+    return scoring
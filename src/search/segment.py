@@ -0,0 +1,475 @@
+"""Binary index segments that are served straight from a memory map.
+
+A segment file starts with a fixed header followed by 8-byte aligned
+sections:
+
+    term table       sorted terms as an offsets array plus a UTF-8 blob
+    term stats       per term posting-list offset, document frequency and
+                     maximum normalised weight
+    postings         delta-encoded (doc number, frequency) varint pairs
+    norms            one float64 vector norm per document
+    doc id table     JSON-encoded document ids, with a permutation sorting
+                     them so an id can be found by binary search
+    forward index    per document (term number, frequency) varint pairs
+    document store   JSON-encoded document data with an offsets table
+    collection       JSON object with the scoring model and total length
+    positions        optional: per term, in posting list order, each
+                     document's delta-encoded token positions
+
+Documents are numbered in the order they were indexed. Nothing is decoded
+when a segment is opened; every lookup reads the mapped pages on demand, so
+worker processes loading the same file share the OS page cache. The file is
+never modified: removed documents are tombstoned in memory and skipped by
+every view.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from collections.abc import Mapping, Sequence
+
+from .codec import decode_postings, decode_varint, encode_positions, encode_postings
+
+MAGIC = b'PYSE'
+VERSION = 3
+FLAG_STEMMING = 1
+FLAG_POSITIONS = 2
+
+SECTIONS = (
+    'term_offsets', 'term_blob', 'postings_offsets', 'doc_freqs', 'max_weights',
+    'postings', 'norms', 'doc_id_offsets', 'doc_id_blob', 'doc_id_order',
+    'forward_offsets', 'forward', 'document_offsets', 'documents', 'collection',
+    'positions_offsets', 'positions'
+)
+HEADER = struct.Struct('<4sHHQQ')
+SECTION_ENTRY = struct.Struct('<QQ')
+HEADER_SIZE = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+
+
+def _string_table(strings):
+    """Offsets array and blob for a sequence of byte strings"""
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for value in strings:
+        blob += value
+        offsets.append(len(blob))
+    return offsets, blob
+
+
+def _encode_json(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def write_segment(path, use_stemming, documents, index, norms, max_weights, collection=None,
+                  positions=None):
+    """Write an index given as mappings keyed by doc_id (and term).
+
+    collection is a JSON-serialisable dict of collection-wide values, read
+    back as Segment.collection. positions, a PositionIndex, adds the token
+    positions of every posting. The segment is written to a temporary file
+    that then replaces path, so a Segment still mapping the old file keeps
+    reading it.
+    """
+    doc_ids = list(norms)
+    doc_numbers = {doc_id: number for number, doc_id in enumerate(doc_ids)}
+    encoded_ids = []
+    for doc_id in doc_ids:
+        if not isinstance(doc_id, (int, str)) or isinstance(doc_id, bool):
+            raise ValueError(f'Only int and str document ids can be saved, got {doc_id!r}')
+        encoded_ids.append(_encode_json(doc_id))
+
+    postings = {}
+    for doc_id in doc_ids:
+        number = doc_numbers[doc_id]
+        for word, count in index[doc_id].items():
+            postings.setdefault(word, []).append((number, count))
+    terms = sorted(postings)
+    term_numbers = {word: number for number, word in enumerate(terms)}
+
+    postings_blob = bytearray()
+    postings_offsets = array('Q', [0])
+    doc_freqs = array('I')
+    for word in terms:
+        encode_postings(postings[word], postings_blob)
+        postings_offsets.append(len(postings_blob))
+        doc_freqs.append(len(postings[word]))
+
+    positions_blob = bytearray()
+    positions_offsets = array('Q', [0])
+    if positions is not None:
+        for word in terms:
+            term_doc_ids = [doc_ids[number] for number, _ in postings[word]]
+            found = positions.doc_positions(word, term_doc_ids)
+            for doc_id in term_doc_ids:
+                encode_positions(found[doc_id], positions_blob)
+            positions_offsets.append(len(positions_blob))
+
+    forward_blob = bytearray()
+    forward_offsets = array('Q', [0])
+    for doc_id in doc_ids:
+        encode_postings(sorted(
+            (term_numbers[word], count) for word, count in index[doc_id].items()
+        ), forward_blob)
+        forward_offsets.append(len(forward_blob))
+
+    term_offsets, term_blob = _string_table(word.encode('utf-8') for word in terms)
+    doc_id_offsets, doc_id_blob = _string_table(encoded_ids)
+    doc_id_order = array('I', sorted(range(len(doc_ids)), key=encoded_ids.__getitem__))
+    document_offsets, document_blob = _string_table(
+        _encode_json(documents[doc_id]) for doc_id in doc_ids
+    )
+
+    sections = {
+        'term_offsets': term_offsets,
+        'term_blob': term_blob,
+        'postings_offsets': postings_offsets,
+        'doc_freqs': doc_freqs,
+        'max_weights': array('d', (max_weights[word] for word in terms)),
+        'postings': postings_blob,
+        'norms': array('d', (norms[doc_id] for doc_id in doc_ids)),
+        'doc_id_offsets': doc_id_offsets,
+        'doc_id_blob': doc_id_blob,
+        'doc_id_order': doc_id_order,
+        'forward_offsets': forward_offsets,
+        'forward': forward_blob,
+        'document_offsets': document_offsets,
+        'documents': document_blob,
+        'collection': _encode_json(collection or {}),
+        'positions_offsets': positions_offsets,
+        'positions': positions_blob
+    }
+
+    flags = FLAG_STEMMING if use_stemming else 0
+    if positions is not None:
+        flags |= FLAG_POSITIONS
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(prefix=f'.{name}.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * HEADER_SIZE)
+            entries = []
+            for name in SECTIONS:
+                data = bytes(sections[name])
+                f.write(b'\0' * (-f.tell() % 8))
+                entries.append((f.tell(), len(data)))
+                f.write(data)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, flags, len(doc_ids), len(terms)))
+            for offset, length in entries:
+                f.write(SECTION_ENTRY.pack(offset, length))
+        # mkstemp creates the file readable by its owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporary, 0o666 & ~umask)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class Segment:
+    """View of a segment file through mmap, with in-memory tombstones"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self.num_docs, self.num_terms = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f'{path} is not a version {VERSION} index segment')
+        self.use_stemming = bool(flags & FLAG_STEMMING)
+        self.has_positions = bool(flags & FLAG_POSITIONS)
+
+        self.sections = {}
+        for i, name in enumerate(SECTIONS):
+            self.sections[name] = SECTION_ENTRY.unpack_from(self.mm, HEADER.size + i * SECTION_ENTRY.size)
+        self._views = []
+        self.term_offsets = self._array('term_offsets', 'Q')
+        self.postings_offsets = self._array('postings_offsets', 'Q')
+        self.doc_freqs = self._array('doc_freqs', 'I')
+        self.max_weight_values = self._array('max_weights', 'd')
+        self.norm_values = self._array('norms', 'd')
+        self.doc_id_offsets = self._array('doc_id_offsets', 'Q')
+        self.doc_id_order = self._array('doc_id_order', 'I')
+        self.forward_offsets = self._array('forward_offsets', 'Q')
+        self.document_offsets = self._array('document_offsets', 'Q')
+        self.positions_offsets = self._array('positions_offsets', 'Q')
+        offset, length = self.sections['collection']
+        self.collection = json.loads(self.mm[offset:offset + length])
+
+        # Ids decoded so far, in both directions; candidate documents always
+        # come out of a posting list, so their reverse lookups are free.
+        self._doc_ids = {}
+        self._doc_numbers = {}
+        self.deleted = set()
+        # Documents removed from each term's posting list, by term number
+        self.removed_freqs = {}
+
+        self.postings = SegmentPostings(self)
+        self.terms = SegmentTerms(self)
+        self.max_weights = SegmentTermValues(self, self.max_weight_values)
+        self.norms = SegmentDocValues(self, self.norm)
+        self.index = SegmentDocValues(self, self.concordance)
+        self.documents = SegmentDocValues(self, self.document)
+        self.positions = SegmentPositions(self) if self.has_positions else None
+
+    def _array(self, name, typecode):
+        offset, length = self.sections[name]
+        view = memoryview(self.mm)[offset:offset + length].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def _string(self, name, offsets, number):
+        start = self.sections[name][0]
+        return self.mm[start + offsets[number]:start + offsets[number + 1]]
+
+    def _search(self, name, offsets, key, order=None, count=0):
+        """Binary search a sorted string table for key, returning its number"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            number = order[mid] if order is not None else mid
+            if self._string(name, offsets, number) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < count:
+            number = order[lo] if order is not None else lo
+            if self._string(name, offsets, number) == key:
+                return number
+        return None
+
+    def term(self, number):
+        return self._string('term_blob', self.term_offsets, number).decode('utf-8')
+
+    def term_number(self, word):
+        return self._search('term_blob', self.term_offsets, word.encode('utf-8'), count=self.num_terms)
+
+    def doc_id(self, number):
+        doc_id = self._doc_ids.get(number)
+        if doc_id is None:
+            doc_id = json.loads(self._string('doc_id_blob', self.doc_id_offsets, number))
+            self._doc_ids[number] = doc_id
+            self._doc_numbers[doc_id] = number
+        return doc_id
+
+    def doc_number(self, doc_id):
+        number = self._doc_numbers.get(doc_id)
+        if number is None and isinstance(doc_id, (int, str)) and not isinstance(doc_id, bool):
+            number = self._search('doc_id_blob', self.doc_id_offsets, _encode_json(doc_id),
+                                  self.doc_id_order, self.num_docs)
+            if number is not None:
+                self._doc_numbers[doc_id] = number
+        return number
+
+    @property
+    def removed(self):
+        return len(self.deleted)
+
+    def live_doc_number(self, doc_id):
+        """Number of doc_id, or None if it isn't in the segment or was removed"""
+        number = self.doc_number(doc_id)
+        if number in self.deleted:
+            return None
+        return number
+
+    def remove(self, doc_id):
+        """Tombstone doc_id, returning its concordance or None if it isn't indexed"""
+        number = self.live_doc_number(doc_id)
+        if number is None:
+            return None
+        self.deleted.add(number)
+        concordance = self.concordance(number)
+        for word in concordance:
+            term_number = self.term_number(word)
+            self.removed_freqs[term_number] = self.removed_freqs.get(term_number, 0) + 1
+        return concordance
+
+    def doc_freq(self, word):
+        number = self.term_number(word) if isinstance(word, str) else None
+        if number is None:
+            return 0
+        return self.doc_freqs[number] - self.removed_freqs.get(number, 0)
+
+    def term_postings(self, number):
+        """Decoded {doc_id: frequency} map of one term"""
+        start = self.sections['postings'][0] + self.postings_offsets[number]
+        deleted = self.deleted
+        return {
+            self.doc_id(doc_number): frequency
+            for doc_number, frequency in decode_postings(self.mm, start, self.doc_freqs[number])
+            if doc_number not in deleted
+        }
+
+    def term_positions(self, number, wanted=None):
+        """Yield (doc number, positions) of one term's live postings.
+
+        With wanted, a set of doc numbers, the positions of other documents
+        are skipped without being decoded.
+        """
+        mm = self.mm
+        start = self.sections['postings'][0] + self.postings_offsets[number]
+        position = self.sections['positions'][0] + self.positions_offsets[number]
+        deleted = self.deleted
+        for doc_number, frequency in decode_postings(mm, start, self.doc_freqs[number]):
+            if doc_number in deleted or (wanted is not None and doc_number not in wanted):
+                # Skip the varints: each one ends on a byte below 0x80
+                while frequency:
+                    if mm[position] < 0x80:
+                        frequency -= 1
+                    position += 1
+                continue
+            positions = []
+            value = 0
+            for _ in range(frequency):
+                gap, position = decode_varint(mm, position)
+                value += gap
+                positions.append(value)
+            yield doc_number, positions
+
+    def norm(self, number):
+        return self.norm_values[number]
+
+    def concordance(self, number):
+        start = self.sections['forward'][0]
+        end = start + self.forward_offsets[number + 1]
+        position = start + self.forward_offsets[number]
+        concordance = {}
+        # The pair count isn't stored, so decode up to the next entry
+        term_number = 0
+        for gap, count in _decode_until(self.mm, position, end):
+            term_number += gap
+            concordance[self.term(term_number)] = count
+        return concordance
+
+    def document(self, number):
+        return json.loads(self._string('documents', self.document_offsets, number))
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.mm.close()
+
+
+def _decode_until(buffer, position, end):
+    while position < end:
+        gap, position = decode_varint(buffer, position)
+        count, position = decode_varint(buffer, position)
+        yield gap, count
+
+
+class SegmentPostings(Mapping):
+    """term -> {doc_id: frequency}, decoded from the segment on access"""
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __getitem__(self, word):
+        number = self.segment.term_number(word) if isinstance(word, str) else None
+        if number is None:
+            raise KeyError(word)
+        return self.segment.term_postings(number)
+
+    def __contains__(self, word):
+        return isinstance(word, str) and self.segment.term_number(word) is not None
+
+    def __iter__(self):
+        for number in range(self.segment.num_terms):
+            yield self.segment.term(number)
+
+    def __len__(self):
+        return self.segment.num_terms
+
+
+class SegmentTerms(Sequence):
+    """The sorted term table as a sequence of str, removed terms included"""
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __getitem__(self, number):
+        if not 0 <= number < self.segment.num_terms:
+            raise IndexError(number)
+        return self.segment.term(number)
+
+    def __len__(self):
+        return self.segment.num_terms
+
+
+class SegmentTermValues(Mapping):
+    """term -> value of a per-term array"""
+
+    def __init__(self, segment, values):
+        self.segment = segment
+        self.values = values
+
+    def __getitem__(self, word):
+        number = self.segment.term_number(word) if isinstance(word, str) else None
+        if number is None:
+            raise KeyError(word)
+        return self.values[number]
+
+    def __iter__(self):
+        return iter(self.segment.postings)
+
+    def __len__(self):
+        return self.segment.num_terms
+
+
+class SegmentDocValues(Mapping):
+    """doc_id -> per-document value read through a decode function"""
+
+    def __init__(self, segment, decode):
+        self.segment = segment
+        self.decode = decode
+
+    def __getitem__(self, doc_id):
+        number = self.segment.live_doc_number(doc_id)
+        if number is None:
+            raise KeyError(doc_id)
+        return self.decode(number)
+
+    def __iter__(self):
+        deleted = self.segment.deleted
+        for number in range(self.segment.num_docs):
+            if number not in deleted:
+                yield self.segment.doc_id(number)
+
+    def __len__(self):
+        return self.segment.num_docs - len(self.segment.deleted)
+
+
+class SegmentPositions:
+    """The PositionIndex reads of a segment saved with positions"""
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def doc_positions(self, word, doc_ids):
+        """{doc_id: positions of word} for those of doc_ids that contain it"""
+        segment = self.segment
+        number = segment.term_number(word) if isinstance(word, str) else None
+        if number is None:
+            return {}
+        wanted = {}
+        for doc_id in doc_ids:
+            doc_number = segment.live_doc_number(doc_id)
+            if doc_number is not None:
+                wanted[doc_number] = doc_id
+        found = {}
+        for doc_number, positions in segment.term_positions(number, wanted):
+            found[wanted[doc_number]] = positions
+            if len(found) == len(wanted):
+                break
+        return found
+
+    def items(self):
+        """Yield (term, doc_id, positions) of every live posting"""
+        segment = self.segment
+        for number in range(segment.num_terms):
+            word = segment.term(number)
+            for doc_number, positions in segment.term_positions(number):
+                yield word, segment.doc_id(doc_number), positions
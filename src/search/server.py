@@ -0,0 +1,371 @@
+"""Asyncio HTTP/JSON search service around SearchEngine.
+
+    GET  /search?q=python+programming&max_results=10
+    POST /search   {"query": "python programming", "max_results": 10}
+    GET  /stats
+    GET  /health
+
+Requests are never scored on the event loop. Each search goes through:
+
+    coalescing      an identical query already in flight is awaited instead
+                    of being queued again
+    bounded queue   when queue_size searches are waiting, new ones are
+                    answered with 503 straight away
+    micro-batching  a batcher drains the queue into batches of up to
+                    max_batch queries, waiting at most batch_wait seconds
+                    for more, and runs each through search_batch
+    worker pool     batches run on a single engine thread, or on worker
+                    processes that each serve the same saved segment
+
+Run it with python -m src.search.server --segment index.seg
+"""
+import argparse
+import asyncio
+import json
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from .query import check_query, split_expansions
+from .segment import Segment
+from .vector_search import SearchEngine
+
+EXECUTORS = ('thread', 'process')
+
+
+class ServerOverloaded(Exception):
+    """Raised when the search queue is full"""
+
+
+class ServerClosed(Exception):
+    """Raised for searches on a server that isn't running, or still waiting when it closes"""
+
+
+def search_results(engine, queries, max_results, snippet_length):
+    """JSON-ready result lists of a batch of queries"""
+    results = []
+    for matches in engine.search_batch(queries, max_results):
+        hits = []
+        for relation, doc_id, content, doc_data in matches:
+            hit = {'doc_id': doc_id, 'score': relation, 'snippet': content[:snippet_length]}
+            if isinstance(doc_data, dict) and doc_data.get('url'):
+                hit['url'] = doc_data['url']
+            hits.append(hit)
+        results.append(hits)
+    return results
+
+
+_worker_engine = None
+
+
+def _init_worker(segment_path, engine_options):
+    global _worker_engine
+    _worker_engine = SearchEngine.load(segment_path, **engine_options)
+
+
+def _worker_search(queries, max_results, snippet_length):
+    return search_results(_worker_engine, queries, max_results, snippet_length)
+
+
+class SearchServer:
+    """Serve searches over HTTP, batching and coalescing them on the way.
+
+    With executor='thread' the given engine (or one loaded from
+    segment_path) is used from a single worker thread, so it is never
+    searched concurrently. With executor='process', `workers` processes each
+    load segment_path; segments are memory-mapped, so they share one copy
+    of the index through the page cache. At most `workers` batches are in
+    flight at a time.
+    """
+
+    def __init__(self, engine=None, segment_path=None, workers=1, executor='thread',
+                 max_batch=64, batch_wait=0.002, queue_size=1024, max_results_limit=1000,
+                 snippet_length=200, engine_options=None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}")
+        engine_options = engine_options or {}
+        if executor == 'process':
+            if segment_path is None:
+                raise ValueError('The process executor needs a segment_path to load in every worker')
+            self.engine = None
+            segment = Segment(segment_path)
+            self.positions = segment.has_positions
+            segment.close()
+            self.expansions = bool(engine_options.get('max_expansions'))
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(segment_path, engine_options)
+            )
+        else:
+            if engine is None:
+                if segment_path is None:
+                    raise ValueError('Pass an engine or a segment_path')
+                engine = SearchEngine.load(segment_path, **engine_options)
+            self.engine = engine
+            self.positions = engine.positions is not None
+            self.expansions = bool(engine.max_expansions)
+            workers = 1
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size
+        self.max_results_limit = max_results_limit
+        self.snippet_length = snippet_length
+        self.queue = None
+        self.inflight = {}
+        self.server = None
+        self.batcher = None
+        self.tasks = set()
+        self.stats = {
+            'requests': 0,
+            'searches': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'batches': 0,
+            'batched_queries': 0
+        }
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Start listening and batching; returns the (host, port) bound"""
+        self.queue = asyncio.Queue(self.queue_size)
+        self.slots = asyncio.Semaphore(self.workers)
+        self.batcher = asyncio.create_task(self._batch_loop())
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """Stop listening, fail the searches still waiting and shut the worker pool down"""
+        if self.server is not None:
+            self.server.close()
+        tasks = [task for task in (self.batcher, *self.tasks) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.batcher = None
+        self.queue = None
+        # Queued searches and those of cancelled batches are all in flight
+        for future in list(self.inflight.values()):
+            if not future.done():
+                future.set_exception(ServerClosed('The server closed before the search ran'))
+        if self.server is not None:
+            await self.server.wait_closed()
+            self.server = None
+        # Batches already running finish off the event loop; queued ones are dropped
+        await asyncio.to_thread(self.executor.shutdown, cancel_futures=True)
+
+    async def search(self, query, max_results=10):
+        """Result list of one query, sharing the work of identical queries in flight.
+
+        Raises ValueError for malformed phrase, NEAR or fuzzy syntax, before
+        the query can fail the batch it would have joined.
+        """
+        if self.positions:
+            check_query(query)
+        if self.expansions:
+            split_expansions(query)
+        if self.queue is None:
+            raise ServerClosed('The server is not running')
+        self.stats['searches'] += 1
+        key = (query, max_results)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((query, max_results, future))
+            except asyncio.QueueFull:
+                self.stats['rejected'] += 1
+                raise ServerOverloaded(f'{self.queue_size} searches are already waiting')
+            self.inflight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so that a client going away doesn't cancel the search for
+        # the others waiting on it
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            groups = {}
+            for query, max_results, future in batch:
+                groups.setdefault(max_results, []).append((query, future))
+            for max_results, items in groups.items():
+                queries = [query for query, _ in items]
+                self.stats['batches'] += 1
+                self.stats['batched_queries'] += len(queries)
+                try:
+                    if self.engine is not None:
+                        results = await loop.run_in_executor(
+                            self.executor, search_results,
+                            self.engine, queries, max_results, self.snippet_length
+                        )
+                    else:
+                        results = await loop.run_in_executor(
+                            self.executor, _worker_search, queries, max_results, self.snippet_length
+                        )
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), hits in zip(items, results):
+                    if not future.done():
+                        future.set_result(hits)
+        finally:
+            self.slots.release()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = b''
+                if headers.get('content-length'):
+                    body = await reader.readexactly(int(headers['content-length']))
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    status, payload = HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line'}
+                    version = 'HTTP/1.0'
+                else:
+                    method, target, version = parts
+                    status, payload = await self._dispatch(method, target, body)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode('utf-8')
+                writer.write((
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, body):
+        """(HTTPStatus, JSON payload) of one request"""
+        self.stats['requests'] += 1
+        url = urlsplit(target)
+        if url.path == '/health':
+            return HTTPStatus.OK, {'status': 'ok'}
+        if url.path == '/stats':
+            return HTTPStatus.OK, dict(self.stats, queued=self.queue.qsize() if self.queue is not None else 0,
+                                         inflight=len(self.inflight))
+        if url.path != '/search':
+            return HTTPStatus.NOT_FOUND, {'error': f'No such endpoint {url.path}'}
+
+        if method == 'GET':
+            params = parse_qs(url.query)
+            query = params.get('q', [None])[0]
+            max_results = params.get('max_results', [10])[0]
+        elif method == 'POST':
+            try:
+                request = json.loads(body)
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {'error': 'Body is not valid JSON'}
+            if not isinstance(request, dict):
+                return HTTPStatus.BAD_REQUEST, {'error': 'Body should be a JSON object'}
+            query = request.get('query')
+            max_results = request.get('max_results', 10)
+        else:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f'{method} is not supported'}
+
+        if not isinstance(query, str) or not query.strip():
+            return HTTPStatus.BAD_REQUEST, {'error': 'A non-empty query is required'}
+        try:
+            max_results = int(max_results)
+        except (TypeError, ValueError):
+            max_results = 0
+        if not 1 <= max_results <= self.max_results_limit:
+            return HTTPStatus.BAD_REQUEST, {
+                'error': f'max_results should be between 1 and {self.max_results_limit}'
+            }
+
+        try:
+            results = await self.search(query, max_results)
+        except (ServerOverloaded, ServerClosed) as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        return HTTPStatus.OK, {'query': query, 'results': results}
+
+
+async def serve(server, host, port):
+    host, port = await server.start(host, port)
+    print(f"Serving on http://{host}:{port}", flush=True)
+    stopped = asyncio.Event()
+    # Shut the worker pool down on SIGTERM too, so no worker outlives the server
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a saved index segment over HTTP.')
+    parser.add_argument('--segment', required=True, help='index segment written by SearchEngine.save')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--executor', choices=EXECUTORS, default='thread')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for --executor process')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--batch-wait', type=float, default=2.0, help='milliseconds to wait for a batch to fill')
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--result-cache-size', type=int, default=0)
+    parser.add_argument('--max-expansions', type=int, default=0,
+                        help='terms a prefix, wildcard or fuzzy query token may expand to')
+    args = parser.parse_args()
+
+    server = SearchServer(
+        segment_path=args.segment, workers=args.workers, executor=args.executor,
+        max_batch=args.max_batch, batch_wait=args.batch_wait / 1000, queue_size=args.queue_size,
+        engine_options={'result_cache_size': args.result_cache_size, 'max_expansions': args.max_expansions}
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
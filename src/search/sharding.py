@@ -0,0 +1,200 @@
+"""Scatter-gather search over SearchEngine shards running in worker processes.
+
+Shards talk to the coordinator through a pipe with plain (command, payload)
+tuples, so the boundary is a message interface that could be put on a
+network transport unchanged:
+
+    ('add', [(doc_id, content), ...])                -> documents indexed
+    ('ingest', [(doc_id, metadata, text), ...])      -> documents indexed
+    ('update', [(doc_id, content), ...])             -> documents updated
+    ('delete', [(doc_id,), ...])                     -> documents deleted
+    ('stats', [term, ...])                           -> collection statistics
+    ('search', (queries, max_results, stats))        -> one result list per query
+                                                        (stats is None for cosine scoring)
+    ('close', None)                                  -> None
+
+Every reply is ('ok', result) or ('error', exception).
+"""
+import heapq
+import multiprocessing
+import zlib
+
+from .query import parse_query
+from .vector_search import SearchEngine
+
+
+def shard_for(doc_id, num_shards):
+    """Stable shard number of a document id, the same in every process"""
+    return zlib.crc32(repr(doc_id).encode('utf-8')) % num_shards
+
+
+def _shard_main(connection, engine_options):
+    engine = SearchEngine(**engine_options)
+    while True:
+        command, payload = connection.recv()
+        try:
+            if command == 'add':
+                engine.add_documents(dict(payload))
+                result = len(payload)
+            elif command == 'ingest':
+                result = engine.ingest(payload)
+            elif command == 'update':
+                for doc_id, content in payload:
+                    engine.update_document(doc_id, content)
+                result = len(payload)
+            elif command == 'delete':
+                result = sum(engine.delete_document(doc_id) for doc_id, in payload)
+            elif command == 'stats':
+                result = engine.term_statistics(payload)
+            elif command == 'search':
+                queries, max_results, stats = payload
+                result = engine.search_batch(queries, max_results, collection_stats=stats)
+            elif command == 'close':
+                connection.send(('ok', None))
+                break
+            else:
+                raise ValueError(f'Unknown shard command {command!r}')
+        except Exception as e:
+            connection.send(('error', e))
+        else:
+            connection.send(('ok', result))
+    connection.close()
+
+
+class ShardedSearchEngine:
+    """Partition documents by id hash across SearchEngine shard processes.
+
+    Queries are sent to every shard at once and their top-k lists merged.
+    Before scoring, shard statistics for the query terms are summed and sent
+    back with the query, so every shard scores against collection-wide
+    statistics and the ranking matches a single engine holding everything.
+    """
+
+    def __init__(self, num_shards=4, **engine_options):
+        if engine_options.get('max_expansions'):
+            # Each shard would expand against its own terms, so shards would
+            # score different queries against statistics for neither
+            raise ValueError('Term expansion is not supported across shards')
+        if engine_options.get('document_store') is not None:
+            # Every shard process would append to the same file through its
+            # own copy of the store's offsets
+            raise ValueError('A document_store can\'t be shared by shards')
+        self.num_shards = num_shards
+        self.connections = []
+        self.processes = []
+        for _ in range(num_shards):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_main, args=(child, engine_options), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        # Analyzes queries and knows the scoring model, without documents
+        self._query_engine = SearchEngine(**engine_options)
+
+    def _scatter(self, command, payloads):
+        """Send one payload per shard, then gather the replies in shard order"""
+        for connection, payload in zip(self.connections, payloads):
+            connection.send((command, payload))
+        replies = [connection.recv() for connection in self.connections]
+        for status, result in replies:
+            if status == 'error':
+                raise result
+        return [result for _, result in replies]
+
+    def _broadcast(self, command, payload):
+        return self._scatter(command, [payload] * self.num_shards)
+
+    def _partition(self, items):
+        partitions = [[] for _ in range(self.num_shards)]
+        for item in items:
+            partitions[shard_for(item[0], self.num_shards)].append(item)
+        return partitions
+
+    def add_documents(self, documents_dict):
+        return sum(self._scatter('add', self._partition(documents_dict.items())))
+
+    def add_document(self, doc_id, content):
+        self.add_documents({doc_id: content})
+
+    def ingest(self, documents):
+        """Index (doc_id, metadata, text) tuples, sending them to shards in batches"""
+        indexed = 0
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= 1000:
+                indexed += sum(self._scatter('ingest', self._partition(batch)))
+                batch = []
+        if batch:
+            indexed += sum(self._scatter('ingest', self._partition(batch)))
+        return indexed
+
+    def add_crawl_documents(self, crawl_documents):
+        return self.ingest(
+            (doc_id, doc_data, doc_data.get('content', ''))
+            for doc_id, doc_data in crawl_documents.items()
+        )
+
+    def update_document(self, doc_id, content):
+        self._scatter('update', self._partition([(doc_id, content)]))
+
+    def delete_document(self, doc_id):
+        """Remove a document from its shard, returning False if it isn't indexed"""
+        return sum(self._scatter('delete', self._partition([(doc_id,)]))) > 0
+
+    def collection_statistics(self, terms):
+        """Sum the statistics of every shard for the given terms"""
+        total = None
+        for stats in self._broadcast('stats', list(terms)):
+            if total is None:
+                total = stats
+            else:
+                total = SearchEngine.combine_statistics(total, stats)
+        return total
+
+    def search(self, query, max_results=None):
+        return self.search_batch([query], max_results)[0]
+
+    def search_batch(self, queries, max_results=None):
+        query_engine = self._query_engine
+        uses_statistics = query_engine.scoring.uses_statistics
+        terms = set()
+        for query in queries:
+            if query_engine.positions is not None:
+                # Also checks the syntax before any shard sees the query
+                query, _ = parse_query(query, query_engine.analyzer)
+            if uses_statistics:
+                terms.update(query_engine.analyze(query))
+        # Cosine scoring needs no collection statistics, so no round trip for them
+        stats = self.collection_statistics(terms) if uses_statistics else None
+        shard_results = self._broadcast('search', (list(queries), max_results, stats))
+
+        merged = []
+        for position in range(len(queries)):
+            # Shard lists are already sorted, so merge them lazily
+            matches = heapq.merge(
+                *(results[position] for results in shard_results),
+                key=lambda match: (match[0], match[1]), reverse=True
+            )
+            if max_results:
+                matches = (match for _, match in zip(range(max_results), matches))
+            merged.append(list(matches))
+        return merged
+
+    def close(self):
+        if not self.connections:
+            return
+        self._broadcast('close', None)
+        for connection in self.connections:
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
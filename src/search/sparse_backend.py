@@ -0,0 +1,178 @@
+from .scoring import CosineModel
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+
+class SparseMatrixBackend:
+    """Vectorized scoring over a CSR matrix of document term weights.
+
+    Every indexed term is mapped to a column and every document to a row whose
+    weights are the scoring model's weight() of its term counts (the counts
+    divided by the document norm for cosine), so a query is scored with a
+    single sparse matrix-vector product. Models whose values depend on
+    collection statistics transform the columns of the query terms first.
+
+    Rows added since the last query are buffered and built into a small delta
+    matrix at the next query, which is scored next to the main one. The delta
+    is stacked onto the main matrix only once it holds delta_fraction of its
+    rows, so adding documents between queries doesn't copy the whole matrix.
+    Removed rows are masked out of the results until compact() drops them.
+    """
+    min_delta_rows = 1024
+    delta_fraction = 0.1
+
+    def __init__(self, scoring=None):
+        if np is None:
+            raise ImportError("SparseMatrixBackend requires numpy and scipy: pip install numpy scipy")
+        self.scoring = scoring if scoring is not None else CosineModel()
+        self.vocabulary = {}
+        self.doc_ids = []
+        self.rows = {}
+        # Norm and liveness of every row, with room to grow at the end
+        self.norm_array = np.zeros(0, dtype=np.float64)
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self.delta = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self._pending = []
+        self.removed = 0
+
+    def add(self, doc_id, concordance, norm):
+        self.remove(doc_id)
+        columns = [self.vocabulary.setdefault(word, len(self.vocabulary)) for word in concordance]
+        weights = [self.scoring.weight(count, norm) for count in concordance.values()]
+        row = self.rows[doc_id] = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        if row == len(self.live):
+            size = max(1024, 2 * row)
+            self.norm_array = _grow(self.norm_array, size)
+            self.live = _grow(self.live, size)
+        self.norm_array[row] = norm
+        self.live[row] = True
+        self._pending.append((columns, weights))
+
+    def remove(self, doc_id):
+        """Mask the row of doc_id out of the results; the row itself is left in place until compact()"""
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return
+        self.doc_ids[row] = None
+        self.live[row] = False
+        self.removed += 1
+        built = self.matrix.shape[0] + self.delta.shape[0]
+        if row >= built:
+            self._pending[row - built] = ([], [])
+
+    def _refresh(self, merge=False):
+        """Build buffered rows into the delta, widen both matrices to the vocabulary, and
+        stack the delta onto the main matrix once it is large enough or merge is set"""
+        columns = len(self.vocabulary)
+        if self._pending:
+            indptr, indices, data = [0], [], []
+            for row_columns, row_weights in self._pending:
+                indices.extend(row_columns)
+                data.extend(row_weights)
+                indptr.append(len(indices))
+            block = sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float64), np.asarray(indices), np.asarray(indptr)),
+                shape=(len(self._pending), columns)
+            )
+            self.delta.resize((self.delta.shape[0], columns))
+            self.delta = sparse.vstack([self.delta, block], format='csr')
+            self._pending = []
+        if self.matrix.shape[1] != columns:
+            self.matrix.resize((self.matrix.shape[0], columns))
+        rows = self.delta.shape[0]
+        if rows and (merge or rows >= max(self.min_delta_rows, self.delta_fraction * self.matrix.shape[0])):
+            self.matrix = sparse.vstack([self.matrix, self.delta], format='csr')
+            self.delta = sparse.csr_matrix((0, columns), dtype=np.float64)
+
+    def compact(self):
+        """Drop the rows of removed documents and renumber the rest"""
+        self._refresh(merge=True)
+        live = np.flatnonzero(self.live[:len(self.doc_ids)])
+        self.matrix = self.matrix[live]
+        self.doc_ids = [self.doc_ids[row] for row in live.tolist()]
+        self.norm_array = self.norm_array[live]
+        self.live = np.ones(len(live), dtype=bool)
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        self.removed = 0
+
+    def query_matrix(self, query_weights, scales):
+        """Build a (terms x queries) CSC matrix of scaled query weights"""
+        rows, columns, weights = [], [], []
+        for column, (term_weights, scale) in enumerate(zip(query_weights, scales)):
+            for word, weight in term_weights.items():
+                row = self.vocabulary.get(word)
+                if row is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    weights.append(weight / scale)
+        return sparse.csc_matrix(
+            (weights, (rows, columns)),
+            shape=(len(self.vocabulary), len(query_weights)),
+            dtype=np.float64
+        )
+
+    def search(self, term_weights, scale, context=None, max_results=None):
+        """Return (relation, doc_id) pairs sorted by decreasing relation"""
+        return self.search_batch([term_weights], [scale], context, max_results)[0]
+
+    def search_batch(self, query_weights, scales, context=None, max_results=None):
+        """Score many queries with one sparse matrix-matrix product.
+
+        query_weights and scales are what the scoring model's query_weights()
+        returned for each query, and context what its context() returned.
+        """
+        self._refresh()
+        queries = self.query_matrix(query_weights, scales)
+        blocks = [(self._scores(self.matrix, 0, queries, context), 0)]
+        if self.delta.shape[0]:
+            first = self.matrix.shape[0]
+            blocks.append((self._scores(self.delta, first, queries, context), first))
+        ranked = []
+        for column in range(len(query_weights)):
+            rows, scores = [], []
+            for block, first in blocks:
+                start, end = block.indptr[column], block.indptr[column + 1]
+                rows.append(block.indices[start:end] + first)
+                scores.append(block.data[start:end])
+            ranked.append(self.rank(np.concatenate(rows), np.concatenate(scores), max_results))
+        return ranked
+
+    def _scores(self, matrix, first_row, queries, context):
+        """(rows x queries) CSC scores of a matrix whose rows are numbered from first_row"""
+        if self.scoring.matrix_values is None:
+            return (matrix @ queries).tocsc()
+        # Only the columns of the query terms are turned into values
+        columns = np.unique(queries.indices)
+        matrix = matrix[:, columns]
+        rows = np.repeat(np.arange(first_row, first_row + matrix.shape[0]), np.diff(matrix.indptr))
+        matrix.data = self.scoring.matrix_values(matrix.data, self.norm_array[rows], context)
+        return (matrix @ queries[columns]).tocsc()
+
+    def rank(self, rows, scores, max_results=None):
+        """Order the positive scores of the given live matrix rows"""
+        keep = (scores > 0) & self.live[rows]
+        rows, scores = rows[keep], scores[keep]
+        if max_results and len(rows) > max_results:
+            # argpartition finds the k-th best score in linear time; every
+            # row tying with it is kept so ties resolve by doc_id as usual.
+            kth = np.argpartition(-scores, max_results - 1)[max_results - 1]
+            keep = scores >= scores[kth]
+            rows, scores = rows[keep], scores[keep]
+        ranked = [(score, self.doc_ids[row]) for row, score in zip(rows.tolist(), scores.tolist())]
+        ranked.sort(reverse=True)
+        if max_results:
+            ranked = ranked[:max_results]
+        return ranked
+
+
+def _grow(array, size):
+    grown = np.zeros(size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
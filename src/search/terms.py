@@ -0,0 +1,126 @@
+"""Sorted term dictionary for prefix, wildcard and fuzzy term expansion.
+
+The dictionary is any sorted sequence of terms: a list for in-memory
+indexes, or a segment's term table read through its memory map. Lookups
+never scan more than they must:
+
+    prefix      binary search for the first term with the prefix, then
+                read terms until one doesn't have it
+    wildcard    the same range for the pattern's literal prefix, each term
+                matched against the pattern; a pattern starting with * or ?
+                has no literal prefix and reads the whole dictionary
+    fuzzy       a Levenshtein DP row per character, with the rows of the
+                previous term reused for the prefix both terms share, so
+                the sorted terms are walked like a trie. Once every cell of
+                a row exceeds the edit budget, no term with that prefix can
+                match and binary search skips all of them at once.
+"""
+import re
+from bisect import bisect_left
+
+# Sorts after any character a term can continue a prefix with
+_PREFIX_END = '\U0010ffff'
+
+
+class TermDictionary:
+    """Prefix, wildcard and edit distance lookups over sorted terms"""
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _range(self, prefix):
+        """(start, end) of the terms beginning with prefix"""
+        terms = self.terms
+        start = bisect_left(terms, prefix)
+        if not prefix:
+            return start, len(terms)
+        return start, bisect_left(terms, prefix + _PREFIX_END, start)
+
+    def prefix(self, prefix):
+        """Yield the terms beginning with prefix, in order"""
+        terms = self.terms
+        for number in range(*self._range(prefix)):
+            yield terms[number]
+
+    def wildcard(self, pattern):
+        """Yield the terms matching pattern, where * is any run of characters and ? any one"""
+        literal = re.match(r'[^*?]*', pattern).group()
+        if literal == pattern:
+            start, end = self._range(pattern)
+            if start < end and self.terms[start] == pattern:
+                yield pattern
+            return
+        if pattern == literal + '*':
+            yield from self.prefix(literal)
+            return
+        regex = re.compile(''.join(
+            '.*' if part == '*' else '.' if part == '?' else re.escape(part)
+            for part in re.split(r'([*?])', pattern)
+        ), re.DOTALL)
+        terms = self.terms
+        for number in range(*self._range(literal)):
+            term = terms[number]
+            if regex.fullmatch(term):
+                yield term
+
+    def fuzzy(self, word, max_edits, prefix_length=0):
+        """Yield (term, edit distance) of the terms within max_edits of word.
+
+        Only terms sharing the first prefix_length characters of word are
+        considered, which cuts the walk down a lot for a small loss of recall.
+        """
+        terms = self.terms
+        size = len(word)
+        limit = max_edits + 1
+        letters = set(word)
+        # DP rows capped at max_edits + 1 are the states of a Levenshtein
+        # automaton, built lazily: (state, character) -> next state, or None
+        # once no continuation can match. Characters not in word all behave
+        # the same, so they share one transition.
+        transitions = {}
+        missing = object()
+
+        def step(above, char):
+            row = [min(above[0] + 1, limit)]
+            for i in range(size):
+                cost = above[i] if word[i] == char else above[i] + 1
+                if above[i + 1] + 1 < cost:
+                    cost = above[i + 1] + 1
+                if row[i] + 1 < cost:
+                    cost = row[i] + 1
+                row.append(cost if cost < limit else limit)
+            return tuple(row) if min(row) < limit else None
+
+        start, end = self._range(word[:prefix_length])
+        # states[i] is the state after the first i characters of previous
+        states = [tuple(min(i, limit) for i in range(size + 1))]
+        previous = ''
+        number = start
+        while number < end:
+            term = terms[number]
+            shared = 0
+            common = min(len(term), len(previous), len(states) - 1)
+            while shared < common and term[shared] == previous[shared]:
+                shared += 1
+            del states[shared + 1:]
+            previous = term
+
+            state = states[-1]
+            for depth in range(shared, len(term)):
+                char = term[depth]
+                key = (state, char if char in letters else '')
+                state = transitions.get(key, missing)
+                if state is missing:
+                    state = transitions[key] = step(key[0], char)
+                if state is None:
+                    # Every term extending this prefix is too far from word
+                    number = bisect_left(terms, term[:depth + 1] + _PREFIX_END, number + 1, end)
+                    break
+                states.append(state)
+            else:
+                if state[size] <= max_edits:
+                    yield term, state[size]
+                number += 1
@@ -1,5 +1,18 @@
+import heapq
 import math
-from ..algorithms.porter_stemming import PorterStemmer
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from ..algorithms.porter_stemming import CachedStemmer, PorterStemmer
+from .analysis import Analyzer
+from .cache import ResultCache
+from .dense import DenseIndex, reciprocal_rank_fusion
+from .positions import PositionIndex, near_match, phrase_match
+from .postings import CompressedIndex, InvertedIndex
+from .query import constraint_terms, expansion, parse_query, split_expansions
+from .scoring import make_model
+from .segment import Segment, write_segment
+from .sparse_backend import SparseMatrixBackend
+from .terms import TermDictionary
 
 class VectorSearch:
     def magnitude(self, concordance):
@@ -9,14 +22,19 @@ class VectorSearch:
         return math.sqrt(total)
     
     def relation(self, concordance1, concordance2):
-        relevance, topval = 0, 0
+        topval = 0
         for word, count in concordance1.items():
             if word in concordance2:
                 topval += count * concordance2[word]
         
-        magnitude_product = self.magnitude(concordance1) * self.magnitude(concordance2)
+        return self.cosine(topval, self.magnitude(concordance1), self.magnitude(concordance2))
+    
+    def cosine(self, dot_product, magnitude1, magnitude2):
+        """Cosine similarity from a dot product and two precomputed magnitudes"""
+        relevance = 0
+        magnitude_product = magnitude1 * magnitude2
         if magnitude_product != 0:
-            relevance = topval / magnitude_product
+            relevance = dot_product / magnitude_product
         return relevance
     
     def concordance(self, document, use_stemming=False, stemmer=None):
@@ -34,57 +52,915 @@ class VectorSearch:
 
 
 class SearchEngine:
-    def __init__(self, use_stemming=True):
+    BACKENDS = ('dict', 'sparse')
+    
+    def __init__(self, use_stemming=True, backend='dict', stem_cache_size=100000,
+                 compress_postings=False, stop_words=None, compaction_threshold=0.2,
+                 result_cache_size=0, result_cache_bytes=None, document_store=None,
+                 scoring='cosine', instrumentation=None, positions=False, max_expansions=0,
+                 fuzzy_prefix_length=2):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {self.BACKENDS}")
         self.vector_search = VectorSearch()
-        self.documents = {}
-        self.index = {}
+        # Any mapping works as the document store, such as a DocumentStore
+        # that keeps document data on disk
+        self.document_store = document_store
+        self.documents = document_store if document_store is not None else {}
+        self.compress_postings = compress_postings
+        self.scoring = make_model(scoring)
+        self.inverted = self._new_index()
+        # Token positions for phrase and NEAR queries, when enabled
+        self.positions = PositionIndex() if positions else None
+        # Sum of document lengths in terms, for length-normalising models
+        self.total_length = 0
         self.use_stemming = use_stemming
-        self.stemmer = PorterStemmer() if use_stemming else None
+        self.stem_cache_size = stem_cache_size
+        self.stemmer = _make_stemmer(use_stemming, stem_cache_size)
+        self.analyzer = Analyzer(self.stemmer, stop_words)
+        self.backend = backend
+        self.matrix_backend = SparseMatrixBackend(self.scoring) if backend == 'sparse' else None
+        # A DenseIndex of document embeddings, from build_dense_index()
+        self.dense = None
+        self.segment = None
+        self.compaction_threshold = compaction_threshold
+        # Bumped by every change to the indexed documents
+        self.version = 0
+        self.result_cache = None
+        if result_cache_size:
+            self.result_cache = ResultCache(result_cache_size, result_cache_bytes)
+        # Terms a prefix, wildcard or fuzzy query token may expand to; 0
+        # leaves those tokens to the analyzer like any other
+        self.max_expansions = max_expansions
+        # Leading characters a fuzzy match must share with the query word
+        self.fuzzy_prefix_length = fuzzy_prefix_length
+        self._term_dictionary = None
+        self._term_dictionary_version = None
+        self.search_stats = {
+            'queries': 0,
+            'documents_scored': 0,
+            'documents_pruned': 0,
+            'postings_read': 0,
+            'postings_skipped': 0
+        }
+        # An Instrumentation that times the phases of searches and indexing
+        self.instrumentation = instrumentation
+    
+    @property
+    def postings(self):
+        return self.inverted.postings
+    
+    @property
+    def index(self):
+        return self.inverted.index
+    
+    @property
+    def norms(self):
+        return self.inverted.norms
+    
+    @property
+    def max_weights(self):
+        return self.inverted.max_weights
     
     def add_crawl_documents(self, crawl_documents):
         """Add documents from CommonCrawlClient format"""
-        for doc_id, doc_data in crawl_documents.items():
-            content = doc_data.get('content', '')
-            if content:
-                self.add_document(doc_id, content)
-                # Store additional metadata
-                self.documents[doc_id] = {
-                    'content': content,
-                    'url': doc_data.get('url', ''),
-                    'domain': doc_data.get('domain', ''),
-                    'timestamp': doc_data.get('timestamp', '')
-                }
+        self.ingest(
+            (doc_id, doc_data, doc_data.get('content', ''))
+            for doc_id, doc_data in crawl_documents.items()
+        )
+    
+    def ingest(self, documents):
+        """Index (doc_id, metadata, text) tuples from any iterable, one at a time.
+        
+        Works with the generators of CommonCrawlClient, so a crawl streams
+        into the index without being collected first. Returns the number of
+        documents indexed.
+        """
+        indexed = 0
+        for doc_id, metadata, content in documents:
+            if not content:
+                continue
+            if self.segment is not None:
+                self._materialize()
+            self.documents[doc_id] = {
+                'content': content,
+                'url': metadata.get('url', ''),
+                'domain': metadata.get('domain', ''),
+                'timestamp': metadata.get('timestamp', '')
+            }
+            self._index(doc_id, content)
+            indexed += 1
+        return indexed
     
     def add_document(self, doc_id, content):
+        if self.segment is not None:
+            self._materialize()
         if not isinstance(self.documents.get(doc_id), dict):
             self.documents[doc_id] = content
-        self.index[doc_id] = self.vector_search.concordance(
-            content.lower(), self.use_stemming, self.stemmer
-        )
+        self._index(doc_id, content)
     
-    def add_documents(self, documents_dict):
-        for doc_id, content in documents_dict.items():
-            self.add_document(doc_id, content)
+    def _index(self, doc_id, content):
+        """Index content under doc_id, replacing any previous version"""
+        if self.instrumentation is None:
+            self._index_text(doc_id, content)
+            return
+        event, before = self._begin('index', doc_id)
+        try:
+            self._index_text(doc_id, content, event)
+            event.count('documents_indexed')
+        finally:
+            self._end(event, before)
     
-    def search(self, query, max_results=None):
-        query_concordance = self.vector_search.concordance(
-            query.lower(), self.use_stemming, self.stemmer
-        )
+    def _index_text(self, doc_id, content, event=None):
+        term_positions = None
+        if self.positions is not None:
+            concordance, term_positions = self.analyzer.positions(content, event)
+        else:
+            concordance = self.analyze(content, event)
+        if self._unindex(doc_id):
+            self._maybe_compact()
+        norm = self.scoring.norm(concordance)
+        self.inverted.add(doc_id, concordance, norm)
+        if term_positions is not None:
+            self.positions.add(doc_id, term_positions)
+        self.total_length += sum(concordance.values())
+        if self.matrix_backend is not None:
+            self.matrix_backend.add(doc_id, concordance, norm)
+        if self.dense is not None:
+            self.dense.add(doc_id, concordance)
+        self.version += 1
+        if event is not None:
+            event.lap('postings')
+    
+    def _unindex(self, doc_id):
+        """Drop the postings and norm of a previously indexed version of doc_id"""
+        concordance = self.inverted.remove(doc_id)
+        if concordance is None:
+            return False
+        if self.positions is not None and self.segment is None:
+            self.positions.remove(doc_id)
+        self.total_length -= sum(concordance.values())
+        if self.matrix_backend is not None:
+            self.matrix_backend.remove(doc_id)
+        if self.dense is not None:
+            self.dense.remove(doc_id)
+        return True
+    
+    def delete_document(self, doc_id):
+        """Remove a document, returning False if it isn't indexed.
+        
+        Costs O(terms in the document): removed documents are tombstoned
+        and skipped at query time until compaction purges them.
+        """
+        if not self._unindex(doc_id):
+            return False
+        if self.segment is None:
+            self.documents.pop(doc_id, None)
+        self.version += 1
+        self._maybe_compact()
+        return True
+    
+    def update_document(self, doc_id, content):
+        """Replace the content of an indexed document, keeping its crawl metadata"""
+        if doc_id not in self.norms:
+            raise KeyError(doc_id)
+        if self.segment is not None:
+            self._materialize()
+        doc_data = self.documents.get(doc_id)
+        if isinstance(doc_data, dict):
+            self.documents[doc_id] = dict(doc_data, content=content)
+        else:
+            self.documents[doc_id] = content
+        self._index(doc_id, content)
+    
+    def compact(self):
+        """Purge removed documents from the postings, positions, bounds, scoring matrix and dense index"""
+        if self.segment is not None:
+            # The in-memory copy leaves the segment's tombstones behind
+            self._materialize()
+        else:
+            self.inverted.compact()
+            if self.positions is not None:
+                self.positions.compact()
+        if self.matrix_backend is not None:
+            self.matrix_backend.compact()
+        if self.dense is not None:
+            self.dense.compact()
+    
+    def _maybe_compact(self):
+        """Compact once removals pass compaction_threshold of the documents"""
+        if self.compaction_threshold is None:
+            return
+        removed = self.inverted.removed
+        if removed and removed > self.compaction_threshold * (len(self.norms) + removed):
+            self.compact()
+    
+    def _accumulate(self, weights, context):
+        """Sum of weight * value over the query terms for every matching document"""
+        accumulators = {}
+        for word, weight in weights.items():
+            postings = self.postings.get(word)
+            if postings:
+                self.search_stats['postings_read'] += len(postings)
+                for doc_id, value in self.scoring.values(postings, self.norms, context).items():
+                    accumulators[doc_id] = accumulators.get(doc_id, 0) + weight * value
+        return accumulators
+    
+    def dot_products(self, query_concordance):
+        """Sum of the scoring model's query weight * document value for every document sharing a query term.
+        
+        These are the scores search() ranks by before the model's final
+        normalisation by document norm and query scale.
+        """
+        stats = self.term_statistics(query_concordance) if self.scoring.uses_statistics else None
+        weights, _ = self.scoring.query_weights(query_concordance, stats)
+        return self._accumulate(weights, self.scoring.context(stats))
+    
+    def add_documents(self, documents_dict, workers=None, chunk_size=1000):
+        """Add many documents, optionally analysing them in worker processes.
+        
+        With workers > 1 the documents are split into chunks that a
+        ProcessPoolExecutor turns into partial indexes, which are merged
+        into this engine as they come back.
+        """
+        if not workers or workers <= 1:
+            for doc_id, content in documents_dict.items():
+                self.add_document(doc_id, content)
+            return
+        
+        if self.segment is not None:
+            self._materialize()
+        items = list(documents_dict.items())
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        options = (self.use_stemming, self.stem_cache_size, self.analyzer.stop_words, self.positions is not None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = pool.map(
+                _build_partial_index, chunks, [options] * len(chunks), [self.scoring] * len(chunks)
+            )
+            for chunk, (partial, positions) in zip(chunks, partials):
+                if self.instrumentation is not None:
+                    event = self.instrumentation.begin('merge', len(chunk))
+                for doc_id, content in chunk:
+                    if not isinstance(self.documents.get(doc_id), dict):
+                        self.documents[doc_id] = content
+                self.merge(partial, positions)
+                if self.instrumentation is not None:
+                    event.count('documents_indexed', len(chunk))
+                    self.instrumentation.end(event)
+    
+    def merge(self, partial, positions=None):
+        """Merge an InvertedIndex built elsewhere, replacing documents with the same ids.
+        
+        The partial index must have been built with this engine's scoring
+        model, whose norm() and weight() it stores. An engine that keeps
+        positions needs the partial's PositionIndex as well.
+        """
+        if self.positions is not None and positions is None:
+            raise ValueError('This engine keeps positions, so merge() needs the PositionIndex of the partial index')
+        if self.segment is not None:
+            self._materialize()
+        for doc_id in partial.index:
+            self._unindex(doc_id)
+        self._maybe_compact()
+        self.inverted.merge(partial)
+        if self.positions is not None:
+            self.positions.merge(positions)
+        self.total_length += sum(sum(concordance.values()) for concordance in partial.index.values())
+        if self.matrix_backend is not None:
+            for doc_id, concordance in partial.index.items():
+                self.matrix_backend.add(doc_id, concordance, partial.norms[doc_id])
+        if self.dense is not None:
+            for doc_id, concordance in partial.index.items():
+                self.dense.add(doc_id, concordance)
+        self.version += 1
+    
+    def save(self, path):
+        """Write the index and documents to a binary segment file"""
+        collection = {
+            'scoring': self.scoring.spec(),
+            'total_length': self.total_length,
+            'stop_words': sorted(self.analyzer.stop_words)
+        }
+        write_segment(path, self.use_stemming, self.documents, self.index, self.norms, self.max_weights,
+                      collection, self.positions)
+    
+    @classmethod
+    def load(cls, path, backend='dict', **engine_options):
+        """Serve a segment written by save() straight from a memory map.
+        
+        Nothing is decoded up front, so startup time doesn't depend on the
+        corpus size. The segment is copied into memory the first time the
+        engine is modified. Other options are passed to the constructor.
+        The scoring model and stop words are the ones the segment was saved
+        with, and positions are kept if the segment has them.
+        """
+        segment = Segment(path)
+        scoring = make_model(segment.collection['scoring'])
+        if make_model(engine_options.pop('scoring', scoring)) != scoring:
+            segment.close()
+            raise ValueError(f'{path} was saved for scoring with {scoring!r}')
+        # Segments saved before stop words were recorded take the ones passed
+        stop_words = segment.collection.get('stop_words')
+        if stop_words is not None:
+            passed = engine_options.pop('stop_words', None)
+            if passed is not None and frozenset(passed) != frozenset(stop_words):
+                segment.close()
+                raise ValueError(f'{path} was saved with different stop words')
+            engine_options['stop_words'] = stop_words
+        if engine_options.pop('positions', False) and not segment.has_positions:
+            segment.close()
+            raise ValueError(f'{path} was saved without positions')
+        engine = cls(segment.use_stemming, backend, scoring=scoring, positions=segment.has_positions,
+                     **engine_options)
+        engine.segment = engine.inverted = segment
+        engine.positions = segment.positions
+        engine.total_length = segment.collection['total_length']
+        engine.documents = segment.documents
+        if engine.matrix_backend is not None:
+            for doc_id, concordance in segment.index.items():
+                engine.matrix_backend.add(doc_id, concordance, segment.norms[doc_id])
+        return engine
+    
+    def _materialize(self):
+        """Replace the loaded segment with in-memory dicts that can be modified"""
+        segment, self.segment = self.segment, None
+        if self.document_store is not None:
+            self.document_store.update(segment.documents)
+            self.documents = self.document_store
+        else:
+            self.documents = dict(segment.documents)
+        self.inverted = self._new_index()
+        for doc_id, concordance in segment.index.items():
+            self.inverted.add(doc_id, concordance, segment.norms[doc_id])
+        if self.positions is not None:
+            self.positions = PositionIndex()
+            # Number documents in segment order so each term's postings append in order
+            for doc_id in segment.index:
+                self.positions.add(doc_id, {})
+            for word, doc_id, positions in segment.positions.items():
+                self.positions.add(doc_id, {word: positions})
+        segment.close()
+    
+    def _new_index(self):
+        index_class = CompressedIndex if self.compress_postings else InvertedIndex
+        return index_class(self.scoring.weight)
+    
+    def analyze(self, text, event=None):
+        """Concordance of a document or query as the index sees it"""
+        return self.analyzer.concordance(text, event)
+    
+    def _analyze_query(self, query, event=None, analyzer=None):
+        """(concordance, constraints) of a query, with its operators applied"""
+        analyzer = analyzer or self.analyzer
+        constraints = ()
+        if self.positions is not None:
+            query, constraints = parse_query(query, analyzer)
+        expansions = ()
+        if self.max_expansions:
+            query, expansions = split_expansions(query)
+        concordance = analyzer.concordance(query, event)
+        if expansions:
+            for kind, pattern, edits in expansions:
+                for word in self._expand(kind, pattern, edits):
+                    concordance[word] = concordance.get(word, 0) + 1
+            if event is not None:
+                event.lap('expand')
+        return concordance, constraints
+    
+    def _batch_analyzer(self):
+        """Analyzer for one batch of queries, stemming each distinct word of the batch once.
+        
+        Without a stem cache on the engine, the batch gets its own.
+        """
+        analyzer = self.analyzer
+        if analyzer.stemmer is None or isinstance(analyzer.stemmer, CachedStemmer):
+            return analyzer
+        return Analyzer(CachedStemmer(analyzer.stemmer, None), analyzer.stop_words, analyzer.separators)
+    
+    @property
+    def term_dictionary(self):
+        """TermDictionary of the indexed terms, rebuilt after the index changes.
+        
+        A loaded segment's sorted term table is used as it is.
+        """
+        if self._term_dictionary_version != self.version or self._term_dictionary is None:
+            terms = self.segment.terms if self.segment is not None else sorted(self.postings)
+            self._term_dictionary = TermDictionary(terms)
+            self._term_dictionary_version = self.version
+        return self._term_dictionary
+    
+    def expand_term(self, token):
+        """Indexed terms a prefix (learn*), wildcard (l?arn*) or fuzzy (lerning~) token stands for.
+        
+        At most max_expansions terms are returned: the first ones in
+        dictionary order for patterns, the closest and most frequent ones
+        for fuzzy words.
+        """
+        expanded = expansion(token)
+        if expanded is None:
+            raise ValueError(f'{token!r} is not a prefix, wildcard or fuzzy term')
+        return self._expand(*expanded)
+    
+    def _expand(self, kind, pattern, edits):
+        dictionary = self.term_dictionary
+        doc_freq = self.inverted.doc_freq
+        if kind == 'pattern':
+            # Removed terms can linger in the dictionary of a segment
+            words = (word for word in dictionary.wildcard(pattern) if doc_freq(word))
+            return list(islice(words, self.max_expansions))
+        word = self.analyzer.term(pattern)
+        if word is None:
+            return []
         matches = []
+        for term, distance in dictionary.fuzzy(word, edits, self.fuzzy_prefix_length):
+            frequency = doc_freq(term)
+            if frequency:
+                matches.append((distance, -frequency, term))
+        return [term for _, _, term in heapq.nsmallest(self.max_expansions, matches)]
+    
+    def _begin(self, operation, detail):
+        """Start an instrumentation event, with the counters to diff at the end"""
+        return self.instrumentation.begin(operation, detail), self._counters()
+    
+    def _end(self, event, before):
+        for name, value in self._counters().items():
+            if value != before[name]:
+                event.count(name, value - before[name])
+        self.instrumentation.end(event)
+    
+    def _counters(self):
+        counters = dict(self.search_stats)
+        if isinstance(self.stemmer, CachedStemmer):
+            info = self.stemmer.stem.cache_info()
+            counters['stem_cache_hits'] = info.hits
+            counters['stem_cache_misses'] = info.misses
+        return counters
+    
+    def term_statistics(self, terms):
+        """Document count, total length and per-term document frequencies of this engine"""
+        return {
+            'num_docs': len(self.norms),
+            'total_length': self.total_length,
+            'doc_freqs': {word: self.inverted.doc_freq(word) for word in terms}
+        }
+    
+    @staticmethod
+    def combine_statistics(stats1, stats2):
+        """Statistics of two disjoint document collections taken together"""
+        doc_freqs = dict(stats1['doc_freqs'])
+        for word, count in stats2['doc_freqs'].items():
+            doc_freqs[word] = doc_freqs.get(word, 0) + count
+        return {
+            'num_docs': stats1['num_docs'] + stats2['num_docs'],
+            'total_length': stats1['total_length'] + stats2['total_length'],
+            'doc_freqs': doc_freqs
+        }
+    
+    def search(self, query, max_results=None, collection_stats=None):
+        """Rank documents against query, returning (relation, doc_id, content, doc_data) tuples.
         
-        for doc_id in self.index:
-            relation = self.vector_search.relation(query_concordance, self.index[doc_id])
-            if relation != 0:
-                doc_data = self.documents[doc_id]
-                if isinstance(doc_data, dict):
-                    content = doc_data['content']
+        collection_stats, as returned by term_statistics, stands in for this
+        engine's own statistics when it holds one shard of a larger
+        collection; cosine ranking doesn't use them. Searches without
+        collection_stats go through the result cache when one is configured.
+        
+        On an engine created with positions=True, "quoted phrases" and
+        word NEAR/k word restrict the results to documents where the terms
+        appear in that order, or within k positions of each other. With
+        max_expansions set, prefix (learn*), wildcard (l?arn*) and fuzzy
+        (lerning~) tokens are scored as the terms expand_term() gives them.
+        """
+        if self.instrumentation is None:
+            return self._matches(self._rank(query, max_results, collection_stats))
+        event, before = self._begin('search', query)
+        try:
+            return self._matches(self._rank(query, max_results, collection_stats, event), event)
+        finally:
+            self._end(event, before)
+    
+    def _rank(self, query, max_results, collection_stats, event=None):
+        """(relation, doc_id) pairs of the documents matching query, best first"""
+        query_concordance, constraints = self._analyze_query(query, event)
+        self.search_stats['queries'] += 1
+        
+        cache = self.result_cache if collection_stats is None else None
+        if cache is not None:
+            key = ((_query_key(query_concordance), constraints), max_results or None)
+            ranked = cache.get(key, self.version)
+            if event is not None:
+                event.lap('cache')
+            if ranked is not None:
+                if event is not None:
+                    event.count('result_cache_hits')
+                return ranked
+        
+        stats = collection_stats
+        if stats is None and self.scoring.uses_statistics:
+            stats = self.term_statistics(query_concordance)
+        weights, scale = self.scoring.query_weights(query_concordance, stats)
+        context = self.scoring.context(stats)
+        if event is not None:
+            event.lap('weights')
+        
+        if constraints:
+            allowed = self._constrained_docs(constraints, event)
+            ranked = self._rank_filtered(weights, scale, context, allowed, max_results)
+            self.search_stats['documents_scored'] += len(ranked)
+            if event is not None:
+                event.lap('score')
+        elif self.matrix_backend is not None:
+            ranked = self.matrix_backend.search(weights, scale, context, max_results)
+            self.search_stats['documents_scored'] += len(ranked)
+            if event is not None:
+                event.lap('score')
+        elif max_results:
+            ranked = self._top_k(weights, scale, context, max_results, event)
+        else:
+            accumulators = self._accumulate(weights, context)
+            if event is not None:
+                event.lap('candidates')
+            finish = self.scoring.finish
+            norms = self.norms
+            ranked = []
+            for doc_id, partial in accumulators.items():
+                relation = finish(partial, norms[doc_id], scale)
+                if relation != 0:
+                    ranked.append((relation, doc_id))
+            if event is not None:
+                event.lap('score')
+            ranked.sort(reverse=True)
+            self.search_stats['documents_scored'] += len(ranked)
+            if event is not None:
+                event.lap('sort')
+        
+        if cache is not None:
+            cache.put(key, self.version, ranked)
+            if event is not None:
+                event.lap('cache')
+        return ranked
+    
+    def _matches(self, ranked, event=None):
+        matches = [self._match(relation, doc_id) for relation, doc_id in ranked]
+        if event is not None:
+            event.lap('fetch')
+        return matches
+    
+    def build_dense_index(self, dimensions=128, lists=None, subvectors=16, probes=8, rerank=64,
+                          features=1 << 15, seed=0):
+        """Embed the indexed documents for dense_search() and hybrid_search(), returning the DenseIndex.
+        
+        The embeddings are learnt from the documents indexed now; documents
+        indexed later are embedded with the same projection, so rebuild
+        after the collection has changed a lot. lists, subvectors, probes
+        and rerank are IVFPQIndex's recall and latency settings. A saved
+        DenseIndex can be assigned to engine.dense instead.
+        """
+        self.dense = DenseIndex.build(self.index.items(), dimensions, lists, subvectors, probes, rerank,
+                                      features, seed)
+        return self.dense
+    
+    def dense_search(self, query, max_results=10, probes=None, rerank=None):
+        """Documents whose embeddings are nearest the query's, as (similarity, doc_id, content, doc_data).
+        
+        Finds documents sharing no terms with the query. probes and rerank
+        override the dense index's defaults for this query.
+        """
+        if self.instrumentation is None:
+            return self._matches(self._dense_rank(query, max_results, probes, rerank))
+        event, before = self._begin('dense_search', query)
+        try:
+            return self._matches(self._dense_rank(query, max_results, probes, rerank, event), event)
+        finally:
+            self._end(event, before)
+    
+    def _dense_rank(self, query, max_results, probes=None, rerank=None, event=None):
+        if self.dense is None:
+            raise ValueError('No dense index, call build_dense_index() first')
+        concordance, _ = self._analyze_query(query, event)
+        ranked = self.dense.search(concordance, max_results or len(self.dense), probes, rerank)
+        if event is not None:
+            event.lap('ann')
+        return ranked
+    
+    def hybrid_search(self, query, max_results=10, candidates=100, rrf_k=60, probes=None, rerank=None):
+        """Fuse the term ranking and the dense ranking of query, as (score, doc_id, content, doc_data).
+        
+        The best `candidates` of each ranking are combined by reciprocal
+        rank fusion: a document ranked r-th gains 1 / (rrf_k + r) from each
+        ranking, so documents both agree on come first without either
+        score scale dominating.
+        """
+        if self.instrumentation is None:
+            return self._matches(self._hybrid_rank(query, max_results, candidates, rrf_k, probes, rerank))
+        event, before = self._begin('hybrid_search', query)
+        try:
+            ranked = self._hybrid_rank(query, max_results, candidates, rrf_k, probes, rerank, event)
+            return self._matches(ranked, event)
+        finally:
+            self._end(event, before)
+    
+    def _hybrid_rank(self, query, max_results, candidates, rrf_k, probes, rerank, event=None):
+        rankings = [
+            self._rank(query, candidates, None, event),
+            self._dense_rank(query, candidates, probes, rerank, event)
+        ]
+        fused = reciprocal_rank_fusion(rankings, rrf_k)[:max_results]
+        if event is not None:
+            event.lap('fuse')
+        return fused
+    
+    def search_batch(self, queries, max_results=None, collection_stats=None):
+        """Search many queries at once, returning one result list per query.
+        
+        Each distinct word of the batch is stemmed once, identical queries
+        are scored once, and each posting list is traversed once for all the
+        queries using its term (one sparse matrix product on the sparse
+        backend). Queries found in the result cache aren't scored at all.
+        """
+        if self.instrumentation is None:
+            return self._search_batch(queries, max_results, collection_stats)
+        event, before = self._begin('search_batch', len(queries))
+        try:
+            return self._search_batch(queries, max_results, collection_stats, event)
+        finally:
+            self._end(event, before)
+    
+    def _search_batch(self, queries, max_results, collection_stats, event=None):
+        analyzer = self._batch_analyzer()
+        analysed = [self._analyze_query(query, event, analyzer) for query in queries]
+        keys = [(_query_key(concordance), constraints) for concordance, constraints in analysed]
+        unique = {key: concordance for key, (concordance, _) in zip(keys, analysed)}
+        self.search_stats['queries'] += len(queries)
+        
+        results = {}
+        cache = self.result_cache if collection_stats is None else None
+        if cache is not None:
+            for key in unique:
+                ranked = cache.get((key, max_results or None), self.version)
+                if ranked is not None:
+                    results[key] = ranked
+            if event is not None:
+                event.lap('cache')
+                event.count('result_cache_hits', len(results))
+        missing = [key for key in unique if key not in results]
+        
+        if missing:
+            stats = collection_stats
+            if stats is None and self.scoring.uses_statistics:
+                stats = self.term_statistics({word for key in missing for word, _ in key[0]})
+            context = self.scoring.context(stats)
+            batch = [self.scoring.query_weights(unique[key], stats) for key in missing]
+            if event is not None:
+                event.lap('weights')
+            
+            # Queries with phrase or NEAR constraints are scored on their own
+            ranked_lists = [None] * len(missing)
+            free = []
+            for i, (key, (term_weights, scale)) in enumerate(zip(missing, batch)):
+                if key[1]:
+                    allowed = self._constrained_docs(key[1], event)
+                    ranked_lists[i] = self._rank_filtered(term_weights, scale, context, allowed, max_results)
+                else:
+                    free.append(i)
+            if free:
+                weights = [batch[i][0] for i in free]
+                scales = [batch[i][1] for i in free]
+                if self.matrix_backend is not None:
+                    free_lists = self.matrix_backend.search_batch(weights, scales, context, max_results)
                 else:
-                    content = doc_data
-                matches.append((relation, doc_id, content, doc_data))
+                    free_lists = self._score_batch(weights, scales, context, max_results)
+                for i, ranked in zip(free, free_lists):
+                    ranked_lists[i] = ranked
+            if event is not None:
+                event.lap('score')
+            for key, ranked in zip(missing, ranked_lists):
+                self.search_stats['documents_scored'] += len(ranked)
+                results[key] = ranked
+                if cache is not None:
+                    cache.put((key, max_results or None), self.version, ranked)
+        
+        matches = [
+            [self._match(relation, doc_id) for relation, doc_id in results[key]]
+            for key in keys
+        ]
+        if event is not None:
+            event.lap('fetch')
+        return matches
+    
+    def _score_batch(self, batch, scales, context, max_results):
+        term_queries = {}
+        for position, weights in enumerate(batch):
+            for word, weight in weights.items():
+                term_queries.setdefault(word, []).append((position, weight))
+        
+        accumulators = [{} for _ in batch]
+        for word, users in term_queries.items():
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+            self.search_stats['postings_read'] += len(postings)
+            users = [(accumulators[position], weight) for position, weight in users]
+            for doc_id, value in self.scoring.values(postings, self.norms, context).items():
+                for accumulator, weight in users:
+                    accumulator[doc_id] = accumulator.get(doc_id, 0) + weight * value
         
-        matches.sort(reverse=True)
+        finish = self.scoring.finish
+        norms = self.norms
+        ranked_lists = []
+        for accumulator, scale in zip(accumulators, scales):
+            ranked = [
+                (finish(partial, norms[doc_id], scale), doc_id)
+                for doc_id, partial in accumulator.items()
+            ]
+            if max_results:
+                ranked = heapq.nlargest(max_results, ranked)
+            else:
+                ranked.sort(reverse=True)
+            ranked_lists.append(ranked)
+        return ranked_lists
+    
+    def _constrained_docs(self, constraints, event=None):
+        """Documents satisfying every phrase and NEAR constraint"""
+        terms = {word for constraint in constraints for word in constraint_terms(constraint)}
+        lists = []
+        for word in terms:
+            postings = self.postings.get(word)
+            if not postings:
+                return set()
+            lists.append(postings)
+        lists.sort(key=len)
+        self.search_stats['postings_read'] += sum(len(postings) for postings in lists)
+        candidates = [doc_id for doc_id in lists[0] if all(doc_id in postings for postings in lists[1:])]
+        if event is not None:
+            event.lap('candidates')
         
+        positions = {word: self.positions.doc_positions(word, candidates) for word in terms}
+        allowed = set()
+        for doc_id in candidates:
+            for constraint in constraints:
+                if constraint[0] == 'phrase':
+                    words = constraint[1]
+                    matched = phrase_match(
+                        [positions[word][doc_id] for word, _ in words], [offset for _, offset in words]
+                    )
+                else:
+                    _, distance, left, right = constraint
+                    matched = near_match(positions[left][doc_id], positions[right][doc_id], distance)
+                if not matched:
+                    break
+            else:
+                allowed.add(doc_id)
+        if event is not None:
+            event.lap('positions')
+        return allowed
+    
+    def _rank_filtered(self, weights, scale, context, allowed, max_results):
+        """Score only the allowed documents, probing each query term's postings"""
+        scoring = self.scoring
+        norms = self.norms
+        partials = dict.fromkeys(allowed, 0)
+        for word, weight in weights.items():
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+            for doc_id in allowed:
+                doc_count = postings.get(doc_id)
+                if doc_count:
+                    partials[doc_id] += weight * scoring.value(doc_count, norms[doc_id], context)
+        ranked = [(scoring.finish(partial, norms[doc_id], scale), doc_id) for doc_id, partial in partials.items()]
         if max_results:
-            matches = matches[:max_results]
+            return heapq.nlargest(max_results, ranked)
+        ranked.sort(reverse=True)
+        return ranked
+    
+    def _match(self, relation, doc_id):
+        doc_data = self.documents[doc_id]
+        if isinstance(doc_data, dict):
+            content = doc_data['content']
+        else:
+            content = doc_data
+        return (relation, doc_id, content, doc_data)
+    
+    def _top_k(self, weights, scale, context, k, event=None):
+        """Select the k best (relation, doc_id) pairs with MaxScore pruning.
+        
+        Query terms are visited in decreasing order of their score upper
+        bound. Once the bounds of the remaining terms add up to less than the
+        k-th best score seen so far, documents found only through those terms
+        cannot make the top k, so their postings are no longer traversed and
+        the remaining terms are only probed for already collected documents.
+        With IDF-weighted models, terms found in most documents have the
+        lowest bounds and are the first to be skipped.
+        """
+        scoring = self.scoring
+        terms = []
+        for word, weight in weights.items():
+            postings = self.postings.get(word)
+            if postings:
+                bound = scoring.bound(weight, self.max_weights[word], scale, context)
+                terms.append((bound, weight, postings))
+        terms.sort(key=lambda term: term[0], reverse=True)
+        
+        remaining = [0] * (len(terms) + 1)
+        for i in range(len(terms) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + terms[i][0]
+        
+        finish = scoring.finish
+        norms = self.norms
+        accumulators = {}
+        threshold = 0
+        essential = len(terms)
+        for i, (_, weight, postings) in enumerate(terms):
+            # The k-th best score can't exceed what the visited terms allow
+            if len(accumulators) >= k and remaining[i] < remaining[0] - remaining[i]:
+                threshold = heapq.nlargest(k, (
+                    finish(partial, norms[doc_id], scale)
+                    for doc_id, partial in accumulators.items()
+                ))[-1]
+                if _below(remaining[i], threshold):
+                    essential = i
+                    break
+            for doc_id, value in scoring.values(postings, norms, context).items():
+                accumulators[doc_id] = accumulators.get(doc_id, 0) + weight * value
+        if event is not None:
+            event.lap('candidates')
+        
+        heap = []
+        scored = pruned = 0
+        for doc_id, partial in accumulators.items():
+            norm = norms[doc_id]
+            for j in range(essential, len(terms)):
+                if _below(finish(partial, norm, scale) + remaining[j], threshold):
+                    pruned += 1
+                    break
+                _, weight, postings = terms[j]
+                doc_count = postings.get(doc_id)
+                if doc_count:
+                    partial += weight * scoring.value(doc_count, norm, context)
+            else:
+                scored += 1
+                entry = (finish(partial, norm, scale), doc_id)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k and heap[0][0] > threshold:
+                    threshold = heap[0][0]
         
-        return matches
\ No newline at end of file
+        self.search_stats['documents_scored'] += scored
+        self.search_stats['documents_pruned'] += pruned
+        self.search_stats['postings_read'] += sum(len(term[2]) for term in terms[:essential])
+        self.search_stats['postings_skipped'] += sum(len(term[2]) for term in terms[essential:])
+        if event is not None:
+            event.lap('score')
+        heap.sort(reverse=True)
+        if event is not None:
+            event.lap('sort')
+        return heap
+
+
+def _query_key(concordance):
+    """Hashable form of an analysed query, the same for any term order"""
+    return tuple(sorted(concordance.items()))
+
+
+def _make_stemmer(use_stemming, stem_cache_size):
+    if not use_stemming:
+        return None
+    if stem_cache_size:
+        return CachedStemmer(PorterStemmer(), stem_cache_size)
+    return PorterStemmer()
+
+
+_process_analyzers = {}
+
+
+def _build_partial_index(items, options, scoring):
+    """Worker process entry point: index (doc_id, content) pairs into an InvertedIndex.
+    
+    Returns the partial index and, when options ask for positions, its PositionIndex.
+    """
+    # Keep one analyzer per worker process so its stem cache survives across chunks
+    analyzer = _process_analyzers.get(options)
+    if analyzer is None:
+        use_stemming, stem_cache_size, stop_words, _ = options
+        analyzer = Analyzer(_make_stemmer(use_stemming, stem_cache_size), stop_words)
+        _process_analyzers[options] = analyzer
+    partial = InvertedIndex(scoring.weight)
+    positions = PositionIndex() if options[3] else None
+    for doc_id, content in items:
+        if positions is not None:
+            concordance, term_positions = analyzer.positions(content)
+            positions.add(doc_id, term_positions)
+        else:
+            concordance = analyzer.concordance(content)
+        partial.add(doc_id, concordance, scoring.norm(concordance))
+    return partial, positions
+
+
+def _below(bound, threshold):
+    """True when a score upper bound is strictly below threshold.
+    
+    The bound is widened slightly so that floating point rounding can never
+    prune a document whose exact score ties the threshold.
+    """
+    return bound * (1 + 1e-9) < threshold